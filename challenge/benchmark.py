@@ -0,0 +1,128 @@
+import io
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from contextlib import redirect_stdout
+from challenge import geoip, mockserver, planner, rdap, runner, warehouse
+
+
+def generate_ips(num_ips, seed=0):
+    """
+    Generate distinct public IPs, the same ones for the same seed.
+    :param num_ips:
+    :param seed:
+    :return: list of IPs
+    """
+    rng = random.Random(seed)
+    ips = set()
+
+    while len(ips) < num_ips:
+        ip = '.'.join(str(rng.randint(0, 255)) for _ in range(4))
+        if not planner.is_bogon(ip):
+            ips.add(ip)
+
+    return sorted(ips)
+
+
+def run(engine, ip_path, data_path, runner_args=()):
+    """
+    Run Challenge.read_data end to end on an IP file, with its output suppressed.
+    :param engine: 'pool' or 'async'
+    :param ip_path: path of the IP file
+    :param data_path: directory for the warehouse
+    :param runner_args: more arguments for the runner
+    :return: tuple of the seconds taken and the progress of the lookups
+    """
+    challenge = runner.Challenge([str(ip_path), '--engine', engine, '--no-plan'] + list(runner_args))
+    challenge.warehouse = warehouse.Warehouse(data_path)
+
+    started = time.monotonic()
+    with redirect_stdout(io.StringIO()):
+        run_progress = challenge.read_data(str(ip_path))
+
+    return time.monotonic() - started, run_progress
+
+
+def benchmark(engines, num_ips, server, runner_args=()):
+    """
+    Benchmark enrichment engines against a mock server.
+    Each engine starts from an empty warehouse.
+    :param engines: list of engine names
+    :param num_ips: number of IPs to look up
+    :param server: the running mockserver.MockServer
+    :param runner_args: more arguments for the runner (e.g. ['--concurrency', '8'])
+    :return: list of dictionaries of results, one per engine; `stored` is the number of IPs whose GeoIP data made it
+    into the warehouse, which is less than `ips` if lookups failed
+    """
+    urls = geoip.GEO_IP_URL, rdap.RDAP_URL
+    geoip.GEO_IP_URL = server.geoip_url()
+    rdap.RDAP_URL = server.rdap_url()
+
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            ip_path = Path(temp_dir) / 'ips.txt'
+            ip_path.write_text('\n'.join(generate_ips(num_ips)) + '\n')
+
+            for engine in engines:
+                requests = server.requests
+                data_path = Path(temp_dir) / engine
+                seconds, run_progress = run(engine, ip_path, data_path, runner_args)
+
+                result = {
+                    'engine': engine,
+                    'ips': run_progress.done,
+                    'stored': sum(1 for _ in warehouse.Warehouse(data_path).read('geoip')),
+                    'seconds': seconds,
+                    'ips_per_second': run_progress.done / seconds if seconds else 0.0,
+                    'requests': server.requests - requests
+                }
+
+                for name in ('geoip', 'rdap'):
+                    latencies = run_progress.latency_percentiles(name, (50, 99))
+                    result[f'{name}_p50'] = latencies[50]
+                    result[f'{name}_p99'] = latencies[99]
+
+                results.append(result)
+    finally:
+        geoip.GEO_IP_URL, rdap.RDAP_URL = urls
+
+    return results
+
+
+def _ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.0f}ms'
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark the enrichment engines end to end against a local mock '
+                                                 'GeoIP/RDAP server')
+    parser.add_argument('--engines', type=lambda s: s.split(','), default=['pool', 'async'],
+                        help='comma-separated engines to benchmark (default: pool,async)')
+    parser.add_argument('--ips', type=int, default=2000, help='number of IPs to look up (default: 2000)')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server delays each response by')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random variation of the latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests the server fails')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per second the server allows')
+    args, runner_args = parser.parse_known_args(args)
+
+    with mockserver.MockServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               rate_limit=args.rate_limit) as server:
+        results = benchmark(args.engines, args.ips, server, runner_args)
+
+    print(f'{"engine":<8}{"IPs":>8}{"stored":>8}{"seconds":>10}{"IPs/s":>10}{"requests":>10}'
+          f'{"geoip p50":>11}{"geoip p99":>11}{"rdap p50":>11}{"rdap p99":>11}')
+
+    for result in results:
+        print(f'{result["engine"]:<8}{result["ips"]:>8}{result["stored"]:>8}{result["seconds"]:>10.2f}'
+              f'{result["ips_per_second"]:>10.1f}{result["requests"]:>10}'
+              f'{_ms(result["geoip_p50"]):>11}{_ms(result["geoip_p99"]):>11}'
+              f'{_ms(result["rdap_p50"]):>11}{_ms(result["rdap_p99"]):>11}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+EVICT_CHECK_INTERVAL = 100
+
+
+class CachedResponse:
+    """
+    A response served from the cache; has the parts of requests.Response that lookups use.
+    """
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses, stored in SQLite and keyed by URL.
+    Entries expire after `ttl` seconds. When the cache grows past `max_size` bytes, the least recently used entries
+    are evicted; the size is checked every EVICT_CHECK_INTERVAL writes. Hits and misses are counted per process.
+    Can be shared by threads and pickled to other processes; each process opens its own connection.
+    """
+    def __init__(self, path, ttl=7 * 24 * 60 * 60, max_size=512 * 1024 * 1024):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Get this process's connection, creating the database if needed.
+        :return: the connection
+        """
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses '
+                               '(key TEXT PRIMARY KEY, status INTEGER, body TEXT, stored REAL, accessed REAL, '
+                               'size INTEGER)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """
+        Get a response from the cache.
+        :param key: the URL
+        :return: the response, or None if it is not cached or has expired
+        """
+        now = time.time()
+
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT status, body, stored FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is None or row[2] + self.ttl < now:
+                if row is not None:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+
+            conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+
+        return CachedResponse(row[0], row[1])
+
+    def put(self, key, status, body):
+        """
+        Store a response, evicting the least recently used responses if the cache is too big.
+        :param key: the URL
+        :param status: HTTP status code
+        :param body: response body
+        :return: None
+        """
+        now = time.time()
+        size = len(key) + len(body)
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, status, body, now, now, size))
+
+            self._writes += 1
+            if self._writes % EVICT_CHECK_INTERVAL == 0:
+                self._evict(conn)
+
+    def evict(self):
+        """
+        Delete the least recently used responses until the cache is within its size.
+        :return: None
+        """
+        with self._lock:
+            self._evict(self._connect())
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        excess = total - self.max_size
+
+        if excess <= 0:
+            return
+
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+
+    def stats(self):
+        """
+        :return: dictionary of hits, misses and the hit ratio for this process
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'ratio': self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        """
+        Close this process's connection.
+        :return: None
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,544 @@
+import os
+import signal
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from functools import partial
+from challenge import geoip, journal, rdap, upstream, util
+
+INDICES = ('geoip', 'rdap', 'ip_rdap')
+
+# RDAP lookups in flight are shared by IPs in the same block of this size (see retrieve_ip_data)
+COALESCE_PREFIX_LENGTH = 24
+
+
+# GeoIP data of an IP that was copied from another IP in the same prefix (see Enricher) names that IP in this field
+INFERRED_FIELD = 'inferred_from'
+
+# GeoIP data of an IP that was looked up and not found, as opposed to None for not looked up (see retrieve_ip_data)
+NOT_FOUND = {}
+
+# maximum number of prefixes whose GeoIP data an enricher keeps (see Enricher)
+GEOIP_PREFIX_CACHE_SIZE = 100000
+
+
+def _network_key(ip, prefix_length=COALESCE_PREFIX_LENGTH):
+    """
+    :param ip:
+    :param prefix_length:
+    :return: the block of `prefix_length` bits the IP is in, or the IP itself if it is not a valid IPv4 address
+    """
+    try:
+        return util.ip_to_int(ip) >> (32 - prefix_length)
+    except Exception:
+        return ip
+
+
+def _infer_geoip(data, ip):
+    """
+    :param data: GeoIP data of another IP
+    :param ip:
+    :return: a copy of the data for the IP, marked as inferred from the other IP
+    """
+    inferred = dict(data)
+    inferred['ip'] = ip
+    inferred[INFERRED_FIELD] = data['ip']
+    return inferred
+
+
+def _fetch_rdap(ip, rdap_upstream, networks, entities, bootstrap):
+    rdap_info = rdap.get(ip, upstream=rdap_upstream, entities=entities, bootstrap=bootstrap)
+
+    if rdap_info and networks is not None:
+        networks.add(rdap_info)
+
+    return rdap_info
+
+
+def retrieve_ip_data(ip, geoip_upstream=None, rdap_upstream=None, networks=None, geoip_data=None, entities=None,
+                     flights=None, bootstrap=None, geoip_database=None):
+    """
+    Retrieve GeoIP and RDAP data for an IP.
+    :param ip:
+    :param geoip_upstream: optional upstream to make GeoIP requests with
+    :param rdap_upstream: optional upstream to make RDAP requests with
+    :param networks: optional rdap.NetworkCache; if a known network contains the IP, its ip_rdap rows are produced
+    without an RDAP request (its rdap rows are already known), and networks that are looked up are added to it
+    :param geoip_data: GeoIP data for the IP if it has already been retrieved (e.g. in a batch), or NOT_FOUND if it
+    was looked up and not found; retrieved if not set
+    :param entities: optional rdap.EntityCache to reuse RDAP entities that have already been parsed
+    :param flights: optional upstream.SingleFlight shared by threads; if an RDAP lookup for an IP in the same /24 is
+    in flight, it is waited for, and if its network contains the IP, its ip_rdap rows are produced without another
+    request (its rdap rows come with the other IP's result)
+    :param bootstrap: optional rdap.Bootstrap to send RDAP queries straight to the registry responsible for the IP
+    :param geoip_database: optional geodb.GeoDatabase to look up GeoIP data in instead of making requests
+    :return: dictionary of the IP, its data for each index and the errors of lookups that failed (e.g. an upstream
+    that kept throttling); failed lookups produce no data, so the IP is looked up again on the next run
+    """
+    result = {
+        'ip': ip,
+        'geoip': None,
+        'rdap': [],
+        'ip_rdap': [],
+        'errors': []
+    }
+
+    geo_ip_info = geoip_data
+    if geo_ip_info is None:
+        try:
+            geo_ip_info = geoip.get(ip, upstream=geoip_upstream, database=geoip_database)
+        except upstream.UpstreamError as e:
+            result['errors'].append(str(e))
+
+    if geo_ip_info:
+        result['geoip'] = geo_ip_info
+
+    if networks is not None:
+        handles = networks.lookup(ip)
+        if handles is not None:
+            result['ip_rdap'] = [{'ip': ip, 'handle': handle} for handle in handles]
+            return result
+
+    fetch = partial(_fetch_rdap, ip, rdap_upstream, networks, entities, bootstrap)
+
+    try:
+        if flights is None:
+            rdap_info, shared = fetch(), False
+        else:
+            rdap_info, shared = flights.do(_network_key(ip), fetch)
+            if shared and not rdap.contains(rdap_info, ip):
+                rdap_info, shared = fetch(), False
+    except upstream.UpstreamError as e:
+        result['errors'].append(str(e))
+        return result
+
+    if rdap_info:
+        for datum in rdap_info:
+            if 'handle' not in datum:
+                continue
+
+            if not shared:
+                result['rdap'].append(datum)
+            result['ip_rdap'].append({'ip': ip, 'handle': datum['handle']})
+
+    return result
+
+
+def _batched(items, size):
+    """
+    Group items into lists.
+    :param items: iterable of items
+    :param size: maximum size of each list
+    :return: generator of lists
+    """
+    batch = []
+
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class Enricher:
+    """
+    Retrieves data for IPs, holding what lookups share: upstream connections, the RDAP network cache, etc.
+    IPs are retrieved in batches of `batch_size`; GeoIP data for a batch is retrieved with one bulk request
+    (see geoip.get_many), and RDAP data per IP. Threads sharing an enricher share RDAP lookups for IPs in the same
+    network that are in flight at the same time.
+    With a `geoip_database` (see geodb.GeoDatabase), GeoIP data is looked up locally instead, without batching.
+
+    With a `geoip_prefix_length`, GeoIP data is only retrieved for one IP per prefix of that length (e.g. 24 for a
+    /24), as ipstack says practically the same about every IP in a block. The other IPs in the prefix get a copy with
+    their own `ip` and the IP it was copied from in INFERRED_FIELD. Up to GEOIP_PREFIX_CACHE_SIZE prefixes are kept.
+    """
+    def __init__(self, geoip_upstream=None, rdap_upstream=None, networks=None, batch_size=1, geoip_fields=None,
+                 entities=None, bootstrap=None, geoip_database=None, geoip_prefix_length=None):
+        if geoip_prefix_length is not None and not 1 <= geoip_prefix_length <= 32:
+            raise Exception(f'Prefix length must be between 1 and 32. Prefix length: {geoip_prefix_length}')
+
+        self.geoip_upstream = geoip_upstream
+        self.geoip_database = geoip_database
+        self.geoip_prefix_length = geoip_prefix_length
+        self.geoip_prefixes = {}
+        self.rdap_upstream = rdap_upstream
+        self.networks = networks
+        self.entities = entities
+        self.flights = upstream.SingleFlight()
+        self.bootstrap = bootstrap
+        self.batch_size = batch_size
+        self.geoip_fields = geoip_fields
+
+    def batches(self, ips):
+        """
+        Group IPs into batches to retrieve.
+        :param ips: iterable of IPs
+        :return: generator of lists of IPs
+        """
+        return _batched(ips, self.batch_size)
+
+    def retrieve(self, ips):
+        """
+        Retrieve GeoIP and RDAP data for a batch of IPs.
+        :param ips: list of IPs
+        :return: list of dictionaries of an IP and its data for each index
+        """
+        geoip_data = {}
+        if self.geoip_prefix_length is not None and self.geoip_database is None:
+            geoip_data = self._retrieve_geoip_by_prefix(ips)
+        elif self.geoip_database is None and (len(ips) > 1 or self.geoip_fields):
+            geoip_data = self._retrieve_geoip_batch(ips)
+
+        return [retrieve_ip_data(ip, self.geoip_upstream, self.rdap_upstream, self.networks, geoip_data.get(ip),
+                                 self.entities, self.flights, self.bootstrap, self.geoip_database)
+                for ip in ips]
+
+    def _retrieve_geoip_batch(self, ips):
+        """
+        :param ips: list of IPs
+        :return: dictionary of IPs and their GeoIP data, NOT_FOUND for IPs that were not found (so they are not looked
+        up again on their own); empty if the bulk lookup failed
+        """
+        try:
+            batch_data = geoip.get_many(ips, self.batch_size, self.geoip_fields, upstream=self.geoip_upstream)
+        except upstream.UpstreamError:
+            # fall back to looking up each IP; if the upstream is down its circuit breaker refuses them quickly
+            return {}
+
+        return {ip: data or NOT_FOUND for ip, data in batch_data.items()}
+
+    def _retrieve_geoip_by_prefix(self, ips):
+        """
+        Retrieve GeoIP data for one IP per prefix, in bulk if batching, and infer the rest.
+        Threads sharing the enricher share lookups for the same prefix that are in flight at the same time.
+        :param ips: list of IPs
+        :return: dictionary of IPs and their GeoIP data, NOT_FOUND for IPs whose prefix was not found; IPs whose prefix
+        could not be looked up are left out, so they are looked up on their own
+        """
+        if len(ips) > 1 or self.geoip_fields:
+            representatives = {}
+            for ip in ips:
+                key = _network_key(ip, self.geoip_prefix_length)
+                if key not in self.geoip_prefixes:
+                    representatives.setdefault(key, ip)
+
+            if representatives:
+                batch_data = self._retrieve_geoip_batch(list(representatives.values()))
+                for key, ip in representatives.items():
+                    if ip in batch_data:
+                        self._remember_prefix(key, batch_data[ip])
+
+        geoip_data = {}
+
+        for ip in ips:
+            key = _network_key(ip, self.geoip_prefix_length)
+
+            try:
+                data, _ = self.flights.do(('geoip', key), partial(self._retrieve_geoip_for_prefix, key, ip))
+            except upstream.UpstreamError:
+                continue
+
+            if not data:
+                geoip_data[ip] = NOT_FOUND
+            else:
+                geoip_data[ip] = data if data['ip'] == ip else _infer_geoip(data, ip)
+
+        return geoip_data
+
+    def _retrieve_geoip_for_prefix(self, key, ip):
+        data = self.geoip_prefixes.get(key)
+
+        if data is None:
+            # a prefix that was not found is remembered as such too, so its other IPs are not looked up
+            data = geoip.get(ip, upstream=self.geoip_upstream) or NOT_FOUND
+            self._remember_prefix(key, data)
+
+        return data
+
+    def _remember_prefix(self, key, data):
+        if len(self.geoip_prefixes) >= GEOIP_PREFIX_CACHE_SIZE:
+            self.geoip_prefixes.clear()
+
+        self.geoip_prefixes[key] = data
+
+    def retrieve_with_samples(self, ips):
+        """
+        Retrieve data for a batch of IPs, along with the request samples of the upstreams (see
+        upstream.Upstream.drain_samples) for reporting progress.
+        When the enricher is shared by threads, the samples may include requests made for other batches.
+        :param ips: list of IPs
+        :return: tuple of the list of results and a dictionary of upstream names and their samples
+        """
+        results = self.retrieve(ips)
+
+        samples = {}
+        for up in (self.geoip_upstream, self.rdap_upstream):
+            if up is not None:
+                samples[up.name] = up.drain_samples()
+
+        return results, samples
+
+    def close(self):
+        """
+        Close upstream connections.
+        :return: None
+        """
+        for up in (self.geoip_upstream, self.rdap_upstream):
+            if up is not None:
+                up.close()
+
+
+_worker_enricher = None
+_worker_spill = None
+
+
+def _init_worker(enricher, spill_dir=None):
+    """
+    Pool initializer; gives each worker process its own copy of the enricher, which lives as long as the process, and
+    its own spill segment if results are spilled.
+    :param enricher:
+    :param spill_dir: optional directory for spill segments (see PoolEngine)
+    :return: None
+    """
+    global _worker_enricher, _worker_spill
+    _worker_enricher = enricher
+
+    if spill_dir is not None:
+        _worker_spill = journal.Journal(os.path.join(spill_dir, f'{os.getpid()}.ndjson'))
+
+
+def _retrieve_in_worker(ips):
+    results, samples = _worker_enricher.retrieve_with_samples(ips)
+
+    if _worker_spill is not None:
+        results = [_spill(result) for result in results]
+
+    return results, samples
+
+
+def _spill(result):
+    """
+    Append a successful result to the worker's spill segment.
+    :param result:
+    :return: a receipt for the result, or the result itself if any of its lookups failed
+    """
+    if result['errors']:
+        return result
+
+    _worker_spill.append(result)
+    return {'ip': result['ip'], 'errors': [], 'spilled': True}
+
+
+def spill_segments(spill_dir):
+    """
+    :param spill_dir: directory of spill segments (see PoolEngine)
+    :return: list of journal.Journal, one per segment
+    """
+    if not os.path.isdir(spill_dir):
+        return []
+
+    return [journal.Journal(os.path.join(spill_dir, name)) for name in sorted(os.listdir(spill_dir))
+            if name.endswith('.ndjson')]
+
+
+class PoolEngine:
+    """
+    Retrieves data for IPs on a pool of processes, one lookup in flight per process.
+    Each process has its own copy of the enricher, so anything it learns (e.g. RDAP networks) is not shared.
+
+    With a `spill_dir`, workers do not send successful results back, which means pickling every GeoIP record and RDAP
+    entity and holding them in the parent. Each worker appends them to its own NDJSON segment in the directory (see
+    journal.Journal) and sends back a small receipt instead: {'ip': ..., 'errors': [], 'spilled': True}. Results
+    whose lookups failed are still sent back. The segments are merged afterwards (see spill_segments).
+    """
+    def __init__(self, enricher=None, processes=4, spill_dir=None):
+        self.enricher = enricher or Enricher()
+        self.processes = processes
+        self.spill_dir = spill_dir
+
+    def run(self, ips, progress=None):
+        """
+        Retrieve data for IPs, producing results as they complete (not in the order of the IPs).
+        :param ips: iterable of IPs
+        :param progress: optional progress.Progress to update as results arrive
+        :return: generator of results
+        """
+        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        pool = Pool(self.processes, initializer=_init_worker, initargs=(self.enricher, self.spill_dir))
+
+        signal.signal(signal.SIGINT, original_sigint_handler)
+
+        try:
+            for results, samples in pool.imap_unordered(_retrieve_in_worker, self.enricher.batches(ips)):
+                if progress is not None:
+                    progress.update(len(results), samples)
+                yield from results
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
+
+class AsyncEngine:
+    """
+    Retrieves data for IPs from a single process with asyncio, keeping up to `concurrency` batches in flight.
+    Each upstream host should get a persistent connection pool (see upstream.Upstream) at least `concurrency` in size.
+    requests is blocking, so the requests themselves run on a thread pool of the same size; the event loop schedules
+    them and enforces the limit.
+    Results are handed over through a queue of at most `concurrency` batches, so a slow consumer holds back new lookups
+    rather than letting results pile up in memory.
+    """
+    def __init__(self, enricher=None, concurrency=100):
+        self.enricher = enricher or Enricher()
+        self.concurrency = concurrency
+
+    def run(self, ips, progress=None):
+        """
+        Retrieve data for IPs, producing results as they complete (not in the order of the IPs).
+        :param ips: iterable of IPs
+        :param progress: optional progress.Progress to update as results arrive
+        :return: generator of results
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(self.concurrency)
+
+        try:
+            queue = loop.run_until_complete(self._new_queue())
+            loop.create_task(self._dispatch(ips, queue, executor))
+
+            while True:
+                item = loop.run_until_complete(queue.get())
+
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                results, samples = item
+                if progress is not None:
+                    progress.update(len(results), samples)
+                yield from results
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            executor.shutdown(wait=False)
+            loop.close()
+
+    async def _new_queue(self):
+        # created on the loop that uses it (before Python 3.10 a queue binds to the current loop when created)
+        return asyncio.Queue(self.concurrency)
+
+    async def _dispatch(self, ips, queue, executor):
+        """
+        Retrieve batches, up to `concurrency` at a time, putting the results and samples of each on the queue, then
+        None once all are done. If a batch fails, or the IPs cannot be produced (e.g. the file they are read from
+        cannot be decoded), the exception is put on the queue instead.
+        """
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def retrieve(batch):
+            try:
+                item = await loop.run_in_executor(executor, self.enricher.retrieve_with_samples, batch)
+            except Exception as e:
+                item = e
+
+            try:
+                await queue.put(item)
+            finally:
+                semaphore.release()
+
+        batches = self.enricher.batches(ips)
+
+        while True:
+            await semaphore.acquire()
+
+            # the IPs can be produced by a slow stage (e.g. a file still being read), which must not block the loop;
+            # a thread is free, as at most `concurrency` - 1 batches are in flight
+            try:
+                batch = await loop.run_in_executor(executor, next, batches, None)
+            except Exception as e:
+                semaphore.release()
+                await queue.put(e)
+                return
+
+            if batch is None:
+                semaphore.release()
+                break
+
+            asyncio.ensure_future(retrieve(batch))
+
+        # every batch releases the semaphore once its results are queued
+        for _ in range(self.concurrency):
+            await semaphore.acquire()
+
+        await queue.put(None)
+
+
+DEFAULT_CONCURRENCY = {
+    'pool': 4,
+    'async': 100
+}
+
+
+def create_engine(name, concurrency=None, networks=None, cache=None, batch_size=1, geoip_fields=None, retries=3,
+                  geoip_rate=None, rdap_rate=None, bootstrap=None, spill_dir=None, geoip_database=None,
+                  geoip_prefix_length=None):
+    """
+    Create an enrichment engine, with an upstream per API host.
+    :param name: 'pool' or 'async'
+    :param concurrency: number of lookups to keep in flight; defaults to the engine's own default
+    :param networks: optional rdap.NetworkCache to resolve IPs in known networks with
+    :param cache: optional cache.ResponseCache for the upstreams to consult before going to the network
+    :param batch_size: number of IPs per GeoIP request
+    :param geoip_fields: optional list of GeoIP fields to ask for
+    :param retries: number of times to retry a throttled or failed request
+    :param geoip_rate: optional maximum GeoIP requests per second (per process for the pool engine)
+    :param rdap_rate: optional maximum RDAP requests per second to each registry (per process for the pool engine)
+    :param bootstrap: optional rdap.Bootstrap to send RDAP queries straight to the registry responsible for each IP
+    :param spill_dir: optional directory for the pool engine's workers to spill results to (see PoolEngine)
+    :param geoip_database: optional geodb.GeoDatabase to look up GeoIP data in, instead of ipstack
+    :param geoip_prefix_length: optional prefix length to retrieve GeoIP data for one IP per prefix of (see Enricher)
+    :return: the engine
+    """
+    if name not in DEFAULT_CONCURRENCY:
+        raise Exception(f'Unknown engine: {name}')
+
+    if concurrency is None:
+        concurrency = DEFAULT_CONCURRENCY[name]
+
+    geoip_upstream = None
+    if geoip_database is None:
+        geoip_upstream = upstream.Upstream('geoip', pool_size=concurrency, cache=cache, rate=geoip_rate,
+                                           retries=retries, cacheable=geoip.is_cacheable)
+
+    enricher = Enricher(
+        geoip_upstream=geoip_upstream,
+        rdap_upstream=upstream.UpstreamGroup('rdap', pool_size=concurrency, cache=cache, rate=rdap_rate,
+                                             retries=retries),
+        networks=networks,
+        batch_size=batch_size,
+        geoip_fields=geoip_fields,
+        entities=rdap.EntityCache(),
+        bootstrap=bootstrap,
+        geoip_database=geoip_database,
+        geoip_prefix_length=geoip_prefix_length
+    )
+
+    if name == 'pool':
+        return PoolEngine(enricher, concurrency, spill_dir)
+
+    return AsyncEngine(enricher, concurrency)
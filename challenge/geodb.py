@@ -0,0 +1,144 @@
+import csv
+import sys
+import gzip
+from array import array
+from bisect import bisect_right
+from challenge import util
+
+# column order of headerless files, which is that of DB-IP's free "IP to City Lite" CSV
+DEFAULT_COLUMNS = ('start_ip', 'end_ip', 'continent_code', 'country_code', 'region_name', 'city', 'latitude',
+                   'longitude')
+
+NUMERIC_COLUMNS = ('latitude', 'longitude')
+
+
+def _to_int(value):
+    """
+    :param value: a dotted IPv4 address or an int
+    :return: the address as an int
+    """
+    return int(value) if value.isdigit() else util.ip_to_int(value)
+
+
+class GeoDatabase:
+    """
+    Local GeoIP database of IPv4 ranges, for looking up GeoIP data without going to ipstack (see geoip.get).
+    The ranges are kept in sorted arrays of ints, so a lookup is a binary search, and their fields in tuples of
+    interned strings, as the same countries and cities repeat across many ranges.
+    """
+    def __init__(self, columns, starts, ends, records):
+        """
+        :param columns: names of the fields of each record
+        :param starts: array of the first address of each range, sorted
+        :param ends: array of the last address of each range
+        :param records: list of tuples of the fields of each range
+        """
+        self.columns = columns
+        self.starts = starts
+        self.ends = ends
+        self.records = records
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a CSV file of IPv4 ranges (gzip compressed if its name ends with .gz).
+        The file has a header naming its columns, of which `start_ip` and `end_ip` are required and the rest (e.g.
+        country_code, country_name, region_name, city, latitude, longitude) become the fields of the GeoIP data; a file
+        without a header is read as having DEFAULT_COLUMNS. Addresses can be dotted or ints. Rows that are not IPv4
+        (e.g. IPv6 ranges in the same file) are skipped.
+        :param path:
+        :return: the database
+        """
+        opener = gzip.open if str(path).endswith('.gz') else open
+
+        with opener(path, 'rt', newline='') as file:
+            rows = csv.reader(file)
+            first = next(rows, None)
+
+            if first is None:
+                raise Exception(f'GeoIP database is empty: {path}')
+
+            try:
+                _to_int(first[0])
+                columns = DEFAULT_COLUMNS
+                rows = _chain(first, rows)
+            except Exception:
+                columns = tuple(first)
+
+            if 'start_ip' not in columns or 'end_ip' not in columns:
+                raise Exception(f'GeoIP database has no start_ip and end_ip columns: {path}')
+
+            return cls.from_rows(columns, rows)
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """
+        :param columns: names of the columns
+        :param rows: iterable of lists of values, one per column
+        :return: the database
+        """
+        start_column = columns.index('start_ip')
+        end_column = columns.index('end_ip')
+        fields = [i for i in range(len(columns)) if i not in (start_column, end_column)]
+        numeric = {i for i in fields if columns[i] in NUMERIC_COLUMNS}
+
+        ranges = []
+
+        for row in rows:
+            try:
+                start = _to_int(row[start_column])
+                end = _to_int(row[end_column])
+            except Exception:
+                continue
+
+            record = tuple(_parse_value(row[i], i in numeric) for i in fields)
+            ranges.append((start, end, record))
+
+        ranges.sort(key=lambda r: r[0])
+
+        return cls(tuple(columns[i] for i in fields),
+                   array('L', (start for start, _, _ in ranges)),
+                   array('L', (end for _, end, _ in ranges)),
+                   [record for _, _, record in ranges])
+
+    def get(self, ip):
+        """
+        Look up an IP.
+        :param ip:
+        :return: GeoIP data shaped like ipstack's, or None if the IP is in no range
+        """
+        n = util.ip_to_int(ip)
+        i = bisect_right(self.starts, n) - 1
+
+        if i < 0 or n > self.ends[i]:
+            return None
+
+        data = {'ip': ip, 'type': 'ipv4'}
+        data.update(zip(self.columns, self.records[i]))
+        return data
+
+
+def _chain(first, rows):
+    yield first
+    yield from rows
+
+
+def _parse_value(value, numeric):
+    """
+    :param value:
+    :param numeric: whether the value is a number
+    :return: the value as a float if numeric, otherwise as an interned string (None if empty)
+    """
+    if value == '':
+        return None
+
+    if numeric:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    return sys.intern(value)
@@ -1,31 +1,129 @@
+import os
 import requests
 from copy import deepcopy
-from challenge import util
+from challenge import util, upstream as upstream_module
 
-GEO_IP_URL = 'http://api.ipstack.com/{0}?access_key=5635018d1ae4fe81a3e4ed450ed62bfe'
+# can be pointed elsewhere (e.g. at challenge.mockserver) with an environment variable of the same name
+GEO_IP_URL = os.environ.get('GEO_IP_URL', 'http://api.ipstack.com/{0}?access_key=5635018d1ae4fe81a3e4ed450ed62bfe')
 
+MAX_BATCH_SIZE = 50
 
-def get(ip, process=True):
+
+def get(ip, process=True, upstream=None, database=None):
     """
     Get GeoIP data for an IP.
     :param ip:
     :param process: whether or not to process the GeoIP data or leave it raw
+    :param upstream: optional upstream.Upstream to make the request with; a one-off request is made if not set
+    :param database: optional geodb.GeoDatabase to look the IP up in instead of making a request
     :return: GeoIP data
     """
     util.verify_ip(ip)
 
-    response = requests.get(GEO_IP_URL.format(ip))
+    if database is not None:
+        return database.get(ip)
+
+    http = requests if upstream is None else upstream
+
+    response = http.get(GEO_IP_URL.format(ip))
 
     if response.status_code == 404:
         return None
 
-    data = response.json()
+    data = upstream_module.parse_json(response)
+    _check_error(data)
+
     if process:
         data = _process_data(data)
 
     return data
 
 
+def get_many(ips, batch_size=MAX_BATCH_SIZE, fields=None, process=True, upstream=None):
+    """
+    Get GeoIP data for many IPs using ipstack's bulk lookup, which takes a comma-separated list of IPs per request.
+    :param ips:
+    :param batch_size: number of IPs per request (ipstack allows up to 50)
+    :param fields: optional list of fields to ask for (e.g. ['main']), so unwanted fields are not sent; 'ip' is always
+    included
+    :param process: whether or not to process the GeoIP data or leave it raw
+    :param upstream: optional upstream.Upstream to make the requests with; one-off requests are made if not set
+    :return: dictionary of IPs and their GeoIP data; IPs that were not found are None
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise Exception(f'Batch size must be between 1 and {MAX_BATCH_SIZE}. Batch size: {batch_size}')
+
+    ips = list(ips)
+    for ip in ips:
+        util.verify_ip(ip)
+
+    http = requests if upstream is None else upstream
+
+    fields_param = ''
+    if fields:
+        fields = list(fields)
+        if 'ip' not in fields and 'main' not in fields:
+            fields.insert(0, 'ip')
+        fields_param = '&fields=' + ','.join(fields)
+
+    results = {}
+
+    for i in range(0, len(ips), batch_size):
+        batch = ips[i:i + batch_size]
+
+        for ip in batch:
+            results[ip] = None
+
+        response = http.get(GEO_IP_URL.format(','.join(batch)) + fields_param)
+
+        if response.status_code == 404:
+            continue
+
+        data = upstream_module.parse_json(response)
+
+        if isinstance(data, dict):
+            _check_error(data)
+            data = [data]
+
+        for datum in data:
+            if process:
+                datum = _process_data(datum)
+            results[datum['ip']] = datum
+
+    return results
+
+
+def _check_error(data):
+    """
+    Raise if ipstack replied with an error (invalid access key, used up quota, rate limit, etc.), which comes as HTTP
+    200 with `{"success": false, "error": {...}}`. It is raised as an upstream.UpstreamError, like other failed
+    requests, so the IPs are reported as failed lookups and retried on the next run rather than ending the run.
+    :param data: the response data
+    :return: None
+    """
+    if isinstance(data, dict) and data.get('success') is False:
+        raise upstream_module.UpstreamError(f'GeoIP lookup failed: {data.get("error")}')
+
+
+def is_cacheable(response):
+    """
+    Check whether an ipstack response can be cached. ipstack reports errors (invalid access key, used up quota, rate
+    limit, etc.) as HTTP 200 with `{"success": false, "error": {...}}`; those are not about the IPs and must not be
+    replayed from the cache.
+    :param response:
+    :return: True if the response can be cached, False otherwise
+    """
+    if response.status_code != 200:
+        return True
+
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+
+    return not (isinstance(data, dict) and data.get('success') is False)
+
+
 def _process_data(data):
     """
     Process GeoIP data.
@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+
+class Journal:
+    """
+    Append-only journal of the IPs an enrichment run has completed and their results, one JSON object per line.
+    Each result is written through to the OS as soon as it is appended, so it survives the process being interrupted
+    or killed. A restarted run replays the journal into the warehouse and only retrieves the IPs not in it; once a run
+    completes, the journal is cleared.
+    IPs whose lookups failed should not be journaled, so that they are retried.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.completed = set()
+        self.skipped = 0
+        self._file = None
+
+    def replay(self):
+        """
+        Read the results in the journal, remembering their IPs as completed.
+        A line that was only partly written when the previous run was killed is ignored.
+        :return: generator of results
+        """
+        if not self.path.exists():
+            return
+
+        with self.path.open() as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+
+                self.completed.add(result['ip'])
+                yield result
+
+    def filter(self, ips):
+        """
+        Filter out IPs that are already completed, counting them.
+        :param ips: iterable of IPs
+        :return: generator of IPs still to retrieve
+        """
+        for ip in ips:
+            if ip in self.completed:
+                self.skipped += 1
+            else:
+                yield ip
+
+    def exclude(self, ips):
+        """
+        Filter out the IPs of a counter that are already completed, counting them.
+        :param ips: dictionary (or packed.PackedCounter) of IPs and their counts
+        :return: a counter of the same kind with the IPs still to retrieve
+        """
+        num_ips = len(ips)
+
+        if isinstance(ips, dict):
+            ips = {ip: count for ip, count in ips.items() if ip not in self.completed}
+        else:
+            ips = ips.exclude(self.completed)
+
+        self.skipped += num_ips - len(ips)
+
+        return ips
+
+    def append(self, result):
+        """
+        Record a completed result.
+        :param result: dictionary of an IP and its data for each index
+        :return: None
+        """
+        if self._file is None:
+            self._file = self.path.open('a', buffering=1)
+
+            # a partly written last line must not swallow the first new result
+            if self._file.tell() > 0:
+                with self.path.open('rb') as file:
+                    file.seek(-1, 2)
+                    if file.read(1) != b'\n':
+                        self._file.write('\n')
+
+        self._file.write(json.dumps(result) + '\n')
+
+    def close(self):
+        """
+        Close the journal, keeping it for the next run.
+        :return: None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """
+        Close and delete the journal, once its results are all safely in the warehouse.
+        :return: None
+        """
+        self.close()
+
+        if self.path.exists():
+            self.path.unlink()
+
+        self.completed = set()
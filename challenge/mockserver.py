@@ -0,0 +1,313 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from challenge import planner
+
+COUNTRIES = [
+    ('US', 'United States', 'NA', 'North America', ['New York', 'Chicago', 'Seattle', 'Austin']),
+    ('DE', 'Germany', 'EU', 'Europe', ['Berlin', 'Frankfurt', 'Munich']),
+    ('JP', 'Japan', 'AS', 'Asia', ['Tokyo', 'Osaka']),
+    ('BR', 'Brazil', 'SA', 'South America', ['Sao Paulo', 'Rio de Janeiro']),
+    ('AU', 'Australia', 'OC', 'Oceania', ['Sydney', 'Melbourne']),
+]
+
+RDAP_LAST_MODIFIED = 'Sat, 01 Jun 2019 16:00:00 GMT'
+
+
+def _hash(*parts):
+    """
+    Stable hash of some values, so the same IP always gets the same data.
+    """
+    return zlib.crc32(':'.join(str(part) for part in parts).encode())
+
+
+def geoip_payload(ip):
+    """
+    Make up an ipstack response for an IP.
+    :param ip:
+    :return: the response data
+    """
+    code, country, continent_code, continent, cities = COUNTRIES[_hash('country', ip.split('.')[0]) % len(COUNTRIES)]
+    city = cities[_hash('city', ip) % len(cities)]
+    h = _hash('location', ip)
+
+    return {
+        'ip': ip,
+        'type': 'ipv4',
+        'continent_code': continent_code,
+        'continent_name': continent,
+        'country_code': code,
+        'country_name': country,
+        'region_code': code + '-' + str(h % 10),
+        'region_name': city + ' Region',
+        'city': city,
+        'zip': str(h % 100000).zfill(5),
+        'latitude': round((h % 18000) / 100 - 90, 4),
+        'longitude': round((h // 18000 % 36000) / 100 - 180, 4),
+        'location': {
+            'geoname_id': h % 10000000,
+            'capital': city,
+            'languages': [{'code': 'en', 'name': 'English', 'native': 'English'}],
+            'country_flag': f'http://assets.ipstack.com/flags/{code.lower()}.svg',
+            'calling_code': str(h % 100),
+            'is_eu': continent_code == 'EU'
+        }
+    }
+
+
+def rdap_payload(ip):
+    """
+    Make up an ARIN RDAP response for an IP.
+    Every /16 is its own network, and networks with the same first octet belong to the same organization, so entities
+    repeat across responses like they do in real data.
+    :param ip:
+    :return: the response data
+    """
+    octets = ip.split('.')
+    org = f'ORG{_hash("org", octets[0]) % 100000}-MOCK'
+    net = f'NET-{octets[0]}-{octets[1]}-0-0-1'
+
+    def contact(handle, role, name):
+        return {
+            'objectClassName': 'entity',
+            'handle': handle,
+            'roles': [role],
+            'vcardArray': ['vcard', [
+                ['version', {}, 'text', '4.0'],
+                ['fn', {}, 'text', name],
+                ['kind', {}, 'text', 'group'],
+                ['email', {}, 'text', f'{role}@{org.lower()}.example'],
+                ['tel', {'type': ['work', 'voice']}, 'text', '+1-555-0100']
+            ]],
+            'events': [{'eventAction': 'last changed', 'eventDate': '2019-06-01T12:00:00-04:00'}]
+        }
+
+    return {
+        'objectClassName': 'ip network',
+        'handle': net,
+        'startAddress': f'{octets[0]}.{octets[1]}.0.0',
+        'endAddress': f'{octets[0]}.{octets[1]}.255.255',
+        'ipVersion': 'v4',
+        'name': f'MOCK-NET-{octets[0]}-{octets[1]}',
+        'type': 'DIRECT ALLOCATION',
+        'parentHandle': f'NET-{octets[0]}-0-0-0-0',
+        'status': ['active'],
+        'events': [
+            {'eventAction': 'registration', 'eventDate': '2010-03-01T00:00:00-05:00'},
+            {'eventAction': 'last changed', 'eventDate': '2019-06-01T12:00:00-04:00'}
+        ],
+        'entities': [{
+            'objectClassName': 'entity',
+            'handle': org,
+            'roles': ['registrant'],
+            'vcardArray': ['vcard', [
+                ['version', {}, 'text', '4.0'],
+                ['fn', {}, 'text', f'Mock Organization {org}'],
+                ['adr', {'label': '1 Example Way\nSpringfield\nUS'}, 'text', ['', '', '', '', '', '', '']],
+                ['kind', {}, 'text', 'org']
+            ]],
+            'events': [{'eventAction': 'registration', 'eventDate': '2009-01-01T00:00:00-05:00'}],
+            'entities': [
+                contact(f'ABUSE{_hash("abuse", org) % 10000}-MOCK', 'abuse', 'Abuse'),
+                contact(f'NOC{_hash("noc", org) % 10000}-MOCK', 'technical', 'Network Operations')
+            ]
+        }]
+    }
+
+
+class MockServer:
+    """
+    Local stand-in for ipstack and ARIN RDAP, for testing and benchmarking without using quota.
+    Serves made-up but stable data for any IP at /geoip/<ip>[,<ip>...] (bulk lookups and `fields` are supported) and
+    /rdap/ip/<ip> (or /rdap/ip/<ip>/<length>); bogons are not found. RDAP responses have an ETag and Last-Modified, and
+    conditional requests for them are answered with 304 Not Modified. Point the lookups at it with the GEO_IP_URL and
+    RDAP_URL environment variables (see geoip_url() and rdap_url()).
+
+    Each response is delayed by `latency` seconds, give or take `jitter`. A share of requests (`error_rate`) fails with
+    a 500, and requests over `rate_limit` per second get a 429 with Retry-After.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._window = None
+        self._window_requests = 0
+
+        server = self
+
+        class Handler(_Handler):
+            mock = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def geoip_url(self):
+        """
+        :return: URL template to use as geoip.GEO_IP_URL
+        """
+        return self.url + '/geoip/{0}?access_key=mock'
+
+    def rdap_url(self):
+        """
+        :return: URL template to use as rdap.RDAP_URL
+        """
+        return self.url + '/rdap/ip/{0}'
+
+    def start(self):
+        """
+        Serve on a background thread.
+        :return: self
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving.
+        :return: None
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def admit(self):
+        """
+        Count a request and check it against the rate limit.
+        :return: True if the request is within the rate limit, False if not
+        """
+        with self.lock:
+            self.requests += 1
+
+            if self.rate_limit is None:
+                return True
+
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._window_requests = 0
+
+            self._window_requests += 1
+            return self._window_requests <= self.rate_limit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if not self.mock.admit():
+            return self._send(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+
+        delay = self.mock.latency + random.uniform(-self.mock.jitter, self.mock.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < self.mock.error_rate:
+            return self._send(500, {'error': 'internal server error'})
+
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+
+        if len(parts) == 2 and parts[0] == 'geoip':
+            return self._geoip(parts[1].split(','), parse_qs(url.query).get('fields'))
+
+        # by IP or by CIDR (/rdap/ip/<ip>/<length>)
+        if len(parts) in (3, 4) and parts[:2] == ['rdap', 'ip']:
+            return self._rdap(parts[2])
+
+        self._send(404, {'error': 'not found'})
+
+    def _geoip(self, ips, fields):
+        data = []
+
+        for ip in ips:
+            if planner.is_bogon(ip):
+                continue
+
+            datum = geoip_payload(ip)
+
+            if fields and fields[0] != 'main':
+                datum = {key: value for key, value in datum.items() if key in fields[0].split(',')}
+
+            data.append(datum)
+
+        if not data:
+            return self._send(404, {'error': 'not found'})
+
+        self._send(200, data if len(ips) > 1 else data[0])
+
+    def _rdap(self, ip):
+        if planner.is_bogon(ip):
+            return self._send(404, {'errorCode': 404, 'title': 'Not Found'})
+
+        data = rdap_payload(ip)
+        headers = {'ETag': f'"{_hash(json.dumps(data)):08x}"', 'Last-Modified': RDAP_LAST_MODIFIED}
+
+        if self.headers.get('If-None-Match') == headers['ETag'] or (
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == RDAP_LAST_MODIFIED):
+            return self._send(304, None, headers)
+
+        self._send(200, data, headers)
+
+    def _send(self, status, data, headers=None):
+        body = json.dumps(data).encode() if data is not None else b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        self.wfile.write(body)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Serve made-up GeoIP and RDAP data locally')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to delay each response by')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random variation of the latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests to fail with a 500')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per second before 429s are sent')
+    args = parser.parse_args(args)
+
+    server = MockServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.rate_limit)
+
+    print(f"export GEO_IP_URL='{server.geoip_url()}'")
+    print(f"export RDAP_URL='{server.rdap_url()}'")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
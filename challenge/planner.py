@@ -0,0 +1,132 @@
+import ipaddress
+from bisect import bisect_right
+from operator import itemgetter
+from challenge import packed, util
+
+RESERVED_NETWORKS = [
+    '0.0.0.0/8',           # "this" network
+    '10.0.0.0/8',          # private
+    '100.64.0.0/10',       # carrier-grade NAT
+    '127.0.0.0/8',         # loopback
+    '169.254.0.0/16',      # link local
+    '172.16.0.0/12',       # private
+    '192.0.0.0/24',        # IETF protocol assignments
+    '192.0.2.0/24',        # documentation
+    '192.88.99.0/24',      # 6to4 relay anycast
+    '192.168.0.0/16',      # private
+    '198.18.0.0/15',       # benchmarking
+    '198.51.100.0/24',     # documentation
+    '203.0.113.0/24',      # documentation
+    '224.0.0.0/4',         # multicast
+    '240.0.0.0/4',         # reserved, including broadcast
+]
+
+
+def _build_ranges(networks):
+    """
+    Convert CIDR networks to sorted (start, end) int ranges.
+    :param networks:
+    :return: list of ranges
+    """
+    ranges = []
+
+    for network in networks:
+        network = ipaddress.ip_network(network)
+        ranges.append((int(network.network_address), int(network.broadcast_address)))
+
+    return sorted(ranges)
+
+
+RESERVED_RANGES = _build_ranges(RESERVED_NETWORKS)
+RESERVED_STARTS = [start for start, _ in RESERVED_RANGES]
+
+
+def is_bogon(ip):
+    """
+    Check whether an IP is one that the APIs cannot say anything about: reserved (private, loopback, multicast, etc.)
+    or not a valid IPv4 address at all.
+    :param ip:
+    :return: True if the IP is a bogon, False otherwise
+    """
+    try:
+        n = util.ip_to_int(ip)
+    except Exception:
+        return True
+
+    i = bisect_right(RESERVED_STARTS, n) - 1
+
+    return i >= 0 and n <= RESERVED_RANGES[i][1]
+
+
+def prioritize(ips):
+    """
+    Order IPs by how often they were seen, most first, so that the IPs that matter most are looked up first and a
+    run that is cut short (see --time-budget and --max-lookups) still covers them. IPs seen as often keep their order.
+    :param ips: dictionary (or packed.PackedCounter) of IPs and their counts
+    :return: list of IPs; for a packed.PackedCounter, a generator that converts them to strings as they are consumed
+    """
+    if isinstance(ips, packed.PackedCounter):
+        return ips.most_common()
+
+    return [ip for ip, _ in sorted(ips.items(), key=itemgetter(1), reverse=True)]
+
+
+class Planner:
+    """
+    Decides which IPs need to be looked up before any work is dispatched.
+    IPs that already have GeoIP and RDAP data in the warehouse are skipped as cached, and bogons are skipped as
+    nothing can be found out about them.
+    """
+    def __init__(self, wh):
+        keys = wh.load_keys()
+
+        self.known_geoip = keys.get('geoip', set())
+        self.known_rdap = {key.split(':', 1)[0] for key in keys.get('ip_rdap', set())}
+
+        self.to_fetch = 0
+        self.cached = 0
+        self.bogon = 0
+
+    def filter(self, ips):
+        """
+        Filter out IPs that do not need to be looked up, counting why.
+        :param ips: iterable of IPs
+        :return: generator of IPs to look up
+        """
+        for ip in ips:
+            if is_bogon(ip):
+                self.bogon += 1
+            elif ip in self.known_geoip and ip in self.known_rdap:
+                self.cached += 1
+            else:
+                self.to_fetch += 1
+                yield ip
+
+    def exclude(self, ips):
+        """
+        Filter out the IPs of a counter that do not need to be looked up, counting why.
+        A packed.PackedCounter stays packed: bogons are cut out of its sorted addresses by range and cached IPs are
+        removed with a merge against the warehouse keys (see packed.PackedCounter.exclude), rather than one lookup per
+        IP.
+        :param ips: dictionary (or packed.PackedCounter) of IPs and their counts
+        :return: a counter of the same kind with the IPs to look up
+        """
+        if not isinstance(ips, packed.PackedCounter):
+            return {ip: ips[ip] for ip in self.filter(ips)}
+
+        num_ips = len(ips)
+        ips = ips.exclude_ranges(RESERVED_RANGES)
+        self.bogon += num_ips - len(ips)
+
+        num_ips = len(ips)
+        ips = ips.exclude(self.known_geoip & self.known_rdap)
+        self.cached += num_ips - len(ips)
+        self.to_fetch += len(ips)
+
+        return ips
+
+    def summary(self):
+        """
+        :return: a summary of the plan
+        """
+        return f'{self.to_fetch} to fetch / {self.cached} cached / {self.bogon} bogon'
@@ -0,0 +1,134 @@
+import time
+from collections import deque
+
+LATENCY_WINDOW = 1000
+
+
+def _percentile(values, p):
+    """
+    :param values: sorted list of values
+    :param p: percentile, 0 to 100
+    :return: the value at the percentile (nearest rank), or None if there are no values
+    """
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def _format_duration(seconds):
+    """
+    :param seconds:
+    :return: the duration as H:MM:SS
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
+
+
+class Progress:
+    """
+    Tracks the progress of an enrichment run in the process consuming its results.
+    Engines call update() with each batch of results and the request samples of the upstreams that produced them
+    (see upstream.Upstream.drain_samples); a status line with the rate, ETA, latency percentiles per upstream and the
+    response cache hit ratio is printed at most every `interval` seconds.
+    """
+    def __init__(self, total=None, interval=1.0, clock=time.monotonic):
+        self.total = total
+        self.interval = interval
+        self.clock = clock
+        self.done = 0
+        self.started = clock()
+        self.printed = None
+        self.latencies = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, num_results, samples=None):
+        """
+        Count finished results.
+        :param num_results: number of results
+        :param samples: optional dictionary of upstream names and lists of (seconds, from cache) request samples
+        :return: None
+        """
+        self.done += num_results
+
+        for name, upstream_samples in (samples or {}).items():
+            latencies = self.latencies.setdefault(name, deque(maxlen=LATENCY_WINDOW))
+
+            for seconds, cached in upstream_samples:
+                if cached:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    latencies.append(seconds)
+
+        now = self.clock()
+        if self.printed is None or now - self.printed >= self.interval:
+            self.printed = now
+            print(self.status())
+
+    def rate(self):
+        """
+        :return: results per second so far
+        """
+        elapsed = self.clock() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """
+        :return: estimated seconds until all results are done, or None if it cannot be estimated
+        """
+        rate = self.rate()
+        if self.total is None or not rate:
+            return None
+
+        return max(0, self.total - self.done) / rate
+
+    def latency_percentiles(self, name, percentiles=(50, 95, 99)):
+        """
+        :param name: upstream name
+        :param percentiles:
+        :return: dictionary of percentiles and latencies in seconds, over the most recent LATENCY_WINDOW requests
+        """
+        latencies = sorted(self.latencies.get(name, ()))
+        return {p: _percentile(latencies, p) for p in percentiles}
+
+    def hit_ratio(self):
+        """
+        :return: share of upstream requests served from the response cache
+        """
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def status(self):
+        """
+        :return: a line describing the progress
+        """
+        if self.total:
+            parts = [f'{self.done}/{self.total} IPs ({self.done / self.total:.0%})']
+        else:
+            parts = [f'{self.done} IPs']
+
+        parts.append(f'{self.rate():.1f} IPs/s')
+
+        eta = self.eta()
+        if eta is not None:
+            parts.append(f'ETA {_format_duration(eta)}')
+
+        for name in sorted(self.latencies):
+            latencies = self.latency_percentiles(name)
+            if latencies[50] is not None:
+                parts.append(name + ' ' + ' '.join(f'p{p} {seconds * 1000:.0f}ms' for p, seconds in latencies.items()))
+
+        if self.hits:
+            parts.append(f'cache {self.hit_ratio():.0%} hit')
+
+        return ' | '.join(parts)
+
+    def finish(self):
+        """
+        Print the final status.
+        :return: None
+        """
+        print(self.status())
@@ -1,39 +1,146 @@
+import os
+import sys
+import json
+import ipaddress
 import requests
-from challenge import util
+import threading
+from pathlib import Path
+from array import array
+from collections import OrderedDict
+from bisect import bisect_right
+from challenge import util, upstream as upstream_module
 
-RDAP_URL = 'https://rdap.arin.net/registry/ip/{0}'
+# can be pointed elsewhere (e.g. at challenge.mockserver) with an environment variable of the same name
+RDAP_URL = os.environ.get('RDAP_URL', 'https://rdap.arin.net/registry/ip/{0}')
+
+# IANA's registry of which RDAP service is responsible for each IPv4 block (RFC 7484)
+BOOTSTRAP_URL = 'https://data.iana.org/rdap/ipv4.json'
+
+# response headers to revalidate a network with (see revalidate), and the fields of its root item they are kept in
+VALIDATOR_FIELDS = {
+    'ETag': 'etag',
+    'Last-Modified': 'last_modified'
+}
 
 INTERESTING_TOP_LEVEL_FIELDS = ['handle', 'startAddress', 'endAddress', 'ipVersion', 'name', 'type', 'parentHandle', 'objectClassName']
 
 
-def get(ip, process=True):
+def get(ip, process=True, upstream=None, entities=None, bootstrap=None):
     """
     Perform an RDAP query against an IP.
     Response format is described here: https://tools.ietf.org/html/rfc7483.
     :param ip:
     :param process: whether or not to process the GeoIP data or leave it raw
+    :param upstream: optional upstream.Upstream to make the request with; a one-off request is made if not set
+    :param entities: optional EntityCache to reuse entities that have already been parsed
+    :param bootstrap: optional Bootstrap to send the query straight to the registry responsible for the IP, rather
+    than to ARIN, which redirects queries for other registries' IPs
     :return: RDAP data
     """
     util.verify_ip(ip)
 
-    response = requests.get(RDAP_URL.format(ip))
+    http = requests if upstream is None else upstream
+
+    url = None
+    if bootstrap is not None:
+        url = bootstrap.url(ip)
+    if url is None:
+        url = RDAP_URL.format(ip)
+
+    response = http.get(url)
 
     if response.status_code == 404:
         return None
 
-    result = response.json()
+    result = upstream_module.parse_json(response)
 
     if process:
-        result = _process_data(result)
+        result = _process_data(result, entities)
+        _add_validators(result[0], response)
 
     return result
 
 
-def _process_data(data):
+def revalidate(root, upstream=None, entities=None, bootstrap=None):
+    """
+    Check whether a network has changed since it was retrieved, with a conditional request using the validators kept
+    with it (see VALIDATOR_FIELDS). If the registry answers 304 Not Modified, nothing is downloaded or parsed.
+    The network is queried by its range (as a CIDR if it is one, otherwise by its start address). If the registry
+    answers with another network (e.g. a more specific one containing the start address), an exception is raised, as
+    the answer says nothing about this network.
+    :param root: the root item of the processed data of the network (see _process_data)
+    :param upstream: optional upstream.Upstream to make the request with; a one-off request is made if not set
+    :param entities: optional EntityCache to reuse entities that have already been parsed
+    :param bootstrap: optional Bootstrap to send the query straight to the registry responsible for the network
+    :return: tuple of 'unchanged', 'changed' or 'gone' and, if changed, the processed data
+    """
+    start_address = root['startAddress']
+    query = start_address
+
+    try:
+        cidrs = list(ipaddress.summarize_address_range(ipaddress.IPv4Address(start_address),
+                                                       ipaddress.IPv4Address(root['endAddress'])))
+        if len(cidrs) == 1:
+            query = str(cidrs[0])
+    except ValueError:
+        pass
+
+    url = None
+    if bootstrap is not None:
+        url = bootstrap.url(start_address)
+        if url is not None:
+            url = url[:-len(start_address)] + query
+    if url is None:
+        url = RDAP_URL.format(query)
+
+    headers = {}
+    if root.get('etag'):
+        headers['If-None-Match'] = root['etag']
+    if root.get('last_modified'):
+        headers['If-Modified-Since'] = root['last_modified']
+
+    if upstream is None:
+        response = requests.get(url, headers=headers, timeout=30)
+    else:
+        response = upstream.get(url, headers)
+
+    if response.status_code == 304:
+        return 'unchanged', None
+
+    if response.status_code == 404:
+        return 'gone', None
+
+    if response.status_code != 200:
+        raise Exception(f'RDAP query failed. Status: {response.status_code}')
+
+    data = _process_data(upstream_module.parse_json(response), entities)
+
+    # a query by start address is answered with the most specific network containing it, which can be another one
+    if any(data[0].get(field) != root.get(field) for field in ('handle', 'startAddress', 'endAddress')):
+        raise Exception(f'RDAP query for {root.get("handle")} was answered with another network: '
+                        f'{data[0].get("handle")}')
+
+    _add_validators(data[0], response)
+
+    return 'changed', data
+
+
+def _add_validators(root, response):
+    """
+    Keep the validators of a response with the root item of its processed data.
+    """
+    for header, field in VALIDATOR_FIELDS.items():
+        value = response.headers.get(header)
+        if isinstance(value, str):
+            root[field] = value
+
+
+def _process_data(data, entities=None):
     """
     Process RDAP data.
     Returns an array where one item is for top-level RDAP data, and items for each child entity.
     :param data: the data to process
+    :param entities: optional EntityCache to reuse entities that have already been parsed
     :return: processed data in the form of an array
     """
     if not isinstance(data, dict):
@@ -54,9 +161,9 @@ def _process_data(data):
     all_data = [top_level_data]
 
     if 'entities' in data:
-        entities = filter(lambda e: 'objectClassName' in e and e['objectClassName'] == 'entity', data['entities'])
-        for entity in entities:
-            all_data += _parse_entity(entity, top_level_data['handle'])
+        children = filter(lambda e: 'objectClassName' in e and e['objectClassName'] == 'entity', data['entities'])
+        for entity in children:
+            all_data += _parse_entity(entity, top_level_data['handle'], entities)
 
     return all_data
 
@@ -74,44 +181,61 @@ def _parse_events(events):
             continue
 
         action = event['eventAction'].replace(' ', '_')
-        key = f'event_{action}'
+        key = sys.intern(f'event_{action}')
 
         parsed_events[key] = event['eventDate']
 
     return parsed_events
 
 
-def _parse_entity(entity, parent):
+def _parse_entity(entity, parent, entities=None):
     """
     Parse RDAP entities.
     An entity can have child entities, therefore this function returns an array; one item for the top-level entity
     and an item for each child.
     :param entity:
     :param parent: parent of the entity
+    :param entities: optional EntityCache; if the entity has been parsed before, its fields and children are reused
     :return: list of parsed entities.
     """
     top_level_entity = {'class': 'child', 'parentHandle': parent}
 
+    key = None
+    if entities is not None and 'handle' in entity:
+        key = (entity['handle'], tuple(entity.get('roles', ())))
+        cached = entities.get(key)
+        if cached is not None:
+            fields, children = cached
+            top_level_entity.update(fields)
+            return [top_level_entity] + children
+
+    fields = {}
+
     if 'handle' in entity:
-        top_level_entity['handle'] = entity['handle']
+        fields['handle'] = entity['handle']
 
     if 'vcardArray' in entity:
         vcard_items = entity['vcardArray'][1]
-        top_level_entity.update(_parse_vcard(vcard_items))
+        fields.update(_parse_vcard(vcard_items))
 
     if 'roles' in entity:
-        top_level_entity['roles'] = ','.join(entity['roles'])
+        fields['roles'] = sys.intern(','.join(entity['roles']))
 
     if 'events' in entity:
-        top_level_entity.update(_parse_events(entity['events']))
+        fields.update(_parse_events(entity['events']))
 
-    entities = [top_level_entity]
+    top_level_entity.update(fields)
+
+    children = []
 
     if 'entities' in entity:
-        for entity in entity['entities']:
-            entities += _parse_entity(entity, top_level_entity['handle'])
+        for child in entity['entities']:
+            children += _parse_entity(child, top_level_entity['handle'], entities)
+
+    if key is not None:
+        entities.put(key, (fields, children))
 
-    return entities
+    return [top_level_entity] + children
 
 
 def _parse_vcard(vcard):
@@ -135,13 +259,33 @@ def _parse_vcard(vcard):
             if isinstance(value, list):
                 value = ','.join(value)
 
-        key = f'vcard_{key}'
+        # the same contacts appear under many networks, so their strings are interned rather than kept as copies
+        key = sys.intern(f'vcard_{key}')
+        if isinstance(value, str):
+            value = sys.intern(value)
 
         parsed_vcard[key] = value
 
     return parsed_vcard
 
 
+def contains(data, ip):
+    """
+    Check whether the network in processed RDAP data (see _process_data) contains an IP.
+    :param data: the processed data
+    :param ip:
+    :return: True if the network contains the IP, False if not or if the data has no network range
+    """
+    root = next((datum for datum in data or () if datum.get('class') == 'root'), None)
+    if root is None or 'startAddress' not in root or 'endAddress' not in root:
+        return False
+
+    try:
+        return util.ip_to_int(root['startAddress']) <= util.ip_to_int(ip) <= util.ip_to_int(root['endAddress'])
+    except Exception:
+        return False
+
+
 def get_key(data):
     """
     Produce a key for the specified data.
@@ -149,3 +293,373 @@ def get_key(data):
     :return: the key
     """
     return data['handle']
+
+
+class Bootstrap:
+    """
+    Routes RDAP queries to the registry (ARIN, RIPE NCC, APNIC, LACNIC, AFRINIC) responsible for an IP, using a local
+    copy of the IANA RDAP bootstrap file for IPv4 (see BOOTSTRAP_URL).
+    """
+    def __init__(self, services):
+        """
+        :param services: list of (network, base URL) tuples
+        """
+        ranges = []
+
+        for network, base_url in services:
+            network = ipaddress.ip_network(network, strict=False)
+            if network.version != 4:
+                continue
+            if not base_url.endswith('/'):
+                base_url += '/'
+            ranges.append((int(network.network_address), int(network.broadcast_address), base_url))
+
+        ranges.sort()
+
+        self.starts = [start for start, _, _ in ranges]
+        self.ranges = ranges
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        :param data: the parsed bootstrap file
+        :return: the bootstrap
+        """
+        services = []
+
+        for networks, urls in data['services']:
+            # prefer HTTPS when a registry lists more than one URL
+            urls = sorted(urls, key=lambda url: not url.startswith('https://'))
+            for network in networks:
+                services.append((network, urls[0]))
+
+        return cls(services)
+
+    @classmethod
+    def load(cls, path, download=True):
+        """
+        Load a bootstrap file.
+        :param path:
+        :param download: whether to download the file from IANA to `path` if it does not exist
+        :return: the bootstrap
+        """
+        path = Path(path)
+
+        if not path.exists():
+            if not download:
+                raise Exception(f'RDAP bootstrap file not found: {path}')
+
+            response = requests.get(BOOTSTRAP_URL, timeout=30)
+            if response.status_code != 200:
+                raise Exception(f'Could not download the RDAP bootstrap file. Status: {response.status_code}')
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(response.text)
+
+        with path.open() as file:
+            return cls.from_data(json.load(file))
+
+    def url(self, ip):
+        """
+        :param ip:
+        :return: URL to query for the IP, or None if no registry is known for it
+        """
+        try:
+            n = util.ip_to_int(ip)
+        except Exception:
+            return None
+
+        # blocks do not overlap, so the last one starting at or before the IP is the only one that can contain it
+        i = bisect_right(self.starts, n) - 1
+        if i < 0 or n > self.ranges[i][1]:
+            return None
+
+        return f'{self.ranges[i][2]}ip/{ip}'
+
+
+class EntityCache:
+    """
+    Parsed RDAP entities by handle and roles, so that contacts which appear under many networks (POCs, abuse
+    contacts, organizations) are parsed once and their child entities are shared rather than copied.
+    Entities are the same wherever they appear, except for their roles, which describe their relation to the network.
+    The least recently used entities are dropped past `max_size`. Safe to use from multiple threads.
+    Entities from the cache are shared by every result they appear in, so they must not be modified.
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entities = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entities)
+
+    def get(self, key):
+        """
+        :param key: tuple of the handle and roles of the entity
+        :return: tuple of the entity's parsed fields and its parsed children, or None if it has not been parsed
+        """
+        with self.lock:
+            cached = self.entities.get(key)
+
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entities.move_to_end(key)
+
+            return cached
+
+    def put(self, key, parsed):
+        """
+        :param key: tuple of the handle and roles of the entity
+        :param parsed: tuple of the entity's parsed fields and its parsed children
+        :return: None
+        """
+        with self.lock:
+            self.entities[key] = parsed
+
+            if len(self.entities) > self.max_size:
+                self.entities.popitem(last=False)
+
+
+class NetworkCache:
+    """
+    Index of known RDAP networks by address range, so IPs inside a known network can be given their ip_rdap rows
+    without an RDAP request.
+    Networks are kept sorted by start address and looked up with bisect. When networks are nested, the most specific
+    known network containing the IP is used; note that a more specific network that is not known yet can exist.
+    Only IPv4 networks are indexed. Safe to use from multiple threads.
+    IPs that are in no known network are looked up in `ranges`, if given (see RangeTable).
+    """
+    def __init__(self, ranges=None):
+        self.starts = []
+        self.networks = []
+        self.handles = set()
+        self.max_size = 0
+        self.ranges = ranges
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.networks)
+
+    def add(self, data):
+        """
+        Add the network from processed RDAP data (see _process_data).
+        :param data: the processed data; the root item is the network, and every item with a handle is a row in ip_rdap
+        :return: None
+        """
+        root = next((datum for datum in data if datum.get('class') == 'root'), None)
+        if root is None or 'startAddress' not in root or 'endAddress' not in root or 'handle' not in root:
+            return
+
+        handles = [datum['handle'] for datum in data if 'handle' in datum]
+        self.add_network(root['startAddress'], root['endAddress'], root['handle'], handles)
+
+    def add_network(self, start_address, end_address, handle, handles):
+        """
+        Add a network.
+        :param start_address: first address in the network
+        :param end_address: last address in the network
+        :param handle: handle of the network
+        :param handles: handles of the network and its entities; the ip_rdap rows for any IP in the network
+        :return: None
+        """
+        try:
+            start = util.ip_to_int(start_address)
+            end = util.ip_to_int(end_address)
+        except Exception:
+            return
+
+        with self.lock:
+            if handle in self.handles:
+                return
+
+            i = bisect_right(self.starts, start)
+            self.starts.insert(i, start)
+            self.networks.insert(i, (start, end, handle, tuple(handles)))
+            self.handles.add(handle)
+            self.max_size = max(self.max_size, end - start)
+
+    def lookup(self, ip):
+        """
+        Find the most specific known network containing an IP.
+        :param ip:
+        :return: the handles of the network and its entities, or None if no known network contains the IP (or it is
+        not a valid IPv4 address)
+        """
+        try:
+            n = util.ip_to_int(ip)
+        except Exception:
+            return None
+
+        best = None
+
+        with self.lock:
+            i = bisect_right(self.starts, n) - 1
+
+            while i >= 0:
+                start, end, _, handles = self.networks[i]
+                if n - start > self.max_size:
+                    break
+                if end >= n and (best is None or end - start < best[0]):
+                    best = (end - start, handles)
+                i -= 1
+
+        if best is None:
+            return self.ranges.lookup(ip) if self.ranges is not None else None
+
+        return list(best[1])
+
+    @staticmethod
+    def from_warehouse(wh, ranges=None):
+        """
+        Build a cache from the rdap and ip_rdap indices of a warehouse.
+        The ip_rdap rows of any IP that was looked up in a network give the handles for that network.
+        :param wh: the warehouse
+        :param ranges: optional RangeTable to fall back on
+        :return: the cache
+        """
+        networks = {}
+        for event in wh.read('rdap'):
+            if event.get('class') == 'root' and 'startAddress' in event and 'endAddress' in event:
+                networks[event['handle']] = (event['startAddress'], event['endAddress'])
+
+        handles_by_ip = {}
+        for event in wh.read('ip_rdap'):
+            handles_by_ip.setdefault(event['ip'], []).append(event['handle'])
+
+        cache = NetworkCache(ranges)
+
+        for handles in handles_by_ip.values():
+            for handle in handles:
+                if handle in networks and handle not in cache.handles:
+                    start_address, end_address = networks[handle]
+                    cache.add_network(start_address, end_address, handle, handles)
+
+        return cache
+
+
+class RangeTable:
+    """
+    Read-only table of RDAP networks by address range, e.g. imported from bulk registry dumps (see rdap_import).
+    Nested networks are flattened into ranges that do not overlap, each with the handles of the most specific network
+    covering it, so a lookup is a single binary search however deeply networks are nested.
+    """
+    def __init__(self, starts, ends, handles):
+        """
+        :param starts: array of the first address of each range, sorted
+        :param ends: array of the last address of each range
+        :param handles: list of tuples of the handles (the network's and its entities') of each range
+        """
+        self.starts = starts
+        self.ends = ends
+        self.handles = handles
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, networks):
+        """
+        :param networks: iterable of (start, end, handles) tuples, with addresses as ints
+        :return: the table
+        """
+        starts = array('L')
+        ends = array('L')
+        range_handles = []
+
+        def emit(start, end, handles):
+            if start <= end:
+                starts.append(start)
+                ends.append(end)
+                range_handles.append(handles)
+
+        # sweep the networks in order, outer before inner, keeping the networks the sweep is inside on a stack
+        stack = []
+        position = 0
+
+        for start, end, handles in sorted(networks, key=lambda network: (network[0], -network[1])):
+            while stack and stack[-1][0] < start:
+                outer_end, outer_handles = stack.pop()
+                emit(position, outer_end, outer_handles)
+                position = max(position, outer_end + 1)
+
+            if stack:
+                emit(position, start - 1, stack[-1][1])
+
+            position = max(position, start)
+            stack.append((end, tuple(handles)))
+
+        while stack:
+            outer_end, outer_handles = stack.pop()
+            emit(position, outer_end, outer_handles)
+            position = max(position, outer_end + 1)
+
+        return cls(starts, ends, range_handles)
+
+    def lookup(self, ip):
+        """
+        :param ip:
+        :return: the handles of the most specific network containing the IP, or None if no network contains it (or it
+        is not a valid IPv4 address)
+        """
+        try:
+            n = util.ip_to_int(ip)
+        except Exception:
+            return None
+
+        i = bisect_right(self.starts, n) - 1
+
+        if i < 0 or n > self.ends[i]:
+            return None
+
+        return list(self.handles[i])
+
+    def save(self, path):
+        """
+        Save the table, one JSON array of [start, end, handles] per line.
+        :param path:
+        :return: None
+        """
+        with Path(path).open('w') as file:
+            for start, end, handles in zip(self.starts, self.ends, self.handles):
+                file.write(json.dumps([start, end, handles]) + '\n')
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path of a table saved with save()
+        :return: the table
+        """
+        starts = array('L')
+        ends = array('L')
+        handles = []
+
+        with Path(path).open() as file:
+            for line in file:
+                start, end, range_handles = json.loads(line)
+                starts.append(start)
+                ends.append(end)
+                handles.append(tuple(sys.intern(handle) for handle in range_handles))
+
+        return cls(starts, ends, handles)
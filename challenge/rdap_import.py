@@ -0,0 +1,274 @@
+import sys
+import gzip
+import json
+import argparse
+from challenge import rdap, util, warehouse
+
+RANGES_STATE = 'rdap_ranges.ndjson'
+
+# RPSL attributes of inetnum objects (RIPE NCC, APNIC, AFRINIC, LACNIC) and their ARIN bulk whois equivalents that
+# name a contact or organization, and the RDAP role they have
+RPSL_ROLES = {
+    'org': 'registrant',
+    'orgid': 'registrant',
+    'admin-c': 'administrative',
+    'tech-c': 'technical',
+    'abuse-c': 'abuse'
+}
+
+
+def _open(path):
+    """
+    Open a text file, decompressing it if its name ends with .gz.
+    """
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', errors='replace')
+
+    return open(path, errors='replace')
+
+
+def read_dump(path):
+    """
+    Read the IP networks in a bulk registry dump. The format is detected from the first character of the file:
+    RDAP JSON (an ip network object, a list of them, a search result with `ipSearchResults`, or one object per line),
+    or RPSL bulk whois (see read_rpsl).
+    :param path: path of the dump (gzip compressed if its name ends with .gz)
+    :return: generator of RDAP ip network objects
+    """
+    with _open(path) as file:
+        first = ''
+        while True:
+            char = file.read(1)
+            if not char or not char.isspace():
+                first = char
+                break
+
+    if first in ('{', '['):
+        return read_rdap(path)
+
+    return read_rpsl(path)
+
+
+def read_rdap(path):
+    """
+    Read the IPv4 networks in an RDAP JSON dump. Other networks (IPv6, or with addresses that are not valid) are
+    skipped.
+    :param path:
+    :return: generator of RDAP ip network objects
+    """
+    with _open(path) as file:
+        first_line = file.readline()
+
+        try:
+            # one object per line, which is read as it goes rather than all at once
+            json.loads(first_line)
+            file.seek(0)
+            objects = (json.loads(line) for line in file if line.strip())
+        except ValueError:
+            file.seek(0)
+            objects = [json.load(file)]
+
+        for obj in objects:
+            if isinstance(obj, dict):
+                obj = obj.get('ipSearchResults', [obj])
+
+            for network in obj:
+                if isinstance(network, dict) and network.get('objectClassName') == 'ip network' and \
+                        _is_ipv4_network(network):
+                    yield network
+
+
+def _is_ipv4_network(network):
+    """
+    :param network: RDAP ip network object
+    :return: True if the network is an IPv4 network with valid start and end addresses, False otherwise
+    """
+    if network.get('ipVersion', 'v4') != 'v4':
+        return False
+
+    try:
+        util.ip_to_int(network['startAddress'])
+        util.ip_to_int(network['endAddress'])
+    except Exception:
+        return False
+
+    return True
+
+
+def read_rpsl(path):
+    """
+    Read the IP networks in an RPSL bulk whois dump: `inetnum` objects (as dumped by RIPE NCC, APNIC, AFRINIC and
+    LACNIC) and `NetRange` objects (as in ARIN's bulk whois). Other objects are skipped.
+    :param path:
+    :return: generator of RDAP ip network objects
+    """
+    with _open(path) as file:
+        for attributes in _iter_rpsl_objects(file):
+            network = rpsl_to_rdap(attributes)
+            if network is not None:
+                yield network
+
+
+def _iter_rpsl_objects(lines):
+    """
+    Split RPSL into objects, which are separated by blank lines.
+    :param lines: iterable of lines
+    :return: generator of lists of (attribute, value) tuples; attributes are lower case
+    """
+    attributes = []
+
+    for line in lines:
+        line = line.rstrip('\n')
+
+        if not line.strip():
+            if attributes:
+                yield attributes
+                attributes = []
+        elif line.startswith(('%', '#')):
+            continue
+        elif line[0] in ' \t+' and attributes:
+            # continuation of the previous attribute's value
+            key, value = attributes[-1]
+            attributes[-1] = (key, (value + ' ' + line.lstrip(' \t+').strip()).strip())
+        elif ':' in line:
+            key, value = line.split(':', 1)
+            attributes.append((key.strip().lower(), value.strip()))
+
+    if attributes:
+        yield attributes
+
+
+def rpsl_to_rdap(attributes):
+    """
+    Convert an RPSL inetnum (or ARIN NetRange) object to the RDAP ip network object the registry's RDAP service would
+    return for it, as far as the dump has the data: contacts only have their handles and roles, as their details are
+    separate objects.
+    :param attributes: list of (attribute, value) tuples
+    :return: the RDAP object, or None if the object is not an IPv4 network
+    """
+    values = {}
+    for key, value in attributes:
+        values.setdefault(key, []).append(value)
+
+    def first(*keys):
+        for key in keys:
+            if key in values:
+                return values[key][0]
+        return None
+
+    address_range = first('inetnum', 'netrange')
+    if address_range is None or '-' not in address_range:
+        return None
+
+    start_address, end_address = (address.strip() for address in address_range.split('-', 1))
+    try:
+        util.ip_to_int(start_address)
+        util.ip_to_int(end_address)
+    except Exception:
+        return None
+
+    network = {
+        'objectClassName': 'ip network',
+        # RIPE NCC's RDAP service uses the range as the handle of an inetnum
+        'handle': first('nethandle') or f'{start_address} - {end_address}',
+        'startAddress': start_address,
+        'endAddress': end_address,
+        'ipVersion': 'v4'
+    }
+
+    name = first('netname')
+    if name is not None:
+        network['name'] = name
+
+    network_type = first('status', 'nettype')
+    if network_type is not None:
+        network['type'] = network_type
+
+    parent = first('parent')
+    if parent is not None:
+        network['parentHandle'] = parent
+
+    events = []
+    for key, action in (('created', 'registration'), ('regdate', 'registration'),
+                        ('last-modified', 'last changed'), ('updated', 'last changed')):
+        if key in values:
+            events.append({'eventAction': action, 'eventDate': values[key][0]})
+    if events:
+        network['events'] = events
+
+    entities = []
+    for key, role in RPSL_ROLES.items():
+        for handle in values.get(key, ()):
+            entities.append({'objectClassName': 'entity', 'handle': handle, 'roles': [role]})
+    if entities:
+        network['entities'] = entities
+
+    return network
+
+
+def import_dumps(paths, wh, ranges=None, entities=None):
+    """
+    Import bulk registry dumps: write their networks and entities to the rdap index, processed as if they had been
+    looked up (see rdap._process_data), and build a table of their ranges so the ip_rdap rows of IPs in them can be
+    found without RDAP requests (see rdap.RangeTable).
+    :param paths: paths of the dumps
+    :param wh: the warehouse
+    :param ranges: optional rdap.RangeTable of earlier imports to add to; where the dumps have the same range, theirs
+    is used
+    :param entities: optional rdap.EntityCache to reuse entities that have already been parsed
+    :return: tuple of the range table and the counts of added and skipped rdap events
+    """
+    if entities is None:
+        entities = rdap.EntityCache()
+
+    stats = {'added': 0, 'skipped': 0}
+    networks = {}
+
+    if ranges is not None:
+        for i, (start, end, handles) in enumerate(zip(ranges.starts, ranges.ends, ranges.handles)):
+            networks[i] = (start, end, handles)
+
+    with wh.open() as open_wh:
+        for path in paths:
+            for network in read_dump(path):
+                data = rdap._process_data(network, entities)
+
+                for item in data:
+                    if 'handle' not in item:
+                        continue
+
+                    # entities can be shared between networks, and writing adds the index
+                    if open_wh.write('rdap', dict(item)):
+                        stats['added'] += 1
+                    else:
+                        stats['skipped'] += 1
+
+                root = data[0]
+                networks[root['handle']] = (util.ip_to_int(root['startAddress']), util.ip_to_int(root['endAddress']),
+                                            [item['handle'] for item in data if 'handle' in item])
+
+    return rdap.RangeTable.build(networks.values()), stats
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Import bulk RDAP (JSON) or whois (RPSL) registry dumps into the rdap '
+                                                 'index, so IPs in their networks need no RDAP lookups')
+    parser.add_argument('paths', nargs='+',
+                        help='dump files (.gz compressed files are fine); their ranges are added to those of earlier '
+                             'imports')
+    parser.add_argument('--data', default='data', help='warehouse directory (default: data)')
+    args = parser.parse_args(args)
+
+    wh = warehouse.Warehouse(args.data)
+    ranges_path = wh.state_path(RANGES_STATE)
+
+    ranges = rdap.RangeTable.load(ranges_path) if ranges_path.exists() else None
+    ranges, stats = import_dumps(args.paths, wh, ranges)
+    ranges.save(ranges_path)
+
+    print(f'rdap\nadded: {stats["added"]}, skipped: {stats["skipped"]}')
+    print(f'{len(ranges)} address ranges saved.')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
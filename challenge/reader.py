@@ -1,15 +1,119 @@
-from challenge import util
+import os
+import json
+import mmap
+import glob
+import gzip
+import bz2
+import lzma
+from pathlib import Path
+from collections import Counter
+from multiprocessing import Pool
+from functools import partial
+from challenge import util, packed as packed_counter
 
+MIN_CHUNK_SIZE = 1024 * 1024
 
-def read_ips(path):
+# files are split into more chunks than there are workers when needed to keep chunks this size or smaller, so the
+# memory a worker needs does not grow with the file
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open)
+]
+
+
+def read_ips(path, workers=None, checkpoint=None, packed=False):
     """
     Read a text file and pull out IPs.
+    The path can also be a directory or a glob of files (e.g. rotated logs); each file is read on its own process.
+    gzip, bzip2 and xz compressed files are decompressed as they are read.
     :param path: the path to the text file
-    :return: dictionary of IPs and their counts
+    :param workers: number of processes to scan the file with; if not set, the file is read line by line in this process
+    :param checkpoint: optional Checkpoint; only data added since it was last saved is read, and it is updated
+    :param packed: count IPv4 addresses as ints in a packed.PackedCounter, which uses far less memory than a dict
+    :return: dictionary (or PackedCounter) of IPs and their counts
     """
+    tasks = []
+
+    for file_path in _expand_paths(path):
+        start = checkpoint.start(file_path) if checkpoint is not None else 0
+        if start is not None:
+            tasks.append((file_path, start))
+
+    read = partial(_read_file, complete_lines=checkpoint is not None, packed=packed)
+
+    if len(tasks) <= 1:
+        partials = [read(file_path, start, workers) for file_path, start in tasks]
+    else:
+        with Pool(min(len(tasks), workers or os.cpu_count())) as pool:
+            partials = pool.starmap(read, tasks)
+
+    ips = _new_counter(packed)
+    for (file_path, _), (counts, end) in zip(tasks, partials):
+        ips.update(counts)
+        if checkpoint is not None:
+            checkpoint.update(file_path, end)
+
+    return ips if packed else dict(ips)
+
+
+def _read_file(path, start=0, workers=None, complete_lines=False, packed=False):
+    """
+    Read a single text file and pull out IPs.
+    :param path: the path to the text file
+    :param start: byte offset to start reading at; ignored for compressed files
+    :param workers: number of processes to scan the file with; compressed files are always read in this process
+    :param complete_lines: stop at the end of the last complete line, leaving a partially written line for later
+    :param packed: count IPs in a PackedCounter
+    :return: counter of IPs, and the byte offset reading stopped at
+    """
+    size = os.path.getsize(path)
+
+    if _get_opener(path) is not open:
+        return _count_lines(path, packed), size
+
+    end = _last_line_end(path, size) if complete_lines else size
+
+    if workers is not None and workers > 1:
+        return _read_ips_parallel(path, workers, start, end, packed), end
+
+    if start == 0 and end == size:
+        return _count_lines(path, packed), end
+
+    if start >= end:
+        return _new_counter(packed), start
+
+    return _count_chunk(path, (start, end), packed), end
+
+
+def _new_counter(packed):
+    """
+    :param packed:
+    :return: an empty PackedCounter if packed, otherwise an empty Counter
+    """
+    return packed_counter.PackedCounter() if packed else Counter()
+
+
+def _count_lines(path, packed=False):
+    """
+    Read a text file line by line and count its IPs.
+    :param path: the path to the text file
+    :param packed: count IPs in a PackedCounter
+    :return: dictionary (or PackedCounter) of IPs and their counts
+    """
+    if packed:
+        ips = packed_counter.PackedCounter()
+        with _open(path) as file:
+            for line in file:
+                for ip in util.IP_PATTERN.findall(line):
+                    ips.add(ip)
+        return ips
+
     ips = {}
 
-    with open(path) as file:
+    with _open(path) as file:
         for line in file:
             line_ips = util.IP_PATTERN.findall(line)
             for ip in line_ips:
@@ -19,3 +123,286 @@ def read_ips(path):
                     ips[ip] += 1
 
     return ips
+
+
+def iter_ips(path, sketch=None, checkpoint=None):
+    """
+    Read a text file and yield each IP the first time it is seen.
+    Without a sketch, seen IPs are tracked exactly in a set. With a sketch (see sketch.IpSketch), memory stays flat
+    regardless of the input size; the sketch holds the distinct count and per-IP frequency estimates, and a false
+    positive of its Bloom filter can cause a new IP to be skipped (see sketch.BloomFilter).
+    :param path: the path to the text file
+    :param sketch: optional sketch to track IPs with
+    :param checkpoint: optional Checkpoint; only data added since it was last saved is read, and it is updated
+    """
+    seen = set()
+
+    for file_path in _expand_paths(path):
+        if checkpoint is None:
+            lines = _iter_lines(file_path)
+        else:
+            start = checkpoint.start(file_path)
+            if start is None:
+                continue
+            lines = _iter_lines(file_path, start)
+
+        end = yield from _filter_new_ips(lines, seen, sketch)
+
+        if checkpoint is not None:
+            checkpoint.update(file_path, end)
+
+
+def _filter_new_ips(lines, seen, sketch):
+    """
+    Yield the IPs in some lines that have not been seen before.
+    :param lines: generator of lines
+    :param seen: set of IPs seen so far; used when there is no sketch
+    :param sketch: optional sketch to track IPs with
+    :return: the return value of the lines generator
+    """
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration as e:
+            return e.value
+
+        for ip in util.IP_PATTERN.findall(line):
+            if sketch is not None:
+                if sketch.add(ip):
+                    yield ip
+            elif ip not in seen:
+                seen.add(ip)
+                yield ip
+
+
+def _iter_lines(path, start=None):
+    """
+    Yield the lines of a text file.
+    If a start offset is given, reading starts there and stops at the last complete line.
+    Compressed files are always read in full.
+    :param path: the path to the text file
+    :param start: optional byte offset to start reading at
+    :return: the byte offset reading stopped at
+    """
+    if start is None or _get_opener(path) is not open:
+        with _open(path) as file:
+            yield from file
+        return os.path.getsize(path)
+
+    offset = start
+
+    with open(path, 'rb') as file:
+        file.seek(start)
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            yield line.decode()
+
+    return offset
+
+
+class Checkpoint:
+    """
+    Remembers how far each input file has been read, so the next run only reads new data.
+    A file is identified by its path and fingerprinted by its inode and size; if the inode changes or the file
+    shrinks (e.g. it was rotated or truncated), it is read from the start again. Compressed files cannot be resumed,
+    so they are either skipped (unchanged) or read in full.
+    Updates are only kept in memory until save() is called, which should happen once the data has been processed.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+
+        if self.path.exists():
+            with self.path.open() as file:
+                self.files = json.load(file)
+
+    def start(self, path):
+        """
+        Get the byte offset to start reading a file at.
+        :param path:
+        :return: the offset, or None if the file is compressed and has not changed
+        """
+        stat = os.stat(path)
+        entry = self.files.get(os.path.abspath(path))
+
+        if entry is None or entry['inode'] != stat.st_ino or stat.st_size < entry['size']:
+            return 0
+
+        if _get_opener(path) is not open:
+            return None if stat.st_size == entry['size'] else 0
+
+        return entry['offset']
+
+    def update(self, path, offset):
+        """
+        Record how far a file has been read.
+        :param path:
+        :param offset: byte offset reading stopped at
+        :return: None
+        """
+        stat = os.stat(path)
+        self.files[os.path.abspath(path)] = {'inode': stat.st_ino, 'size': stat.st_size, 'offset': offset}
+
+    def save(self):
+        """
+        Write the checkpoint to disk.
+        :return: None
+        """
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+
+        with temp_path.open('w') as file:
+            json.dump(self.files, file)
+
+        os.replace(str(temp_path), str(self.path))
+
+
+def _expand_paths(path):
+    """
+    Expand a path into the files it refers to.
+    :param path: a file, a directory (its files are used) or a glob pattern
+    :return: sorted list of file paths
+    """
+    path = str(Path(path))
+
+    if os.path.isdir(path):
+        return sorted(str(p) for p in Path(path).iterdir() if p.is_file())
+
+    if glob.has_magic(path):
+        paths = sorted(p for p in glob.glob(path) if os.path.isfile(p))
+        if not paths:
+            raise FileNotFoundError(f'No files match {path}')
+        return paths
+
+    return [path]
+
+
+def _get_opener(path):
+    """
+    Detect whether a file is compressed by looking at its magic bytes.
+    :param path:
+    :return: the function to open the file with
+    """
+    with open(path, 'rb') as file:
+        magic = file.read(6)
+
+    for prefix, opener in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return opener
+
+    return open
+
+
+def _open(path):
+    """
+    Open a file as text, decompressing it as a stream if it is compressed.
+    :param path:
+    :return: the open file
+    """
+    return _get_opener(path)(path, 'rt')
+
+
+def _read_ips_parallel(path, workers, start=0, end=None, packed=False):
+    """
+    Memory-map a file, split it into line-aligned chunks, and count the IPs in each chunk on a process pool.
+    The partial counts are merged in chunk order, so the result is the same as reading the file line by line.
+    :param path: the path to the text file
+    :param workers: number of processes to scan the file with
+    :param start: byte offset to start reading at
+    :param end: byte offset to stop reading at; defaults to the end of the file
+    :param packed: count IPs in a PackedCounter
+    :return: dictionary (or PackedCounter) of IPs and their counts
+    """
+    if end is None:
+        end = os.path.getsize(path)
+
+    if start >= end:
+        return packed_counter.PackedCounter() if packed else {}
+
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = end - start
+            num_chunks = min(max(workers, -(-size // MAX_CHUNK_SIZE)), -(-size // MIN_CHUNK_SIZE))
+            chunks = _split_chunks(mm, start, end, num_chunks)
+
+    scan = partial(_count_chunk, path, packed=packed)
+    ips = _new_counter(packed)
+
+    if len(chunks) == 1:
+        ips.update(scan(chunks[0]))
+    else:
+        with Pool(min(workers, len(chunks))) as pool:
+            # merged as they arrive (in chunk order), rather than holding the counts of every chunk at once
+            for counts in pool.imap(scan, chunks):
+                ips.update(counts)
+
+    return ips if packed else dict(ips)
+
+
+def _split_chunks(mm, start, end, num_chunks):
+    """
+    Split a byte range of a memory-mapped file into roughly equal chunks that start and end on line boundaries.
+    :param mm: the memory-mapped file
+    :param start: byte offset of the start of the range; must be the start of a line
+    :param end: byte offset of the end of the range
+    :param num_chunks: desired number of chunks
+    :return: list of (start, end) byte offsets
+    """
+    chunks = []
+    chunk_start = start
+
+    for i in range(1, num_chunks + 1):
+        if chunk_start >= end:
+            break
+
+        if i == num_chunks:
+            chunk_end = end
+        else:
+            newline = mm.find(b'\n', max(chunk_start, start + (end - start) * i // num_chunks), end)
+            chunk_end = end if newline == -1 else newline + 1
+
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+
+    return chunks
+
+
+def _last_line_end(path, size):
+    """
+    Find the end of the last complete line of a file.
+    :param path: the path to the text file
+    :param size: size of the file
+    :return: byte offset just past the last newline, or 0 if there is none
+    """
+    if size == 0:
+        return 0
+
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.rfind(b'\n', 0, size) + 1
+
+
+def _count_chunk(path, chunk, packed=False):
+    """
+    Count the IPs in a byte range of a file.
+    :param path: the path to the text file
+    :param chunk: (start, end) byte offsets
+    :param packed: count IPs in a PackedCounter
+    :return: Counter of IPs in the chunk, in order of first appearance (or a PackedCounter)
+    """
+    start, end = chunk
+    ips = _new_counter(packed)
+
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # counted as they are matched, so only the counts are held in memory
+            matches = (match.group().decode('ascii') for match in util.IP_BYTES_PATTERN.finditer(mm, start, end))
+
+            if packed:
+                for ip in matches:
+                    ips.add(ip)
+            else:
+                ips.update(matches)
+
+    return ips
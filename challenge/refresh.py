@@ -0,0 +1,117 @@
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from challenge import rdap, upstream, util, warehouse
+
+
+def refresh(wh, rdap_upstream=None, concurrency=10, bootstrap=None):
+    """
+    Refresh the networks in the rdap index. Each is revalidated with a conditional request (see rdap.revalidate), so a
+    network that has not changed costs a header exchange; only the changed ones are downloaded, parsed and rewritten,
+    along with their entities, and the IPs in them are linked to their current entities in the ip_rdap index.
+    Networks the registries no longer know are kept.
+    :param wh: the warehouse
+    :param rdap_upstream: optional upstream to make RDAP requests with
+    :param concurrency: number of requests in flight
+    :param bootstrap: optional rdap.Bootstrap to send RDAP queries straight to the registry responsible for each network
+    :return: dictionary of the number of networks unchanged, changed, gone and failed, of rdap events replaced and
+    added, and of ip_rdap events linked and unlinked
+    """
+    roots = [event for event in wh.read('rdap')
+             if event.get('class') == 'root' and 'startAddress' in event and 'endAddress' in event]
+    entities = rdap.EntityCache()
+
+    def revalidate(root):
+        try:
+            return rdap.revalidate(root, rdap_upstream, entities, bootstrap)
+        except Exception as e:
+            return 'failed', e
+
+    stats = {'unchanged': 0, 'changed': 0, 'gone': 0, 'failed': 0}
+    changed = {}
+    handles = {}
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for root, (status, data) in zip(roots, executor.map(revalidate, roots)):
+            stats[status] += 1
+
+            if status == 'changed':
+                handles[root['handle']] = [item['handle'] for item in data if 'handle' in item]
+
+                for item in data:
+                    if 'handle' in item:
+                        # entities can be shared between networks, and rewriting adds the index
+                        changed[item['handle']] = dict(item)
+
+    stats['replaced'], stats['added'], _ = wh.rewrite('rdap', changed.values()) if changed else (0, 0, 0)
+    stats['linked'], stats['unlinked'] = _relink(wh, handles) if handles else (0, 0)
+
+    return stats
+
+
+def _relink(wh, handles):
+    """
+    Link the IPs in some networks to the current handles of the networks in the ip_rdap index: IPs are linked to a
+    network and all of its entities, and the entities can change along with the network.
+    :param wh: the warehouse
+    :param handles: dictionary of the handles of networks and lists of their current handles (their own first)
+    :return: tuple of the number of ip_rdap events added and removed
+    """
+    key_func = util.get_key_func('ip_rdap')
+
+    # an IP is only ever linked to one network (and its entities)
+    networks = {event['ip']: event['handle'] for event in wh.read('ip_rdap') if event['handle'] in handles}
+
+    current = set()
+    for event in wh.read('ip_rdap'):
+        if event['ip'] in networks:
+            current.add(key_func(event))
+
+    links = {}
+    for ip, network in networks.items():
+        for handle in handles[network]:
+            link = {'ip': ip, 'handle': handle}
+            links[key_func(link)] = link
+
+    added = [link for key, link in links.items() if key not in current]
+    removed = current.difference(links)
+
+    if not added and not removed:
+        return 0, 0
+
+    _, num_added, num_removed = wh.rewrite('ip_rdap', added, removed)
+
+    return num_added, num_removed
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Refresh the networks in the rdap index, only downloading those that '
+                                                 'changed')
+    parser.add_argument('--data', default='data', help='warehouse directory (default: data)')
+    parser.add_argument('--concurrency', type=int, default=10, help='number of requests in flight (default: 10)')
+    parser.add_argument('--rdap-rate', type=float, default=None,
+                        help='maximum RDAP requests per second to each registry')
+    parser.add_argument('--rdap-bootstrap', default=None, metavar='PATH',
+                        help='send RDAP queries straight to the registry responsible for each network, using the '
+                             'IANA bootstrap file at PATH (downloaded there if it does not exist)')
+    args = parser.parse_args(args)
+
+    bootstrap = None
+    if args.rdap_bootstrap is not None:
+        bootstrap = rdap.Bootstrap.load(args.rdap_bootstrap)
+
+    rdap_upstream = upstream.UpstreamGroup('rdap', pool_size=args.concurrency, rate=args.rdap_rate)
+
+    try:
+        stats = refresh(warehouse.Warehouse(args.data), rdap_upstream, args.concurrency, bootstrap)
+    finally:
+        rdap_upstream.close()
+
+    print(f'{stats["unchanged"]} unchanged / {stats["changed"]} changed / {stats["gone"]} gone / '
+          f'{stats["failed"]} failed')
+    print(f'rdap\nreplaced: {stats["replaced"]}, added: {stats["added"]}')
+    print(f'ip_rdap\nadded: {stats["linked"]}, removed: {stats["unlinked"]}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
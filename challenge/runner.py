@@ -1,10 +1,12 @@
 import sys
+import time
 import argparse
+import itertools
 import lark
-import signal
-from multiprocessing import Pool, Manager
-from functools import partial
-from challenge import geoip, rdap, reader, warehouse, search
+from challenge import cache, enrich, geodb, geoip, journal, planner, progress, rdap, reader, stages, warehouse, search
+from challenge import rdap_import, sketch
+
+FLUSH_INTERVAL = 100
 
 
 class Challenge:
@@ -23,47 +25,87 @@ class Challenge:
         parser = argparse.ArgumentParser(description='Process IPs from a text file and/or query IP data')
         parser.add_argument('path', nargs='?', default=None)
         parser.add_argument('-v', '--verbose', action='store_true')
+        parser.add_argument('--read-workers', type=int, default=None,
+                            help='number of processes to scan the IP file with (memory-mapped)')
+        parser.add_argument('--stream', action='store_true',
+                            help='start retrieving data for IPs while the file is still being read')
+        parser.add_argument('--sketch', action='store_true',
+                            help='stream IPs and track them with fixed-memory sketches instead of exact counts')
+        parser.add_argument('--sketch-capacity', type=int, default=10000000,
+                            help='number of distinct IPs the sketch is sized for (default: 10000000)')
+        parser.add_argument('--sketch-error-rate', type=float, default=0.001,
+                            help='share of new IPs the sketch may mistake for seen ones, up to its capacity '
+                                 '(default: 0.001)')
+        parser.add_argument('--packed', action='store_true',
+                            help='count IPv4 addresses as packed ints to save memory on files with many distinct IPs')
+        parser.add_argument('--incremental', action='store_true',
+                            help='only read data added to the file(s) since the last incremental run')
+        parser.add_argument('--engine', choices=['pool', 'async'], default='pool',
+                            help='how to retrieve data: a pool of processes, or asyncio with pooled connections')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='number of lookups in flight (default: 4 for pool, 100 for async)')
+        parser.add_argument('--rdap-networks', action='store_true',
+                            help='skip RDAP lookups for IPs inside networks that are already known')
+        parser.add_argument('--geoip-batch-size', type=int, default=1,
+                            help=f'number of IPs per GeoIP request, using bulk lookups (max: {geoip.MAX_BATCH_SIZE})')
+        parser.add_argument('--geoip-fields', type=lambda s: s.split(','), default=None,
+                            help='comma-separated GeoIP fields to ask for, e.g. "main" (default: all)')
+        parser.add_argument('--no-plan', action='store_true',
+                            help='look up every IP, even those already in the warehouse and reserved addresses')
+        parser.add_argument('--cache', action='store_true',
+                            help='cache GeoIP and RDAP responses on disk and reuse them on later runs')
+        parser.add_argument('--cache-ttl', type=float, default=7 * 24,
+                            help='hours before a cached response expires (default: 168)')
+        parser.add_argument('--cache-size', type=int, default=512,
+                            help='size of the response cache in MB (default: 512)')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='number of times to retry a throttled or failed request (default: 3)')
+        parser.add_argument('--geoip-rate', type=float, default=None,
+                            help='maximum GeoIP requests per second (per process for the pool engine)')
+        parser.add_argument('--rdap-rate', type=float, default=None,
+                            help='maximum RDAP requests per second to each registry (per process for the pool engine)')
+        parser.add_argument('--rdap-bootstrap', default=None, metavar='PATH',
+                            help='send RDAP queries straight to the registry responsible for each IP, using the IANA '
+                                 'bootstrap file at PATH (downloaded there if it does not exist)')
+        parser.add_argument('--geoip-db', default=None, metavar='PATH',
+                            help='look up GeoIP data in a local CSV file of IP ranges instead of calling ipstack')
+        parser.add_argument('--geoip-prefix', type=int, default=None, metavar='LENGTH',
+                            help='only look up GeoIP data for one IP per prefix of this length (e.g. 24), and copy it '
+                                 'to the other IPs in the prefix')
+        parser.add_argument('--spill', action='store_true',
+                            help='have pool workers write results to files on disk, merged into the warehouse at the '
+                                 'end, instead of sending them back to the main process')
+        parser.add_argument('--max-lookups', type=int, default=None,
+                            help='look up at most this many IPs, the most frequent first')
+        parser.add_argument('--time-budget', type=float, default=None, metavar='SECONDS',
+                            help='stop looking up IPs after this many seconds, having done the most frequent first')
         return parser.parse_args(args)
 
     def read_data(self, path):
         """
         Read file, pull out IPs, retrieve GeoIP and RDAP info on them, and write data to disk.
         :param path: path of file containing IPs
-        :return: None
+        :return: the progress of the lookups (see progress.Progress)
         """
-        print('\nReading IPs from file...')
-        ips = reader.read_ips(path)
-        num_ips = len(ips)
-        print(f'{num_ips} IPs found.')
-
-        print('\nRetrieving GeoIP and RDAP data for IPs...')
-        print('0%')
-
-        with Manager() as manager:
-            original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-
-            pool = Pool(4)
-
-            signal.signal(signal.SIGINT, original_sigint_handler)
-
-            shared = manager.list([{'i': 0, 'p': 0, 'num': num_ips}])
-            retrieve = partial(self.retrieve_ip_data, shared)
-
-            try:
-                results = pool.map_async(retrieve, ips.keys())
-                results = results.get(3600)
-            except KeyboardInterrupt:
-                print('Terminating')
-                pool.terminate()
-                sys.exit(0)
-            else:
-                pool.close()
-
-            pool.join()
-
-        print('Done.')
-
-        print('Writing data to disk...')
+        ip_sketch = None
+        checkpoint = None
+
+        if self.args.incremental:
+            checkpoint = reader.Checkpoint(self.warehouse.state_path('checkpoints.json'))
+
+        if self.args.stream or self.args.sketch:
+            print('\nStreaming IPs from file...')
+            if self.args.sketch:
+                ip_sketch = sketch.IpSketch(capacity=self.args.sketch_capacity,
+                                            error_rate=self.args.sketch_error_rate)
+            ips = reader.iter_ips(path, sketch=ip_sketch, checkpoint=checkpoint)
+            num_ips = None
+        else:
+            print('\nReading IPs from file...')
+            ips = reader.read_ips(path, workers=self.args.read_workers, checkpoint=checkpoint,
+                                  packed=self.args.packed)
+            num_ips = len(ips)
+            print(f'{num_ips} IPs found.')
 
         write_stats = {
             'geoip': {
@@ -80,31 +122,162 @@ class Challenge:
             }
         }
 
-        with self.warehouse.open() as wh:
-            for result in results:
-                ip = result.pop('ip')
+        run_journal = journal.Journal(self.warehouse.state_path('journal.ndjson'))
 
-                for index, data in result.items():
-                    if not data:
-                        continue
+        spill_dir = self.warehouse.state_path('spill')
+
+        if run_journal.path.exists() or enrich.spill_segments(spill_dir):
+            with self.warehouse.open() as wh:
+                for result in run_journal.replay():
+                    self._write_result(wh, result, write_stats)
 
-                    if index == 'geoip':
-                        added = wh.write(index, data)
-                        if added:
-                            write_stats[index]['added'] += 1
-                        else:
-                            write_stats[index]['skipped'] += 1
-                    else:
-                        for item in data:
-                            if index == 'ip_rdap':
-                                added = wh.write(index, {'ip': ip, 'handle': item['handle']})
-                            else:
-                                added = wh.write(index, item)
-
-                            if added:
-                                write_stats[index]['added'] += 1
-                            else:
-                                write_stats[index]['skipped'] += 1
+            run_journal.completed.update(self._merge_spill(spill_dir, write_stats))
+
+            print(f'Resuming: {len(run_journal.completed)} IPs were completed by an interrupted run.')
+
+        # when the whole file was read, IPs stay in their counter (packed with --packed) through planning and
+        # ordering, and are only turned into a sequence of strings as they are dispatched
+        ip_planner = None
+        if not self.args.no_plan:
+            ip_planner = planner.Planner(self.warehouse)
+
+            if num_ips is None:
+                ips = ip_planner.filter(ips)
+            else:
+                ips = ip_planner.exclude(ips)
+                num_ips = len(ips)
+                print(ip_planner.summary())
+
+        if run_journal.completed:
+            if num_ips is None:
+                ips = run_journal.filter(ips)
+            else:
+                ips = run_journal.exclude(ips)
+                num_ips = len(ips)
+
+        if num_ips is not None:
+            ips = planner.prioritize(ips)
+
+        # what is left of the IPs after the first `max_lookups`, to tell whether the run was cut short
+        unlimited_ips = None
+        if self.args.max_lookups is not None:
+            unlimited_ips = iter(ips)
+            ips = itertools.islice(unlimited_ips, self.args.max_lookups)
+
+            if num_ips is not None:
+                num_ips = min(num_ips, self.args.max_lookups)
+
+        if num_ips is None:
+            # read and plan on their own thread while the IPs found so far are looked up
+            ips = stages.prefetch(ips)
+
+        print('\nRetrieving GeoIP and RDAP data for IPs...')
+
+        networks = None
+        if self.args.rdap_networks:
+            ranges = None
+            ranges_path = self.warehouse.state_path(rdap_import.RANGES_STATE)
+            if ranges_path.exists():
+                ranges = rdap.RangeTable.load(ranges_path)
+
+            networks = rdap.NetworkCache.from_warehouse(self.warehouse, ranges)
+
+        response_cache = None
+        if self.args.cache:
+            response_cache = cache.ResponseCache(self.warehouse.state_path('http_cache.sqlite'),
+                                                 ttl=self.args.cache_ttl * 60 * 60,
+                                                 max_size=self.args.cache_size * 1024 * 1024)
+
+        bootstrap = None
+        if self.args.rdap_bootstrap is not None:
+            bootstrap = rdap.Bootstrap.load(self.args.rdap_bootstrap)
+
+        geoip_database = None
+        if self.args.geoip_db is not None:
+            geoip_database = geodb.GeoDatabase.load(self.args.geoip_db)
+            print(f'{len(geoip_database)} GeoIP ranges loaded.')
+
+        engine = enrich.create_engine(self.args.engine, self.args.concurrency, networks=networks,
+                                      cache=response_cache, batch_size=self.args.geoip_batch_size,
+                                      geoip_fields=self.args.geoip_fields, retries=self.args.retries,
+                                      geoip_rate=self.args.geoip_rate, rdap_rate=self.args.rdap_rate,
+                                      bootstrap=bootstrap, spill_dir=str(spill_dir) if self.args.spill else None,
+                                      geoip_database=geoip_database, geoip_prefix_length=self.args.geoip_prefix)
+
+        run_progress = progress.Progress(num_ips)
+        num_results = 0
+        failed = 0
+        out_of_time = False
+
+        deadline = None
+        if self.args.time_budget is not None:
+            deadline = time.monotonic() + self.args.time_budget
+
+        try:
+            with self.warehouse.open() as wh:
+                # results are written on their own thread, so that writing does not hold up the lookups
+                written = itertools.count(1)
+
+                def store(result):
+                    if not result['errors']:
+                        run_journal.append(result)
+
+                    self._write_result(wh, result, write_stats)
+
+                    if next(written) % FLUSH_INTERVAL == 0:
+                        wh.flush()
+
+                writer = stages.Stage(store)
+
+                try:
+                    for result in engine.run(ips, run_progress):
+                        num_results += 1
+                        if result['errors']:
+                            failed += 1
+                            if self.args.verbose:
+                                for error in result['errors']:
+                                    print(f'{result["ip"]}: {error}')
+
+                        # spilled results are merged once the lookups are done
+                        if not result.get('spilled'):
+                            writer.put(result)
+
+                        # stopping the engine drops the lookups in flight; they are done again on the next run
+                        if deadline is not None and time.monotonic() >= deadline:
+                            out_of_time = True
+                            break
+                finally:
+                    writer.close()
+        except KeyboardInterrupt:
+            print('Terminating')
+            sys.exit(0)
+        finally:
+            engine.enricher.close()
+            run_journal.close()
+
+        self._merge_spill(spill_dir, write_stats)
+        run_journal.clear()
+        run_progress.finish()
+        print('Done.')
+
+        if ip_planner is not None and num_ips is None:
+            print(ip_planner.summary())
+
+        if response_cache is not None:
+            response_cache.evict()
+            response_cache.close()
+
+        if ip_sketch is not None:
+            print(f'~{ip_sketch.num_distinct()} distinct IPs (estimated).')
+        elif num_ips is None:
+            print(f'{num_results} IPs found.')
+
+        truncated = unlimited_ips is not None and not out_of_time and next(unlimited_ips, None) is not None
+
+        # the checkpoint only moves past IPs that have all been looked up, so that failed ones and those left out of a
+        # run that was cut short are read again
+        if checkpoint is not None and not failed and not truncated and not out_of_time:
+            checkpoint.save()
 
         for index, stats in write_stats.items():
             print(f'\n{index}')
@@ -112,71 +285,73 @@ class Challenge:
             skipped = stats['skipped']
             print(f'added: {added}, skipped: {skipped}')
 
-    @staticmethod
-    def retrieve_ip_data(shared, ip):
-        result = {
-            'ip': ip,
-            'geoip': None,
-            'rdap': [],
-            'ip_rdap': []
-        }
+        if failed:
+            print(f'\n{failed} IPs had failed lookups; they will be retried on the next run.')
 
-        geo_ip_info = geoip.get(ip)
+        if truncated:
+            print(f'\nStopped after {self.args.max_lookups} lookups; the remaining IPs will be looked up on the next '
+                  f'run.')
 
-        if geo_ip_info:
-            result['geoip'] = geo_ip_info
+        if out_of_time:
+            remaining = f' {num_ips - num_results}' if num_ips is not None else ''
+            print(f'\nRan out of time; the{remaining} remaining IPs will be looked up on the next run.')
 
-            '''
-            index = 'geoip'
-            added = wh.write(index, geo_ip_info)
-            if added:
-                write_stats[index]['added'] += 1
-            else:
-                write_stats[index]['skipped'] += 1
-            '''
+        return run_progress
 
-        rdap_info = rdap.get(ip)
+    def _merge_spill(self, spill_dir, write_stats):
+        """
+        Write the results spilled by pool workers (see enrich.PoolEngine) to the warehouse in one streaming pass, then
+        delete the segments. Data already in the warehouse (e.g. RDAP entities shared by many IPs) is skipped.
+        :param spill_dir: directory of spill segments
+        :param write_stats: counts of added and skipped events by index, updated in place
+        :return: set of the IPs merged
+        """
+        segments = enrich.spill_segments(spill_dir)
+        ips = set()
 
-        if rdap_info:
-            for datum in rdap_info:
-                if 'handle' not in datum:
-                    continue
+        if not segments:
+            return ips
 
-                result['rdap'].append(datum)
+        with self.warehouse.open() as wh:
+            for segment in segments:
+                for result in segment.replay():
+                    self._write_result(wh, result, write_stats)
 
-                '''
-                index = 'rdap'
-                added = wh.write(index, datum)
-                if added:
-                    write_stats[index]['added'] += 1
-                else:
-                    write_stats[index]['skipped'] += 1
-                '''
+                ips.update(segment.completed)
+
+        for segment in segments:
+            segment.clear()
 
-                result['ip_rdap'].append({'ip': ip, 'handle': datum['handle']})
+        return ips
 
-                '''
-                index = 'ip_rdap'
-                added = wh.write(index, {'ip': ip, 'handle': datum['handle']})
-                if added:
+    @staticmethod
+    def _write_result(wh, result, write_stats):
+        """
+        Write the data retrieved for an IP to the warehouse.
+        :param wh: the open warehouse
+        :param result: the result of enrich.retrieve_ip_data
+        :param write_stats: counts of added and skipped events by index, updated in place
+        :return: None
+        """
+        for index in enrich.INDICES:
+            data = result[index]
+            if not data:
+                continue
+
+            if index == 'geoip':
+                data = [data]
+
+            for item in data:
+                if index == 'ip_rdap':
+                    item = {'ip': result['ip'], 'handle': item['handle']}
+                elif index == 'rdap':
+                    # entities can be shared between results (see rdap.EntityCache), and writing adds the index
+                    item = dict(item)
+
+                if wh.write(index, item):
                     write_stats[index]['added'] += 1
                 else:
                     write_stats[index]['skipped'] += 1
-                '''
-
-        d = shared[0]
-
-        d['i'] += 1
-
-        new_p = round(d['i'] / d['num'] * 100)
-
-        if new_p != d['p']:
-            print(f'{new_p}%')
-            d['p'] = new_p
-
-        shared[0] = d
-
-        return result
 
     def input_loop(self):
         """
@@ -18,7 +18,7 @@ def query(query_str, wh, verbose=False):
 
     pipeline = Pipeline.create_pipeline(query_str, verbose)
 
-    files = wh.path.glob('*')
+    files = wh.index_paths()
     joined_files = [file_path.open() for file_path in files]
     data_in = chain(*joined_files)
 
@@ -0,0 +1,199 @@
+import math
+from array import array
+from hashlib import blake2b
+
+
+def _hash(item, size=8):
+    """
+    Hash a string to an int. Unlike hash(), this is stable across processes.
+    :param item:
+    :param size: digest size in bytes
+    :return: the hash
+    """
+    return int.from_bytes(blake2b(item.encode(), digest_size=size).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct items seen using a fixed amount of memory (2^precision bytes).
+    """
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 16:
+            raise Exception(f'Precision must be between 4 and 16. Precision: {precision}')
+
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, item):
+        """
+        Add an item to the estimate.
+        :param item:
+        :return: None
+        """
+        h = _hash(item)
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Merge another HyperLogLog of the same precision into this one.
+        :param other:
+        :return: None
+        """
+        if other.precision != self.precision:
+            raise Exception('Cannot merge HyperLogLogs of different precision')
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        """
+        Estimate the number of distinct items seen.
+        :return: the estimate
+        """
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return round(estimate)
+
+
+class CountMinSketch:
+    """
+    Estimates item frequencies using a fixed amount of memory (width * depth counters).
+    Estimates are never lower than the true count.
+    """
+    def __init__(self, width=1 << 16, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', [0]) * width for _ in range(depth)]
+
+    def _indices(self, item):
+        """
+        Derive one counter index per row from a single hash (double hashing).
+        :param item:
+        :return: list of indices
+        """
+        h = _hash(item, size=16)
+        h1 = h >> 64
+        h2 = h & 0xffffffffffffffff
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        """
+        Add an item. Uses conservative update: only the counters at the current minimum are raised.
+        :param item:
+        :param count:
+        :return: the new estimate for the item
+        """
+        indices = self._indices(item)
+        estimate = min(row[i] for row, i in zip(self.rows, indices)) + count
+
+        for row, i in zip(self.rows, indices):
+            if row[i] < estimate:
+                row[i] = estimate
+
+        return estimate
+
+    def estimate(self, item):
+        """
+        Estimate how many times an item was added.
+        :param item:
+        :return: the estimate
+        """
+        return min(row[i] for row, i in zip(self.rows, self._indices(item)))
+
+
+class BloomFilter:
+    """
+    Tracks set membership using a fixed amount of memory, sized for a number of items and a false positive rate.
+    An item that was added is always reported as present; one that was not is reported as present with (up to
+    capacity) about error_rate probability.
+    """
+    def __init__(self, capacity=10000000, error_rate=0.001):
+        if capacity < 1:
+            raise Exception(f'Capacity must be at least 1. Capacity: {capacity}')
+
+        if not 0 < error_rate < 1:
+            raise Exception(f'Error rate must be between 0 and 1. Error rate: {error_rate}')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _indices(self, item):
+        """
+        Derive the bit indices of an item from a single hash (double hashing).
+        :param item:
+        :return: list of indices
+        """
+        h = _hash(item, size=16)
+        h1 = h >> 64
+        h2 = h & 0xffffffffffffffff
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """
+        Add an item.
+        :param item:
+        :return: True if the item was not present before, False if it (probably) was
+        """
+        added = False
+
+        for i in self._indices(item):
+            mask = 1 << (i & 7)
+            if not self.bits[i >> 3] & mask:
+                self.bits[i >> 3] |= mask
+                added = True
+
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in self._indices(item))
+
+
+class IpSketch:
+    """
+    Tracks IPs approximately: a Bloom filter for the IPs seen, a HyperLogLog for the distinct count and a count-min
+    sketch for frequencies.
+    """
+    def __init__(self, precision=14, width=1 << 16, depth=4, capacity=10000000, error_rate=0.001):
+        self.seen = BloomFilter(capacity, error_rate)
+        self.distinct = HyperLogLog(precision)
+        self.counts = CountMinSketch(width, depth)
+
+    def add(self, ip):
+        """
+        Add an IP.
+        An IP is reported as new when the Bloom filter had never seen it. A false positive can make a new IP look
+        seen (about error_rate of them while there are fewer distinct IPs than the capacity), but a seen IP is never
+        reported as new.
+        :param ip:
+        :return: True if this is the first time the IP was seen, False otherwise
+        """
+        self.distinct.add(ip)
+        self.counts.add(ip)
+        return self.seen.add(ip)
+
+    def count(self, ip):
+        """
+        :param ip:
+        :return: the estimated number of times the IP was seen
+        """
+        return self.counts.estimate(ip)
+
+    def num_distinct(self):
+        """
+        :return: the estimated number of distinct IPs seen
+        """
+        return self.distinct.count()
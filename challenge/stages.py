@@ -0,0 +1,119 @@
+import queue
+import threading
+
+QUEUE_SIZE = 1000
+
+_END = object()
+
+
+class _Error:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    """
+    Put an item on a queue, waiting for room unless the stage is stopped.
+    :return: True if the item was put, False if the stage was stopped
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+
+def prefetch(iterable, size=QUEUE_SIZE):
+    """
+    Run an iterable (e.g. reading and planning IPs) on a background thread, handing its items over through a queue of
+    at most `size` items. The stage consuming them can work on one while the next are produced, and a slow consumer
+    holds back the producer rather than letting items pile up in memory.
+    An exception in the producer is raised in the consumer. Closing the generator stops the producer, and closes the
+    iterable if it can be closed.
+    :param iterable:
+    :param size: maximum number of items produced ahead of the consumer
+    :return: generator of the items
+    """
+    q = queue.Queue(size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(q, item, stop):
+                    return
+            end = _END
+        except BaseException as e:
+            end = _Error(e)
+        finally:
+            # e.g. a generator reading a file, which then closes it
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+        _put(q, end, stop)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    try:
+        while True:
+            item = q.get()
+
+            if item is _END:
+                return
+            if isinstance(item, _Error):
+                raise item.error
+
+            yield item
+    finally:
+        stop.set()
+
+
+class Stage:
+    """
+    Calls a function on each item put on it (e.g. writing results), on a background thread, through a queue of at most
+    `size` items. put() waits while the queue is full, so a slow stage holds back the stages feeding it.
+    An exception in the function stops the stage and is raised by the next put() or by close().
+    """
+    def __init__(self, func, size=QUEUE_SIZE):
+        self.func = func
+        self.queue = queue.Queue(size)
+        self.stop = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+
+            try:
+                self.func(item)
+            except BaseException as e:
+                self.error = e
+                self.stop.set()
+                return
+
+    def put(self, item):
+        """
+        Hand an item to the stage, waiting while its queue is full.
+        :param item:
+        :return: None
+        """
+        if not _put(self.queue, item, self.stop):
+            raise self.error
+
+    def close(self):
+        """
+        Wait for the items already put to be processed, and stop the stage.
+        :return: None
+        """
+        _put(self.queue, _END, self.stop)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,483 @@
+import time
+import random
+import threading
+import requests
+from collections import deque
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+CACHEABLE_STATUSES = (200, 404)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+
+class UpstreamError(Exception):
+    """
+    Raised when a request to an upstream cannot be made: its retries ran out or its circuit breaker is open.
+    """
+    pass
+
+
+class _Locked:
+    """
+    Base for objects guarded by a lock that can still be pickled (e.g. to send to worker processes).
+    """
+    def __init__(self):
+        self._lock = threading.Condition()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Condition()
+
+
+class TokenBucket(_Locked):
+    """
+    Limits requests to `rate` per second, allowing bursts of up to `burst` requests.
+    """
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AimdLimiter(_Locked):
+    """
+    Limits the number of requests in flight, adapting the limit by additive increase/multiplicative decrease: the limit
+    goes up by one after `limit` successful requests in a row, and is halved when the upstream throttles.
+    Use as a context manager around each request.
+    """
+    def __init__(self, maximum, initial=None, minimum=1):
+        super().__init__()
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = min(maximum, initial or max(minimum, maximum // 4))
+        self.in_flight = 0
+        self.successes = 0
+
+    def __enter__(self):
+        with self._lock:
+            while self.in_flight >= self.limit:
+                self._lock.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *args):
+        with self._lock:
+            self.in_flight -= 1
+            self._lock.notify_all()
+
+    def on_success(self):
+        """
+        Record a successful request.
+        :return: None
+        """
+        with self._lock:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self._lock.notify_all()
+
+    def on_throttle(self):
+        """
+        Record that the upstream throttled a request.
+        :return: None
+        """
+        with self._lock:
+            self.limit = max(self.minimum, self.limit // 2)
+            self.successes = 0
+
+
+class CircuitBreaker(_Locked):
+    """
+    Stops requests to an upstream that keeps failing.
+    After `threshold` failures in a row the circuit opens and requests are refused. After `reset_timeout` seconds one
+    trial request is let through; if it succeeds (or is throttled, which shows the upstream is up) the circuit closes
+    again, if it fails it stays open for another `reset_timeout`.
+    """
+    def __init__(self, threshold=5, reset_timeout=30):
+        super().__init__()
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    def allow(self):
+        """
+        :return: True if a request may be made, False if the circuit is open
+        """
+        with self._lock:
+            if self.opened is None:
+                return True
+
+            if not self.trial and time.monotonic() - self.opened >= self.reset_timeout:
+                self.trial = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def record_throttle(self):
+        """
+        Record a throttled request. Throttling is not a failure, but it ends a trial request: the upstream answered.
+        :return: None
+        """
+        with self._lock:
+            if self.trial:
+                self.failures = 0
+                self.opened = None
+                self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+                self.trial = False
+
+
+def parse_json(response):
+    """
+    Parse the JSON body of a response.
+    A body that is not JSON (e.g. an HTML error page sent with a 200) raises an UpstreamError, so that the lookup fails
+    like any other failed request instead of ending the run.
+    :param response:
+    :return: the data
+    """
+    try:
+        return response.json()
+    except ValueError as e:
+        raise UpstreamError(f'Response is not JSON: {e}')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(_Locked):
+    """
+    Coalesces concurrent calls with the same key: the first caller makes the call, and callers that arrive while it
+    is in flight wait for it and share its result (or its exception) instead of making their own.
+    Only coalesces within a process; calls in flight are not pickled.
+    """
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['calls'] = {}
+        return state
+
+    def do(self, key, func):
+        """
+        Call a function, or wait for the call in flight with the same key.
+        :param key:
+        :param func: function to call, without arguments
+        :return: tuple of the result and whether it was shared from another caller's call
+        """
+        with self._lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result, False
+
+
+class Upstream:
+    """
+    A connection to an upstream API host (ipstack, ARIN, etc.).
+    Requests share a persistent session, so connections are kept alive and reused instead of doing a new TCP/TLS
+    handshake per lookup. If a cache.ResponseCache is given, it is consulted before going to the network.
+
+    Requests are paced by an optional token bucket of `rate` per second, and the number in flight is limited by an
+    AimdLimiter that ramps up to `pool_size` and backs off when the upstream throttles (429/503). Throttled, failed
+    (5xx) and timed out requests are retried up to `retries` times with jittered exponential backoff, or after
+    Retry-After if the upstream sent it. A CircuitBreaker stops requests to an upstream that keeps failing.
+    Concurrent requests for the same URL share one request (see SingleFlight).
+
+    Some APIs report errors in successful responses (e.g. ipstack's `{"success": false}` for an invalid key or a used
+    up quota), so whether a response is cached can be narrowed with a `cacheable` function of the response.
+
+    Upstreams can be pickled (e.g. to send to worker processes); each process creates its own session on first use.
+    """
+    def __init__(self, name, pool_size=10, cache=None, rate=None, retries=3, timeout=30, backoff=0.5,
+                 max_backoff=30, cacheable=None):
+        self.name = name
+        self.pool_size = pool_size
+        self.cache = cache
+        self.cacheable = cacheable
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate) if rate else None
+        self.limiter = AimdLimiter(pool_size)
+        self.breaker = CircuitBreaker()
+        self.samples = deque()
+        self.flights = SingleFlight()
+        self._session = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_session'] = None
+        return state
+
+    @property
+    def session(self):
+        if self._session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self._session = requests.Session()
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
+
+    def get(self, url, headers=None):
+        """
+        Perform a GET request, or serve it from the cache.
+        Successful and not found responses are cached, unless the cacheable function (when set) says otherwise.
+        Requests with headers (e.g. conditional requests) are neither served from nor stored in the cache, as the cache
+        does not vary by header.
+        :param url:
+        :param headers: optional dictionary of request headers
+        :return: the response
+        """
+        started = time.monotonic()
+        cache = self.cache if not headers else None
+
+        if cache is not None:
+            cached = cache.get(url)
+            if cached is not None:
+                self.samples.append((time.monotonic() - started, True))
+                return cached
+
+        key = url if not headers else (url, tuple(sorted(headers.items())))
+        response, shared = self.flights.do(key, lambda: self._get(url, headers))
+
+        if not shared:
+            self.samples.append((time.monotonic() - started, False))
+
+            if cache is not None and response.status_code in CACHEABLE_STATUSES and \
+                    (self.cacheable is None or self.cacheable(response)):
+                cache.put(url, response.status_code, response.text)
+
+        return response
+
+    def drain_samples(self):
+        """
+        Take the samples of the requests made since the last call.
+        :return: list of (seconds, from cache) tuples
+        """
+        samples = []
+
+        try:
+            while True:
+                samples.append(self.samples.popleft())
+        except IndexError:
+            pass
+
+        return samples
+
+    def _get(self, url, headers=None):
+        """
+        Perform a GET request, rate limited and retried.
+        :param url:
+        :param headers: optional dictionary of request headers
+        :return: the response
+        """
+        error = None
+
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise UpstreamError(f'{self.name}: circuit open after repeated failures')
+
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+            response = None
+            with self.limiter:
+                try:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                except requests.RequestException as e:
+                    # connection errors, timeouts, truncated bodies, etc.
+                    error = e
+                except BaseException:
+                    # the outcome must be recorded, or a trial request would leave the circuit open for good
+                    self.breaker.record_failure()
+                    raise
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                self.limiter.on_success()
+                self.breaker.record_success()
+                return response
+
+            if response is not None:
+                error = f'HTTP {response.status_code}'
+                if response.status_code in THROTTLE_STATUSES:
+                    self.limiter.on_throttle()
+
+            # a 429 means the host is up but wants us to slow down, which the limiter takes care of
+            if response is not None and response.status_code == 429:
+                self.breaker.record_throttle()
+            else:
+                self.breaker.record_failure()
+
+            if attempt < self.retries:
+                time.sleep(self._backoff_delay(attempt, response))
+
+        raise UpstreamError(f'{self.name}: request failed after {self.retries + 1} attempts: {error}')
+
+    def _backoff_delay(self, attempt, response):
+        """
+        How long to wait before retrying: Retry-After if the upstream sent it, otherwise exponential backoff with full
+        jitter so that workers do not retry in lockstep.
+        :param attempt: number of the failed attempt, from 0
+        :param response: the failed response, if there was one
+        :return: seconds to wait
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None:
+                try:
+                    return min(self.max_backoff, float(retry_after))
+                except ValueError:
+                    pass
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def close(self):
+        """
+        Close the session and its pooled connections, and the cache's connection.
+        :return: None
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+        if self.cache is not None:
+            self.cache.close()
+
+
+class UpstreamGroup:
+    """
+    Upstreams for a kind of lookup that is spread over several hosts (e.g. RDAP, over the five registries).
+    Requests are routed to an Upstream per host, created on first use, so each host gets its own connection pool,
+    rate limits and circuit breaker. Has the same interface as Upstream.
+    """
+    def __init__(self, name, **kwargs):
+        """
+        :param name:
+        :param kwargs: arguments for each host's Upstream (see Upstream)
+        """
+        self.name = name
+        self.kwargs = kwargs
+        self.upstreams = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def pool_size(self):
+        return self.kwargs.get('pool_size', 10)
+
+    def upstream(self, url):
+        """
+        :param url:
+        :return: the Upstream for the URL's host
+        """
+        host = urlsplit(url).netloc
+
+        with self._lock:
+            up = self.upstreams.get(host)
+            if up is None:
+                up = self.upstreams[host] = Upstream(f'{self.name} {host}', **self.kwargs)
+
+        return up
+
+    def get(self, url, headers=None):
+        """
+        Perform a GET request on the URL's host's Upstream.
+        :param url:
+        :param headers: optional dictionary of request headers
+        :return: the response
+        """
+        return self.upstream(url).get(url, headers)
+
+    def drain_samples(self):
+        """
+        Take the samples of the requests made since the last call, from every host.
+        :return: list of (seconds, from cache) tuples
+        """
+        samples = []
+
+        for up in list(self.upstreams.values()):
+            samples += up.drain_samples()
+
+        return samples
+
+    def close(self):
+        """
+        Close every host's Upstream.
+        :return: None
+        """
+        for up in list(self.upstreams.values()):
+            up.close()
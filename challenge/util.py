@@ -2,6 +2,7 @@ import re
 from challenge import geoip, rdap
 
 IP_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+IP_BYTES_PATTERN = re.compile(rb'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
 
 
 def verify_ip(val):
@@ -18,6 +19,37 @@ def verify_ip(val):
         raise Exception('Value does not seem to be an IPv4 address')
 
 
+def ip_to_int(ip):
+    """
+    Convert a dotted IPv4 address to an int.
+    Raise an exception if the value is not a valid IPv4 address.
+    :param ip:
+    :return: the address as an int
+    """
+    parts = ip.split('.')
+
+    if len(parts) != 4:
+        raise Exception('Value does not seem to be an IPv4 address')
+
+    n = 0
+    for part in parts:
+        octet = int(part)
+        if not 0 <= octet <= 255:
+            raise Exception('Value does not seem to be an IPv4 address')
+        n = n << 8 | octet
+
+    return n
+
+
+def int_to_ip(n):
+    """
+    Convert an int to a dotted IPv4 address.
+    :param n:
+    :return: the address
+    """
+    return f'{n >> 24}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'
+
+
 def get_key_func(index):
     """
     Get the key function for the specified index.
@@ -1,3 +1,4 @@
+import os
 import json
 import re
 from pathlib import Path
@@ -15,6 +16,62 @@ class Warehouse:
         self.open_files = {}
         self.opened = False
 
+    def index_paths(self):
+        """
+        Get the paths of the index files.
+        :return: generator of paths
+        """
+        return self.path.glob('*.json')
+
+    def state_path(self, name):
+        """
+        Get the path of a file for keeping run state (checkpoints, caches, etc.) next to the data.
+        State files are kept in a subdirectory so they are not mistaken for indices.
+        :param name: name of the state file
+        :return: the path
+        """
+        state_dir = self.path / 'state'
+        state_dir.mkdir(parents=True, exist_ok=True)
+        return state_dir / name
+
+    def read(self, index):
+        """
+        Read the events in an index.
+        Does not require the warehouse to be open.
+        :param index:
+        :return: generator of events
+        """
+        file_path = self.path / (index + '.json')
+
+        if not file_path.exists():
+            return
+
+        with file_path.open() as file:
+            for line in file:
+                yield json.loads(line)
+
+    def load_keys(self):
+        """
+        Read the keys of the events in each index from the data files.
+        :return: the keys, by index
+        """
+        for file_path in self.index_paths():
+            index = str(file_path.name).replace('.json', '')
+
+            key_func = util.get_key_func(index)
+
+            if index not in self.keys:
+                self.keys[index] = set()
+
+            with file_path.open() as file:
+                for line in file:
+                    event = json.loads(line)
+
+                    key = key_func(event)
+                    self.keys[index].add(key)
+
+        return self.keys
+
     @contextmanager
     def open(self):
         """
@@ -23,23 +80,10 @@ class Warehouse:
         self.path.mkdir(exist_ok=True)
 
         try:
-            files = self.path.glob('*')
-            for file_path in files:
-                index = str(file_path.name).replace('.json', '')
-
-                key_func = util.get_key_func(index)
+            self.load_keys()
 
-                if index not in self.keys:
-                    self.keys[index] = set()
-
-                with file_path.open() as file:
-                    for line in file:
-                        event = json.loads(line)
-
-                        key = key_func(event)
-                        self.keys[index].add(key)
-
-                self.open_files[index] = file_path.open('a')
+            for index in self.keys:
+                self.open_files[index] = (self.path / (index + '.json')).open('a')
 
             self.opened = True
 
@@ -54,6 +98,14 @@ class Warehouse:
 
             self.opened = False
 
+    def flush(self):
+        """
+        Flush written data to the index files, so it is on disk even if the run does not finish.
+        :return: None
+        """
+        for file in self.open_files.values():
+            file.flush()
+
     def write(self, index, data):
         """
         Write data to an index (file).
@@ -87,3 +139,49 @@ class Warehouse:
             return True
 
         return False
+
+    def rewrite(self, index, data, remove=()):
+        """
+        Replace the events in an index that have the same keys as some data, add the data whose keys are new, and
+        remove the events with some other keys.
+        The index is streamed into a temporary file that then replaces it, so it is never left half written.
+        The warehouse must not be open.
+        :param index:
+        :param data: iterable of dicts
+        :param remove: optional collection of the keys of events to remove
+        :return: tuple of the number of events replaced, added and removed
+        """
+        if self.opened:
+            raise Exception('Cannot rewrite an index while the warehouse is open!')
+
+        key_func = util.get_key_func(index)
+        pending = {key_func(datum): datum for datum in data}
+        replaced = 0
+        removed = 0
+
+        self.path.mkdir(exist_ok=True)
+        file_path = self.path / (index + '.json')
+        temp_path = self.path / (index + '.json.tmp')
+
+        with temp_path.open('w') as file:
+            for event in self.read(index):
+                key = key_func(event)
+                if key in remove:
+                    removed += 1
+                    continue
+
+                datum = pending.pop(key, None)
+                if datum is not None:
+                    event = datum
+                    replaced += 1
+
+                event['index'] = index
+                file.write(json.dumps(event) + '\n')
+
+            for datum in pending.values():
+                datum['index'] = index
+                file.write(json.dumps(datum) + '\n')
+
+        os.replace(str(temp_path), str(file_path))
+
+        return replaced, len(pending), removed
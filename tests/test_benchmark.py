@@ -0,0 +1,123 @@
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from challenge import benchmark, mockserver, planner
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestGenerateIps(unittest.TestCase):
+    def test(self):
+        ips = benchmark.generate_ips(100)
+
+        self.assertEqual(100, len(set(ips)))
+        self.assertFalse(any(planner.is_bogon(ip) for ip in ips))
+        self.assertEqual(ips, benchmark.generate_ips(100))
+
+
+class TestBenchmark(unittest.TestCase):
+    def test(self):
+        with mockserver.MockServer() as server:
+            results = benchmark.benchmark(['async'], 20, server, ['--concurrency', '4'])
+
+        self.assertEqual(1, len(results))
+        self.assertEqual('async', results[0]['engine'])
+        self.assertEqual(20, results[0]['ips'])
+        self.assertEqual(20, results[0]['stored'])
+        self.assertEqual(40, results[0]['requests'])
+        self.assertIsNotNone(results[0]['rdap_p99'])
+
+    def test_max_lookups(self):
+        with mockserver.MockServer() as server:
+            results = benchmark.benchmark(['async'], 20, server, ['--concurrency', '4', '--max-lookups', '5'])
+
+        self.assertEqual(5, results[0]['ips'])
+        self.assertEqual(5, results[0]['stored'])
+
+    def test_packed(self):
+        with mockserver.MockServer() as server:
+            results = benchmark.benchmark(['pool'], 20, server,
+                                          ['--concurrency', '2', '--packed', '--max-lookups', '5'])
+
+        self.assertEqual(5, results[0]['ips'])
+        self.assertEqual(5, results[0]['stored'])
+
+    def test_time_budget(self):
+        with mockserver.MockServer(latency=0.05) as server:
+            results = benchmark.benchmark(['async'], 200, server, ['--concurrency', '2', '--time-budget', '0.2'])
+
+        self.assertLess(results[0]['ips'], 200)
+        self.assertEqual(results[0]['ips'], results[0]['stored'])
+
+    def test_spill(self):
+        with mockserver.MockServer() as server:
+            results = benchmark.benchmark(['pool'], 20, server, ['--concurrency', '2', '--spill'])
+
+        self.assertEqual(20, results[0]['ips'])
+        self.assertEqual(20, results[0]['stored'])
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.server = mockserver.MockServer().start()
+        self.addCleanup(self.server.stop)
+
+        for patcher in (patch('challenge.geoip.GEO_IP_URL', self.server.geoip_url()),
+                        patch('challenge.rdap.RDAP_URL', self.server.rdap_url())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.ip_path = Path(self.temp_dir.name) / 'ips.txt'
+        self.ip_path.write_text('\n'.join(benchmark.generate_ips(3)) + '\n')
+        self.data_path = Path(self.temp_dir.name) / 'data'
+
+    def _run(self, *args):
+        _, run_progress = benchmark.run('async', self.ip_path, self.data_path,
+                                        ['--incremental', '--retries', '0'] + list(args))
+        return run_progress.done
+
+    def test(self):
+        self.assertEqual(3, self._run())
+        self.assertEqual(0, self._run())
+
+    def test_failed(self):
+        self.server.error_rate = 1.0
+        self.assertEqual(3, self._run())
+
+        self.server.error_rate = 0.0
+        self.assertEqual(3, self._run())
+        self.assertEqual(0, self._run())
+
+    def test_max_lookups(self):
+        self.assertEqual(1, self._run('--max-lookups', '1'))
+        self.assertEqual(3, self._run())
+        self.assertEqual(0, self._run())
+
+    def test_max_lookups_not_reached(self):
+        self.assertEqual(3, self._run('--max-lookups', '3'))
+        self.assertEqual(0, self._run())
+
+    def test_max_lookups_stream(self):
+        self.assertEqual(1, self._run('--stream', '--max-lookups', '1'))
+        self.assertEqual(3, self._run('--stream'))
+        self.assertEqual(0, self._run('--stream'))
+
+    def test_time_budget(self):
+        self.server.latency = 0.2
+        self.assertLess(self._run('--concurrency', '1', '--time-budget', '0.1'), 3)
+
+        self.server.latency = 0.0
+        self.assertEqual(3, self._run())
+
+    def test_time_budget_stream(self):
+        self.server.latency = 0.2
+        self.assertLess(self._run('--stream', '--concurrency', '1', '--time-budget', '0.1'), 3)
+
+        self.server.latency = 0.0
+        self.assertEqual(3, self._run('--stream'))
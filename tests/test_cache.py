@@ -0,0 +1,83 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+from unittest.mock import patch
+from challenge import cache
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_miss(self):
+        response_cache = cache.ResponseCache(self.path)
+
+        self.assertIsNone(response_cache.get('http://example.com/1'))
+        self.assertEqual({'hits': 0, 'misses': 1, 'ratio': 0.0}, response_cache.stats())
+
+    def test_hit(self):
+        response_cache = cache.ResponseCache(self.path)
+        response_cache.put('http://example.com/1', 200, '{"ip": "1.1.1.1"}')
+
+        response = response_cache.get('http://example.com/1')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'ip': '1.1.1.1'}, response.json())
+        self.assertTrue(response.from_cache)
+        self.assertEqual({'hits': 1, 'misses': 0, 'ratio': 1.0}, response_cache.stats())
+
+    def test_persistent(self):
+        response_cache = cache.ResponseCache(self.path)
+        response_cache.put('http://example.com/1', 404, '{}')
+        response_cache.close()
+
+        response = cache.ResponseCache(self.path).get('http://example.com/1')
+
+        self.assertEqual(404, response.status_code)
+
+    def test_expired(self):
+        response_cache = cache.ResponseCache(self.path, ttl=60)
+
+        with patch('time.time', return_value=1000):
+            response_cache.put('http://example.com/1', 200, '{}')
+
+        with patch('time.time', return_value=1050):
+            self.assertIsNotNone(response_cache.get('http://example.com/1'))
+
+        with patch('time.time', return_value=1061):
+            self.assertIsNone(response_cache.get('http://example.com/1'))
+
+    def test_evict(self):
+        response_cache = cache.ResponseCache(self.path, ttl=float('inf'), max_size=100)
+
+        with patch('time.time', return_value=1000):
+            response_cache.put('a', 200, 'x' * 49)
+        with patch('time.time', return_value=1001):
+            response_cache.put('b', 200, 'x' * 49)
+        with patch('time.time', return_value=1002):
+            response_cache.get('a')
+            response_cache.put('c', 200, 'x' * 49)
+
+        response_cache.evict()
+
+        self.assertIsNotNone(response_cache.get('a'))
+        self.assertIsNone(response_cache.get('b'))
+        self.assertIsNotNone(response_cache.get('c'))
+
+    def test_pickle(self):
+        response_cache = cache.ResponseCache(self.path)
+        response_cache.put('http://example.com/1', 200, '{}')
+
+        actual = pickle.loads(pickle.dumps(response_cache))
+
+        self.assertIsNotNone(actual.get('http://example.com/1'))
@@ -0,0 +1,453 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch, MagicMock
+from challenge import enrich, geodb, progress, rdap, stages, upstream
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestRetrieveIpData(unittest.TestCase):
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = {'ip': '1.1.1.1'}
+        mock_rdap.return_value = [{'handle': 'NET'}, {'name': 'no_handle'}, {'handle': 'POC'}]
+
+        expected = {
+            'ip': '1.1.1.1',
+            'geoip': {'ip': '1.1.1.1'},
+            'rdap': [{'handle': 'NET'}, {'handle': 'POC'}],
+            'ip_rdap': [{'ip': '1.1.1.1', 'handle': 'NET'}, {'ip': '1.1.1.1', 'handle': 'POC'}],
+            'errors': []
+        }
+        actual = enrich.retrieve_ip_data('1.1.1.1')
+
+        self.assertEqual(expected, actual)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_known_network(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = {'ip': '10.0.0.2'}
+
+        networks = rdap.NetworkCache()
+        networks.add_network('10.0.0.0', '10.0.0.255', 'NET', ['NET', 'POC'])
+
+        expected = {
+            'ip': '10.0.0.2',
+            'geoip': {'ip': '10.0.0.2'},
+            'rdap': [],
+            'ip_rdap': [{'ip': '10.0.0.2', 'handle': 'NET'}, {'ip': '10.0.0.2', 'handle': 'POC'}],
+            'errors': []
+        }
+        actual = enrich.retrieve_ip_data('10.0.0.2', networks=networks)
+
+        self.assertEqual(expected, actual)
+        mock_rdap.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_network_learned(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = [
+            {'class': 'root', 'handle': 'NET', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.255'},
+            {'class': 'child', 'handle': 'POC'}
+        ]
+
+        networks = rdap.NetworkCache()
+
+        enrich.retrieve_ip_data('10.0.0.1', networks=networks)
+        actual = enrich.retrieve_ip_data('10.0.0.2', networks=networks)
+
+        self.assertEqual([{'ip': '10.0.0.2', 'handle': 'NET'}, {'ip': '10.0.0.2', 'handle': 'POC'}], actual['ip_rdap'])
+        self.assertEqual(1, mock_rdap.call_count)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_invalid_ip_with_networks(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = None
+
+        actual = enrich.retrieve_ip_data('300.1.2.3', networks=rdap.NetworkCache())
+
+        self.assertEqual([], actual['ip_rdap'])
+        mock_rdap.assert_called_once()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_not_found(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = None
+
+        expected = {'ip': '1.1.1.1', 'geoip': None, 'rdap': [], 'ip_rdap': [], 'errors': []}
+        actual = enrich.retrieve_ip_data('1.1.1.1')
+
+        self.assertEqual(expected, actual)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_coalesced(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+
+        flights = upstream.SingleFlight()
+        call = upstream._Call()
+        call.result = [
+            {'class': 'root', 'handle': 'NET', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.255'},
+            {'class': 'child', 'handle': 'POC'}
+        ]
+        call.done.set()
+        flights.calls[enrich._network_key('10.0.0.1')] = call
+
+        actual = enrich.retrieve_ip_data('10.0.0.2', flights=flights)
+
+        self.assertEqual([], actual['rdap'])
+        self.assertEqual([{'ip': '10.0.0.2', 'handle': 'NET'}, {'ip': '10.0.0.2', 'handle': 'POC'}], actual['ip_rdap'])
+        mock_rdap.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_coalesced_other_network(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = [{'class': 'root', 'handle': 'NET2'}]
+
+        flights = upstream.SingleFlight()
+        call = upstream._Call()
+        call.result = [{'class': 'root', 'handle': 'NET1', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.127'}]
+        call.done.set()
+        flights.calls[enrich._network_key('10.0.0.1')] = call
+
+        actual = enrich.retrieve_ip_data('10.0.0.200', flights=flights)
+
+        self.assertEqual([{'class': 'root', 'handle': 'NET2'}], actual['rdap'])
+        mock_rdap.assert_called_once()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_upstream_error(self, mock_geoip, mock_rdap):
+        mock_geoip.side_effect = upstream.UpstreamError('geoip: circuit open')
+        mock_rdap.return_value = [{'handle': 'NET'}]
+
+        actual = enrich.retrieve_ip_data('1.1.1.1')
+
+        self.assertIsNone(actual['geoip'])
+        self.assertEqual([{'handle': 'NET'}], actual['rdap'])
+        self.assertEqual(['geoip: circuit open'], actual['errors'])
+
+
+class TestEnricher(unittest.TestCase):
+    def test_batches(self):
+        enricher = enrich.Enricher(batch_size=2)
+
+        expected = [['1.1.1.1', '2.2.2.2'], ['3.3.3.3']]
+        actual = list(enricher.batches(iter(['1.1.1.1', '2.2.2.2', '3.3.3.3'])))
+
+        self.assertEqual(expected, actual)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    @patch('challenge.geoip.get_many')
+    def test_retrieve_batch(self, mock_get_many, mock_geoip, mock_rdap):
+        mock_get_many.return_value = {'1.1.1.1': {'ip': '1.1.1.1'}, '2.2.2.2': {'ip': '2.2.2.2'}}
+        mock_rdap.return_value = None
+
+        results = enrich.Enricher(batch_size=2).retrieve(['1.1.1.1', '2.2.2.2'])
+
+        self.assertEqual([{'ip': '1.1.1.1'}, {'ip': '2.2.2.2'}], [result['geoip'] for result in results])
+        mock_get_many.assert_called_once()
+        mock_geoip.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    @patch('challenge.geoip.get_many')
+    def test_retrieve_single(self, mock_get_many, mock_geoip, mock_rdap):
+        mock_geoip.return_value = {'ip': '1.1.1.1'}
+        mock_rdap.return_value = None
+
+        results = enrich.Enricher().retrieve(['1.1.1.1'])
+
+        self.assertEqual([{'ip': '1.1.1.1'}], [result['geoip'] for result in results])
+        mock_get_many.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    def test_retrieve_batch_not_found(self, mock_rdap):
+        response = MagicMock()
+        response.status_code = 404
+        geoip_upstream = MagicMock()
+        geoip_upstream.get.return_value = response
+        mock_rdap.return_value = None
+
+        results = enrich.Enricher(geoip_upstream, batch_size=3).retrieve(['1.1.1.1', '2.2.2.2', '3.3.3.3'])
+
+        self.assertEqual([None, None, None], [result['geoip'] for result in results])
+        self.assertEqual([[], [], []], [result['errors'] for result in results])
+        geoip_upstream.get.assert_called_once()
+
+    @patch('challenge.rdap.get')
+    def test_retrieve_geoip_error(self, mock_rdap):
+        # ipstack replies to a used up quota with HTTP 200
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {'success': False, 'error': {'code': 104, 'type': 'usage_limit_reached'}}
+        geoip_upstream = MagicMock()
+        geoip_upstream.get.return_value = response
+        mock_rdap.return_value = None
+
+        for batch_size, ips in ((1, ['1.1.1.1']), (2, ['1.1.1.1', '2.2.2.2'])):
+            results = enrich.Enricher(geoip_upstream, batch_size=batch_size).retrieve(ips)
+
+            self.assertEqual([None] * len(ips), [result['geoip'] for result in results])
+            self.assertTrue(all(result['errors'] for result in results))
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get_many')
+    def test_retrieve_database(self, mock_get_many, mock_rdap):
+        mock_rdap.return_value = None
+        database = geodb.GeoDatabase.from_rows(('start_ip', 'end_ip', 'city'), [('1.1.1.0', '1.1.1.255', 'Brisbane')])
+
+        results = enrich.Enricher(batch_size=2, geoip_database=database).retrieve(['1.1.1.1', '2.2.2.2'])
+
+        self.assertEqual([{'ip': '1.1.1.1', 'type': 'ipv4', 'city': 'Brisbane'}, None],
+                         [result['geoip'] for result in results])
+        mock_get_many.assert_not_called()
+
+
+class TestGeoipPrefix(unittest.TestCase):
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test(self, mock_geoip, mock_rdap):
+        mock_geoip.side_effect = lambda ip, **kwargs: {'ip': ip, 'city': 'Brisbane'}
+        mock_rdap.return_value = None
+
+        enricher = enrich.Enricher(geoip_prefix_length=24)
+        results = [enricher.retrieve([ip])[0] for ip in ['1.1.1.1', '1.1.1.2', '1.1.2.1']]
+
+        expected = [
+            {'ip': '1.1.1.1', 'city': 'Brisbane'},
+            {'ip': '1.1.1.2', 'city': 'Brisbane', 'inferred_from': '1.1.1.1'},
+            {'ip': '1.1.2.1', 'city': 'Brisbane'}
+        ]
+
+        self.assertEqual(expected, [result['geoip'] for result in results])
+        self.assertEqual(2, mock_geoip.call_count)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    @patch('challenge.geoip.get_many')
+    def test_batch(self, mock_get_many, mock_geoip, mock_rdap):
+        mock_get_many.side_effect = lambda ips, *args, **kwargs: {ip: {'ip': ip} for ip in ips}
+        mock_rdap.return_value = None
+
+        enricher = enrich.Enricher(batch_size=10, geoip_prefix_length=16)
+        results = enricher.retrieve(['1.1.1.1', '1.1.2.2', '2.2.2.2'])
+
+        self.assertEqual([{'ip': '1.1.1.1'}, {'ip': '1.1.2.2', 'inferred_from': '1.1.1.1'}, {'ip': '2.2.2.2'}],
+                         [result['geoip'] for result in results])
+        self.assertEqual(['1.1.1.1', '2.2.2.2'], mock_get_many.call_args[0][0])
+        mock_geoip.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_not_found(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = None
+
+        enricher = enrich.Enricher(geoip_prefix_length=24)
+        results = [enricher.retrieve([ip])[0] for ip in ['1.1.1.1', '1.1.1.2', '1.1.1.3']]
+
+        self.assertEqual([None, None, None], [result['geoip'] for result in results])
+        self.assertEqual([[], [], []], [result['errors'] for result in results])
+        self.assertEqual(1, mock_geoip.call_count)
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    @patch('challenge.geoip.get_many')
+    def test_batch_not_found(self, mock_get_many, mock_geoip, mock_rdap):
+        mock_get_many.side_effect = lambda ips, *args, **kwargs: {ip: None for ip in ips}
+        mock_rdap.return_value = None
+
+        enricher = enrich.Enricher(batch_size=10, geoip_prefix_length=24)
+        results = enricher.retrieve(['1.1.1.1', '1.1.1.2'])
+
+        self.assertEqual([None, None], [result['geoip'] for result in results])
+        mock_get_many.assert_called_once()
+        mock_geoip.assert_not_called()
+
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test_error(self, mock_geoip, mock_rdap):
+        mock_geoip.side_effect = upstream.UpstreamError('derp')
+        mock_rdap.return_value = None
+
+        results = enrich.Enricher(geoip_prefix_length=24).retrieve(['1.1.1.1'])
+
+        self.assertIsNone(results[0]['geoip'])
+        self.assertEqual(['derp'], results[0]['errors'])
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            enrich.Enricher(geoip_prefix_length=33)
+
+
+class TestRetrieveWithSamples(unittest.TestCase):
+    @patch('challenge.rdap.get')
+    @patch('challenge.geoip.get')
+    def test(self, mock_geoip, mock_rdap):
+        mock_geoip.return_value = None
+        mock_rdap.return_value = None
+
+        geoip_upstream = upstream.Upstream('geoip')
+        geoip_upstream.samples.append((0.1, False))
+
+        results, samples = enrich.Enricher(geoip_upstream, upstream.Upstream('rdap')).retrieve_with_samples(['1.1.1.1'])
+
+        self.assertEqual(1, len(results))
+        self.assertEqual({'geoip': [(0.1, False)], 'rdap': []}, samples)
+        self.assertEqual([], geoip_upstream.drain_samples())
+
+
+class TestSpill(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        enrich._init_worker(enrich.Enricher(), self.temp_dir.name)
+
+    def tearDown(self):
+        enrich._worker_spill.close()
+        enrich._init_worker(None)
+        enrich._worker_spill = None
+        self.temp_dir.cleanup()
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip, 'geoip': {'ip': ip}, 'errors': []}
+
+        enrich._retrieve_in_worker(['1.1.1.1'])
+        results, _ = enrich._retrieve_in_worker(['2.2.2.2'])
+
+        self.assertEqual([{'ip': '2.2.2.2', 'errors': [], 'spilled': True}], results)
+
+        segments = enrich.spill_segments(self.temp_dir.name)
+
+        self.assertEqual(1, len(segments))
+        self.assertEqual(f'{os.getpid()}.ndjson', segments[0].path.name)
+        self.assertEqual([{'ip': '1.1.1.1', 'geoip': {'ip': '1.1.1.1'}, 'errors': []},
+                          {'ip': '2.2.2.2', 'geoip': {'ip': '2.2.2.2'}, 'errors': []}], list(segments[0].replay()))
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_failed(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip, 'geoip': None, 'errors': ['derp']}
+
+        results, _ = enrich._retrieve_in_worker(['1.1.1.1'])
+
+        self.assertEqual([{'ip': '1.1.1.1', 'geoip': None, 'errors': ['derp']}], results)
+        self.assertEqual([], enrich.spill_segments(self.temp_dir.name))
+
+    def test_no_segments(self):
+        self.assertEqual([], enrich.spill_segments(os.path.join(self.temp_dir.name, 'missing')))
+
+
+class TestAsyncEngine(unittest.TestCase):
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        ips = [f'10.0.0.{i}' for i in range(20)]
+
+        results = list(enrich.AsyncEngine(concurrency=3).run(ips))
+
+        self.assertEqual(sorted(ips), sorted(result['ip'] for result in results))
+
+    @patch('builtins.print')
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_progress(self, mock_retrieve, mock_print):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        ips = [f'10.0.0.{i}' for i in range(20)]
+        run_progress = progress.Progress(len(ips))
+
+        list(enrich.AsyncEngine(concurrency=3).run(ips, run_progress))
+
+        self.assertEqual(20, run_progress.done)
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_generator(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        ips = (f'10.0.0.{i}' for i in range(5))
+
+        results = list(enrich.AsyncEngine(concurrency=2).run(ips))
+
+        self.assertEqual(5, len(results))
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_streamed(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        ips = [f'10.0.0.{i}' for i in range(100)]
+
+        results = enrich.AsyncEngine(concurrency=2).run(ips)
+        first = next(results)
+        results.close()
+
+        self.assertIn(first['ip'], ips)
+        self.assertLess(mock_retrieve.call_count, len(ips))
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_error(self, mock_retrieve):
+        mock_retrieve.side_effect = Exception('derp')
+
+        with self.assertRaises(Exception):
+            list(enrich.AsyncEngine(concurrency=2).run(['1.1.1.1']))
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_ips_error(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        def ips():
+            yield '1.1.1.1'
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        with self.assertRaises(UnicodeDecodeError):
+            list(enrich.AsyncEngine(concurrency=2).run(ips()))
+
+    @patch('challenge.enrich.retrieve_ip_data')
+    def test_prefetched_ips_error(self, mock_retrieve):
+        mock_retrieve.side_effect = lambda ip, *args: {'ip': ip}
+
+        def ips():
+            yield '1.1.1.1'
+            raise ValueError('derp')
+
+        with self.assertRaises(ValueError):
+            list(enrich.AsyncEngine(concurrency=2).run(stages.prefetch(ips())))
+
+
+class TestCreateEngine(unittest.TestCase):
+    def test_pool(self):
+        engine = enrich.create_engine('pool')
+
+        self.assertIsInstance(engine, enrich.PoolEngine)
+        self.assertEqual(4, engine.processes)
+        self.assertEqual(4, engine.enricher.geoip_upstream.pool_size)
+
+    def test_async(self):
+        engine = enrich.create_engine('async', 50, batch_size=10)
+
+        self.assertEqual(10, engine.enricher.batch_size)
+
+        self.assertIsInstance(engine, enrich.AsyncEngine)
+        self.assertEqual(50, engine.concurrency)
+        self.assertEqual(50, engine.enricher.rdap_upstream.pool_size)
+
+    def test_geoip_database(self):
+        database = geodb.GeoDatabase.from_rows(('start_ip', 'end_ip'), [])
+
+        engine = enrich.create_engine('async', geoip_database=database)
+
+        self.assertIsNone(engine.enricher.geoip_upstream)
+        self.assertIs(database, engine.enricher.geoip_database)
+
+    def test_unknown(self):
+        with self.assertRaises(Exception):
+            enrich.create_engine('derp')
@@ -0,0 +1,97 @@
+import unittest
+import os
+import gzip
+import tempfile
+from challenge import geodb, geoip
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+CSV = '''start_ip,end_ip,country_code,country_name,region_name,city,latitude,longitude
+8.8.8.0,8.8.8.255,US,United States,California,Mountain View,37.386,-122.0838
+1.1.1.0,1.1.1.255,AU,Australia,Queensland,South Brisbane,-27.4766,153.0166
+16842752,16843007,AU,Australia,Victoria,Melbourne,,
+2001:db8::,2001:db8::ffff,US,United States,,,,
+'''
+
+DBIP_CSV = '''1.0.0.0,1.0.0.255,OC,AU,Queensland,South Brisbane,-27.4767,153.017
+8.8.8.0,8.8.8.255,NA,US,California,Mountain View,37.4223,-122.085
+'''
+
+
+class TestGeoDatabase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'geoip.csv')
+
+        with open(self.path, 'w') as file:
+            file.write(CSV)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test(self):
+        database = geodb.GeoDatabase.load(self.path)
+
+        expected = {
+            'ip': '8.8.8.8',
+            'type': 'ipv4',
+            'country_code': 'US',
+            'country_name': 'United States',
+            'region_name': 'California',
+            'city': 'Mountain View',
+            'latitude': 37.386,
+            'longitude': -122.0838
+        }
+
+        self.assertEqual(3, len(database))
+        self.assertEqual(expected, database.get('8.8.8.8'))
+        self.assertEqual('South Brisbane', database.get('1.1.1.1')['city'])
+
+    def test_int_addresses(self):
+        database = geodb.GeoDatabase.load(self.path)
+
+        actual = database.get('1.1.1.0')
+
+        self.assertEqual('South Brisbane', actual['city'])
+        self.assertEqual('Melbourne', database.get('1.1.0.255')['city'])
+        self.assertIsNone(database.get('1.1.0.255')['latitude'])
+
+    def test_not_found(self):
+        database = geodb.GeoDatabase.load(self.path)
+
+        for ip in ['0.0.0.0', '1.1.2.0', '8.8.7.255', '8.8.9.0', '255.255.255.255']:
+            self.assertIsNone(database.get(ip), ip)
+
+    def test_no_header(self):
+        with open(self.path, 'w') as file:
+            file.write(DBIP_CSV)
+
+        database = geodb.GeoDatabase.load(self.path)
+
+        self.assertEqual('US', database.get('8.8.8.8')['country_code'])
+        self.assertEqual('OC', database.get('1.0.0.1')['continent_code'])
+
+    def test_gzip(self):
+        path = self.path + '.gz'
+        with gzip.open(path, 'wt') as file:
+            file.write(CSV)
+
+        database = geodb.GeoDatabase.load(path)
+
+        self.assertEqual('Mountain View', database.get('8.8.8.8')['city'])
+
+    def test_no_ranges(self):
+        with open(self.path, 'w') as file:
+            file.write('country_code,city\nUS,Chicago\n')
+
+        with self.assertRaises(Exception):
+            geodb.GeoDatabase.load(self.path)
+
+    def test_geoip_get(self):
+        database = geodb.GeoDatabase.load(self.path)
+
+        self.assertEqual('Mountain View', geoip.get('8.8.8.8', database=database)['city'])
+        self.assertIsNone(geoip.get('9.9.9.9', database=database))
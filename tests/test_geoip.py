@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from challenge import geoip
+from challenge import geoip, upstream
 
 
 if __name__ == '__main__':
@@ -59,6 +59,94 @@ class TestGet(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+    @patch('requests.get')
+    def test_error(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value={'success': False, 'error': {'code': 104}})
+        mock_get.return_value = response
+
+        with self.assertRaises(upstream.UpstreamError):
+            geoip.get('1.1.1.1')
+
+
+class TestGetMany(unittest.TestCase):
+    def test_not_an_ip(self):
+        with self.assertRaises(Exception):
+            geoip.get_many(['1.1.1.1', 'not_an_ip'])
+
+    def test_bad_batch_size(self):
+        with self.assertRaises(Exception):
+            geoip.get_many(['1.1.1.1'], batch_size=51)
+
+    @patch('requests.get')
+    def test_batches(self, mock_get):
+        def get(url):
+            ips = url.split('/')[-1].split('?')[0].split(',')
+            response = MagicMock()
+            response.status_code = 200
+            response.json = MagicMock(return_value=[{'ip': ip, 'location': 'location'} for ip in ips])
+            return response
+
+        mock_get.side_effect = get
+
+        expected = {
+            '1.1.1.1': {'ip': '1.1.1.1'},
+            '2.2.2.2': {'ip': '2.2.2.2'},
+            '3.3.3.3': {'ip': '3.3.3.3'}
+        }
+        actual = geoip.get_many(['1.1.1.1', '2.2.2.2', '3.3.3.3'], batch_size=2)
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(2, mock_get.call_count)
+        self.assertIn('/1.1.1.1,2.2.2.2?', mock_get.call_args_list[0][0][0])
+
+    @patch('requests.get')
+    def test_single_object(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value={'ip': '1.1.1.1'})
+        mock_get.return_value = response
+
+        expected = {'1.1.1.1': {'ip': '1.1.1.1'}}
+        actual = geoip.get_many(['1.1.1.1'])
+
+        self.assertEqual(expected, actual)
+
+    @patch('requests.get')
+    def test_fields(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value=[])
+        mock_get.return_value = response
+
+        actual = geoip.get_many(['1.1.1.1'], fields=['country_name', 'city'])
+
+        self.assertEqual({'1.1.1.1': None}, actual)
+        self.assertTrue(mock_get.call_args[0][0].endswith('&fields=ip,country_name,city'))
+
+    @patch('requests.get')
+    def test_not_found(self, mock_get):
+        response = MagicMock()
+        response.status_code = 404
+        mock_get.return_value = response
+
+        expected = {'1.1.1.1': None, '2.2.2.2': None}
+        actual = geoip.get_many(['1.1.1.1', '2.2.2.2'])
+
+        self.assertEqual(expected, actual)
+
+    @patch('requests.get')
+    def test_error(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value={'success': False, 'error': {'code': 303}})
+        mock_get.return_value = response
+
+        with self.assertRaises(upstream.UpstreamError):
+            geoip.get_many(['1.1.1.1', '2.2.2.2'])
+
+
 class TestProcessData(unittest.TestCase):
     def test_not_dict(self):
         with self.assertRaises(Exception):
@@ -0,0 +1,84 @@
+import unittest
+import os
+import shutil
+import tempfile
+from challenge import journal, packed
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal.ndjson')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_no_journal(self):
+        j = journal.Journal(self.path)
+
+        self.assertEqual([], list(j.replay()))
+        self.assertEqual(set(), j.completed)
+
+    def test_replay(self):
+        j = journal.Journal(self.path)
+        j.append({'ip': '1.1.1.1', 'geoip': None})
+        j.append({'ip': '2.2.2.2', 'geoip': {'ip': '2.2.2.2'}})
+        j.close()
+
+        j = journal.Journal(self.path)
+
+        expected = [{'ip': '1.1.1.1', 'geoip': None}, {'ip': '2.2.2.2', 'geoip': {'ip': '2.2.2.2'}}]
+        self.assertEqual(expected, list(j.replay()))
+        self.assertEqual({'1.1.1.1', '2.2.2.2'}, j.completed)
+
+    def test_written_through(self):
+        j = journal.Journal(self.path)
+        j.append({'ip': '1.1.1.1'})
+
+        self.assertEqual([{'ip': '1.1.1.1'}], list(journal.Journal(self.path).replay()))
+        j.close()
+
+    def test_partial_line(self):
+        with open(self.path, 'w') as file:
+            file.write('{"ip": "1.1.1.1"}\n{"ip": "2.2.')
+
+        j = journal.Journal(self.path)
+        self.assertEqual([{'ip': '1.1.1.1'}], list(j.replay()))
+
+        j.append({'ip': '3.3.3.3'})
+        j.close()
+
+        self.assertEqual(['1.1.1.1', '3.3.3.3'], [r['ip'] for r in journal.Journal(self.path).replay()])
+
+    def test_filter(self):
+        j = journal.Journal(self.path)
+        j.completed = {'1.1.1.1'}
+
+        self.assertEqual(['2.2.2.2'], list(j.filter(['1.1.1.1', '2.2.2.2'])))
+        self.assertEqual(1, j.skipped)
+
+    def test_exclude(self):
+        j = journal.Journal(self.path)
+        j.completed = {'1.1.1.1'}
+
+        self.assertEqual({'2.2.2.2': 2}, j.exclude({'1.1.1.1': 1, '2.2.2.2': 2}))
+
+        ips = packed.PackedCounter()
+        ips.add('1.1.1.1')
+        ips.add('2.2.2.2')
+
+        self.assertEqual({'2.2.2.2': 1}, j.exclude(ips).to_dict())
+        self.assertEqual(2, j.skipped)
+
+    def test_clear(self):
+        j = journal.Journal(self.path)
+        j.append({'ip': '1.1.1.1'})
+
+        j.clear()
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(set(), j.completed)
@@ -0,0 +1,76 @@
+import unittest
+import requests
+from unittest.mock import patch
+from challenge import geoip, mockserver, rdap
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestMockServer(unittest.TestCase):
+    def setUp(self):
+        self.server = mockserver.MockServer().start()
+
+        geoip_patcher = patch('challenge.geoip.GEO_IP_URL', self.server.geoip_url())
+        rdap_patcher = patch('challenge.rdap.RDAP_URL', self.server.rdap_url())
+        geoip_patcher.start()
+        rdap_patcher.start()
+        self.addCleanup(geoip_patcher.stop)
+        self.addCleanup(rdap_patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_geoip(self):
+        actual = geoip.get('8.8.8.8')
+
+        self.assertEqual('8.8.8.8', actual['ip'])
+        self.assertNotIn('location', actual)
+        self.assertEqual(actual, geoip.get('8.8.8.8'))
+
+    def test_geoip_bulk(self):
+        actual = geoip.get_many(['8.8.8.8', '1.1.1.1', '10.0.0.1'], fields=['country_name'])
+
+        self.assertEqual({'ip': '8.8.8.8', 'country_name': actual['8.8.8.8']['country_name']}, actual['8.8.8.8'])
+        self.assertIn('1.1.1.1', actual)
+        self.assertIsNone(actual['10.0.0.1'])
+
+    def test_rdap(self):
+        actual = rdap.get('8.8.8.8')
+
+        self.assertEqual({'class': 'root', 'handle': 'NET-8-8-0-0-1', 'startAddress': '8.8.0.0',
+                          'endAddress': '8.8.255.255'},
+                         {key: actual[0][key] for key in ('class', 'handle', 'startAddress', 'endAddress')})
+        self.assertEqual(4, len(actual))
+        self.assertTrue(all('handle' in datum for datum in actual))
+
+    def test_not_found(self):
+        self.assertIsNone(rdap.get('192.168.1.1'))
+
+    def test_rdap_conditional(self):
+        url = self.server.rdap_url().format('8.8.0.0/16')
+        response = requests.get(url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('NET-8-8-0-0-1', response.json()['handle'])
+
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        self.assertEqual(304, requests.get(url, headers={'If-None-Match': etag}).status_code)
+        self.assertEqual(304, requests.get(url, headers={'If-Modified-Since': last_modified}).status_code)
+        self.assertEqual(200, requests.get(url, headers={'If-None-Match': '"derp"'}).status_code)
+
+    def test_errors(self):
+        self.server.error_rate = 1
+
+        self.assertEqual(500, requests.get(self.server.rdap_url().format('8.8.8.8')).status_code)
+
+    def test_rate_limit(self):
+        self.server.rate_limit = 1
+
+        statuses = [requests.get(self.server.rdap_url().format('8.8.8.8')).status_code for _ in range(5)]
+
+        # at most one request per second gets through, and five requests span at most two seconds
+        self.assertGreaterEqual(statuses.count(429), 3)
@@ -0,0 +1,115 @@
+import unittest
+import pickle
+from unittest.mock import patch
+from challenge import packed
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestPackedCounter(unittest.TestCase):
+    def test_empty(self):
+        counter = packed.PackedCounter()
+
+        self.assertEqual(0, len(counter))
+        self.assertEqual({}, counter.to_dict())
+
+    def test_add(self):
+        counter = packed.PackedCounter(buffer_size=2)
+
+        for ip in ['10.0.0.2', '10.0.0.1', '10.0.0.2', '1.2.3.4', '10.0.0.2']:
+            counter.add(ip)
+
+        expected = {'1.2.3.4': 1, '10.0.0.1': 1, '10.0.0.2': 3}
+        actual = counter.to_dict()
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(['1.2.3.4', '10.0.0.1', '10.0.0.2'], list(counter.keys()))
+        self.assertEqual(3, len(counter))
+
+    def test_compactions(self):
+        counter = packed.PackedCounter(buffer_size=2)
+
+        with patch('challenge.packed._merge', wraps=packed._merge) as mock_merge:
+            for i in range(1024):
+                counter.add(i)
+
+        # the buffer grows with the arrays, so they are merged into a logarithmic number of times
+        self.assertLessEqual(mock_merge.call_count, 11)
+        self.assertEqual(1024, len(counter))
+        self.assertEqual(1, counter.count(1023))
+
+    def test_add_int(self):
+        counter = packed.PackedCounter()
+        counter.add(16843009)
+
+        self.assertEqual({'1.1.1.1': 1}, counter.to_dict())
+
+    def test_invalid_skipped(self):
+        counter = packed.PackedCounter()
+        counter.add('999.1.1.1')
+        counter.add('1.1.1.1')
+
+        self.assertEqual({'1.1.1.1': 1}, counter.to_dict())
+
+    def test_count(self):
+        counter = packed.PackedCounter()
+        counter.add('1.1.1.1')
+        counter.add('1.1.1.1')
+
+        self.assertEqual(2, counter.count('1.1.1.1'))
+        self.assertEqual(0, counter.count('2.2.2.2'))
+        self.assertEqual(0, counter.count('not_an_ip'))
+        self.assertIn('1.1.1.1', counter)
+        self.assertNotIn('2.2.2.2', counter)
+
+    def test_update(self):
+        counter1 = packed.PackedCounter()
+        counter1.add('1.1.1.1')
+        counter1.add('2.2.2.2')
+
+        counter2 = packed.PackedCounter()
+        counter2.add('2.2.2.2')
+        counter2.add('3.3.3.3')
+
+        counter1.update(counter2)
+
+        expected = {'1.1.1.1': 1, '2.2.2.2': 2, '3.3.3.3': 1}
+        actual = counter1.to_dict()
+
+        self.assertEqual(expected, actual)
+
+    def test_exclude(self):
+        counter = packed.PackedCounter()
+        for ip in ['1.1.1.1', '2.2.2.2', '3.3.3.3']:
+            counter.add(ip)
+
+        expected = {'1.1.1.1': 1, '3.3.3.3': 1}
+        actual = counter.exclude(['2.2.2.2', '4.4.4.4', 'not_an_ip']).to_dict()
+
+        self.assertEqual(expected, actual)
+
+    def test_exclude_ranges(self):
+        counter = packed.PackedCounter()
+        for ip in ['1.1.1.1', '10.0.0.1', '10.255.255.255', '11.0.0.0', '192.168.1.1', '224.0.0.1', '8.8.8.8']:
+            counter.add(ip)
+
+        actual = counter.exclude_ranges([(167772160, 184549375), (3232235520, 3232301055), (3758096384, 4294967295)])
+
+        self.assertEqual({'1.1.1.1': 1, '8.8.8.8': 1, '11.0.0.0': 1}, actual.to_dict())
+
+    def test_most_common(self):
+        counter = packed.PackedCounter()
+        for ip in ['3.3.3.3', '1.1.1.1', '2.2.2.2', '2.2.2.2', '3.3.3.3', '2.2.2.2', '4.4.4.4']:
+            counter.add(ip)
+
+        self.assertEqual(['2.2.2.2', '3.3.3.3', '1.1.1.1', '4.4.4.4'], list(counter.most_common()))
+
+    def test_pickle(self):
+        counter = packed.PackedCounter()
+        counter.add('1.1.1.1')
+
+        actual = pickle.loads(pickle.dumps(counter))
+
+        self.assertEqual({'1.1.1.1': 1}, actual.to_dict())
@@ -0,0 +1,93 @@
+import unittest
+import os
+import shutil
+from challenge import packed, planner, warehouse
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestIsBogon(unittest.TestCase):
+    def test_public(self):
+        for ip in ['1.1.1.1', '8.8.8.8', '172.15.255.255', '172.32.0.0', '223.255.255.255']:
+            self.assertFalse(planner.is_bogon(ip), ip)
+
+    def test_reserved(self):
+        for ip in ['10.1.2.3', '127.0.0.1', '172.16.0.0', '172.31.255.255', '192.168.1.1', '169.254.1.1',
+                   '224.0.0.1', '239.255.255.255', '255.255.255.255', '0.0.0.0', '100.64.0.1']:
+            self.assertTrue(planner.is_bogon(ip), ip)
+
+    def test_invalid(self):
+        self.assertTrue(planner.is_bogon('999.1.1.1'))
+
+
+class TestPrioritize(unittest.TestCase):
+    def test(self):
+        ips = {'1.1.1.1': 2, '2.2.2.2': 10, '3.3.3.3': 1, '4.4.4.4': 2}
+
+        self.assertEqual(['2.2.2.2', '1.1.1.1', '4.4.4.4', '3.3.3.3'], planner.prioritize(ips))
+
+    def test_packed(self):
+        ips = packed.PackedCounter()
+        for ip in ['1.1.1.1', '2.2.2.2', '2.2.2.2', '3.3.3.3', '2.2.2.2', '3.3.3.3']:
+            ips.add(ip)
+
+        self.assertEqual(['2.2.2.2', '3.3.3.3', '1.1.1.1'], list(planner.prioritize(ips)))
+
+    def test_empty(self):
+        self.assertEqual([], planner.prioritize({}))
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.wh = warehouse.Warehouse(path=DATA_DIR)
+
+        with self.wh.open() as wh:
+            wh.write('geoip', {'ip': '1.1.1.1'})
+            wh.write('geoip', {'ip': '2.2.2.2'})
+            wh.write('ip_rdap', {'ip': '1.1.1.1', 'handle': 'NET'})
+
+    def tearDown(self):
+        if self.wh.path.exists():
+            shutil.rmtree(str(self.wh.path))
+
+    def test(self):
+        ip_planner = planner.Planner(warehouse.Warehouse(path=DATA_DIR))
+
+        expected = ['2.2.2.2', '3.3.3.3']
+        actual = list(ip_planner.filter(['1.1.1.1', '2.2.2.2', '3.3.3.3', '10.0.0.1', '192.168.0.1']))
+
+        self.assertEqual(expected, actual)
+        self.assertEqual('2 to fetch / 1 cached / 2 bogon', ip_planner.summary())
+
+    def test_exclude(self):
+        ip_planner = planner.Planner(warehouse.Warehouse(path=DATA_DIR))
+
+        ips = {'1.1.1.1': 1, '2.2.2.2': 2, '3.3.3.3': 3, '10.0.0.1': 4, '192.168.0.1': 5}
+
+        self.assertEqual({'2.2.2.2': 2, '3.3.3.3': 3}, ip_planner.exclude(ips))
+        self.assertEqual('2 to fetch / 1 cached / 2 bogon', ip_planner.summary())
+
+    def test_exclude_packed(self):
+        ip_planner = planner.Planner(warehouse.Warehouse(path=DATA_DIR))
+
+        ips = packed.PackedCounter()
+        for ip in ['1.1.1.1', '2.2.2.2', '3.3.3.3', '3.3.3.3', '10.0.0.1', '192.168.0.1', '255.255.255.255']:
+            ips.add(ip)
+
+        actual = ip_planner.exclude(ips)
+
+        self.assertIsInstance(actual, packed.PackedCounter)
+        self.assertEqual({'2.2.2.2': 1, '3.3.3.3': 2}, actual.to_dict())
+        self.assertEqual('2 to fetch / 1 cached / 3 bogon', ip_planner.summary())
+
+    def test_empty_warehouse(self):
+        shutil.rmtree(DATA_DIR)
+
+        ip_planner = planner.Planner(warehouse.Warehouse(path=DATA_DIR))
+
+        self.assertEqual(['1.1.1.1'], list(ip_planner.filter(['1.1.1.1'])))
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+from challenge import progress
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    @patch('builtins.print')
+    def test_rate_and_eta(self, mock_print):
+        p = progress.Progress(100, clock=self.clock)
+
+        self.clock.now = 10
+        p.update(20)
+
+        self.assertEqual(2.0, p.rate())
+        self.assertEqual(40.0, p.eta())
+
+    def test_eta_unknown_total(self):
+        p = progress.Progress(clock=self.clock)
+
+        self.assertIsNone(p.eta())
+
+    @patch('builtins.print')
+    def test_latency_percentiles(self, mock_print):
+        p = progress.Progress(clock=self.clock)
+
+        p.update(1, {'geoip': [(i / 100, False) for i in range(1, 101)]})
+
+        self.assertEqual({50: 0.51, 95: 0.96, 99: 1.0}, p.latency_percentiles('geoip'))
+        self.assertEqual({50: None}, p.latency_percentiles('rdap', (50,)))
+
+    @patch('builtins.print')
+    def test_hit_ratio(self, mock_print):
+        p = progress.Progress(clock=self.clock)
+
+        p.update(2, {'geoip': [(0.001, True), (0.1, False)], 'rdap': [(0.001, True), (0.001, True)]})
+
+        self.assertEqual(0.75, p.hit_ratio())
+        self.assertEqual({50: 0.1}, p.latency_percentiles('geoip', (50,)))
+
+    @patch('builtins.print')
+    def test_interval(self, mock_print):
+        p = progress.Progress(clock=self.clock, interval=1)
+
+        p.update(1)
+        p.update(1)
+        self.clock.now = 1
+        p.update(1)
+
+        self.assertEqual(2, mock_print.call_count)
+
+    def test_status(self):
+        p = progress.Progress(200, clock=self.clock)
+        p.done = 50
+        p.latencies['geoip'] = [0.02, 0.04]
+        p.hits = 1
+        p.misses = 1
+        self.clock.now = 10
+
+        expected = '50/200 IPs (25%) | 5.0 IPs/s | ETA 0:00:30 | geoip p50 40ms p95 40ms p99 40ms | cache 50% hit'
+        self.assertEqual(expected, p.status())
@@ -1,6 +1,13 @@
 import unittest
+import json
+import os
+import pickle
+import shutil
 from unittest.mock import patch, MagicMock
-from challenge import rdap
+from challenge import rdap, util, warehouse
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
 
 if __name__ == '__main__':
@@ -474,3 +481,364 @@ class TestParseVcard(unittest.TestCase):
         actual = rdap._parse_vcard(vcard)
 
         self.assertEqual(expected, actual)
+
+
+class TestNetworkCache(unittest.TestCase):
+    def test_empty(self):
+        self.assertIsNone(rdap.NetworkCache().lookup('1.1.1.1'))
+
+    def test_lookup(self):
+        cache = rdap.NetworkCache()
+        cache.add_network('10.0.0.0', '10.0.255.255', 'NET-10-0', ['NET-10-0', 'POC'])
+        cache.add_network('11.0.0.0', '11.0.0.255', 'NET-11', ['NET-11'])
+
+        self.assertEqual(['NET-10-0', 'POC'], cache.lookup('10.0.3.4'))
+        self.assertEqual(['NET-11'], cache.lookup('11.0.0.255'))
+        self.assertIsNone(cache.lookup('11.0.1.0'))
+        self.assertIsNone(cache.lookup('9.255.255.255'))
+        self.assertIsNone(cache.lookup('300.0.0.1'))
+
+    def test_most_specific(self):
+        cache = rdap.NetworkCache()
+        cache.add_network('8.0.0.0', '8.255.255.255', 'NET-8', ['NET-8'])
+        cache.add_network('8.8.8.0', '8.8.8.255', 'NET-8-8-8', ['NET-8-8-8'])
+
+        self.assertEqual(['NET-8-8-8'], cache.lookup('8.8.8.8'))
+        self.assertEqual(['NET-8'], cache.lookup('8.8.9.1'))
+        self.assertEqual(['NET-8'], cache.lookup('8.200.0.0'))
+
+    def test_add(self):
+        cache = rdap.NetworkCache()
+        cache.add([
+            {'class': 'root', 'handle': 'NET', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.255'},
+            {'class': 'child', 'handle': 'POC', 'parentHandle': 'NET'},
+            {'class': 'child', 'parentHandle': 'NET'}
+        ])
+        cache.add([{'class': 'root', 'handle': 'NET2'}])
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual(['NET', 'POC'], cache.lookup('10.0.0.1'))
+
+    def test_ipv6_skipped(self):
+        cache = rdap.NetworkCache()
+        cache.add_network('2001:db8::', '2001:db8::ffff', 'NET6', ['NET6'])
+
+        self.assertEqual(0, len(cache))
+
+    def test_from_warehouse(self):
+        wh = warehouse.Warehouse(path=DATA_DIR)
+
+        with wh.open():
+            wh.write('rdap', {'class': 'root', 'handle': 'NET', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.255'})
+            wh.write('rdap', {'class': 'child', 'handle': 'POC', 'parentHandle': 'OTHER-NET'})
+            wh.write('ip_rdap', {'ip': '10.0.0.1', 'handle': 'NET'})
+            wh.write('ip_rdap', {'ip': '10.0.0.1', 'handle': 'POC'})
+
+        try:
+            cache = rdap.NetworkCache.from_warehouse(wh)
+        finally:
+            shutil.rmtree(DATA_DIR)
+
+        self.assertEqual(['NET', 'POC'], cache.lookup('10.0.0.200'))
+
+    def test_pickle(self):
+        cache = rdap.NetworkCache()
+        cache.add_network('10.0.0.0', '10.0.0.255', 'NET', ['NET'])
+
+        actual = pickle.loads(pickle.dumps(cache))
+
+        self.assertEqual(['NET'], actual.lookup('10.0.0.1'))
+
+
+class TestEntityCache(unittest.TestCase):
+    def setUp(self):
+        self.entity = {
+            'objectClassName': 'entity',
+            'handle': 'ORG',
+            'roles': ['registrant'],
+            'vcardArray': ['vcard', [['fn', {}, 'text', 'Org']]],
+            'entities': [
+                {'objectClassName': 'entity', 'handle': 'ABUSE', 'roles': ['abuse']}
+            ]
+        }
+
+    def test_reused(self):
+        entities = rdap.EntityCache()
+
+        first = rdap._parse_entity(self.entity, 'NET1', entities)
+
+        with patch('challenge.rdap._parse_vcard') as mock_parse_vcard:
+            second = rdap._parse_entity(self.entity, 'NET2', entities)
+            mock_parse_vcard.assert_not_called()
+
+        expected = [
+            {'class': 'child', 'parentHandle': 'NET2', 'handle': 'ORG', 'vcard_fn': 'Org', 'roles': 'registrant'},
+            {'class': 'child', 'parentHandle': 'ORG', 'handle': 'ABUSE', 'roles': 'abuse'}
+        ]
+        self.assertEqual(expected, second)
+        self.assertEqual('NET1', first[0]['parentHandle'])
+        self.assertIs(first[1], second[1])
+        self.assertEqual(1, entities.hits)
+
+    def test_roles_differ(self):
+        entities = rdap.EntityCache()
+
+        rdap._parse_entity(self.entity, 'NET1', entities)
+        self.entity['roles'] = ['technical']
+        actual = rdap._parse_entity(self.entity, 'NET2', entities)
+
+        self.assertEqual('technical', actual[0]['roles'])
+        self.assertEqual(1, entities.hits)  # only the child entity is reused
+
+    def test_max_size(self):
+        entities = rdap.EntityCache(max_size=2)
+
+        entities.put(('A', ()), ({}, []))
+        entities.put(('B', ()), ({}, []))
+        entities.get(('A', ()))
+        entities.put(('C', ()), ({}, []))
+
+        self.assertEqual(2, len(entities))
+        self.assertIsNone(entities.get(('B', ())))
+        self.assertIsNotNone(entities.get(('A', ())))
+
+    def test_pickle(self):
+        entities = rdap.EntityCache()
+        entities.put(('A', ()), ({'handle': 'A'}, []))
+
+        actual = pickle.loads(pickle.dumps(entities))
+
+        self.assertEqual(({'handle': 'A'}, []), actual.get(('A', ())))
+
+    def test_interned(self):
+        vcard = [['fn', {}, 'text', ''.join(['Net', 'work'])]]
+
+        first = rdap._parse_vcard(vcard)
+        second = rdap._parse_vcard([['fn', {}, 'text', ''.join(['Netw', 'ork'])]])
+
+        self.assertIs(first['vcard_fn'], second['vcard_fn'])
+
+
+class TestContains(unittest.TestCase):
+    def test(self):
+        data = [{'class': 'root', 'handle': 'NET', 'startAddress': '10.0.0.0', 'endAddress': '10.0.0.255'}]
+
+        self.assertTrue(rdap.contains(data, '10.0.0.7'))
+        self.assertFalse(rdap.contains(data, '10.0.1.7'))
+
+    def test_no_range(self):
+        self.assertFalse(rdap.contains([{'class': 'root', 'handle': 'NET'}], '10.0.0.7'))
+        self.assertFalse(rdap.contains(None, '10.0.0.7'))
+
+
+BOOTSTRAP_DATA = {
+    'version': '1.0',
+    'services': [
+        [['41.0.0.0/8', '102.0.0.0/8'], ['https://rdap.afrinic.net/rdap/', 'http://rdap.afrinic.net/rdap/']],
+        [['1.0.0.0/8'], ['https://rdap.apnic.net/']],
+        [['8.0.0.0/8'], ['https://rdap.arin.net/registry/']]
+    ]
+}
+
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.bootstrap = rdap.Bootstrap.from_data(BOOTSTRAP_DATA)
+
+    def test_url(self):
+        self.assertEqual('https://rdap.apnic.net/ip/1.1.1.1', self.bootstrap.url('1.1.1.1'))
+        self.assertEqual('https://rdap.afrinic.net/rdap/ip/102.1.2.3', self.bootstrap.url('102.1.2.3'))
+        self.assertEqual('https://rdap.arin.net/registry/ip/8.8.8.8', self.bootstrap.url('8.8.8.8'))
+
+    def test_unknown(self):
+        self.assertIsNone(self.bootstrap.url('0.1.2.3'))
+        self.assertIsNone(self.bootstrap.url('9.1.2.3'))
+        self.assertIsNone(self.bootstrap.url('200.1.2.3'))
+
+    @patch('requests.get')
+    def test_get(self, mock_get):
+        response = MagicMock()
+        response.status_code = 404
+        mock_get.return_value = response
+
+        rdap.get('1.1.1.1', bootstrap=self.bootstrap)
+        rdap.get('9.9.9.9', bootstrap=self.bootstrap)
+
+        self.assertEqual('https://rdap.apnic.net/ip/1.1.1.1', mock_get.call_args_list[0][0][0])
+        self.assertEqual(rdap.RDAP_URL.format('9.9.9.9'), mock_get.call_args_list[1][0][0])
+
+    def test_load(self):
+        path = os.path.join(DATA_DIR, 'bootstrap.json')
+        os.makedirs(DATA_DIR, exist_ok=True)
+        self.addCleanup(shutil.rmtree, DATA_DIR)
+
+        with open(path, 'w') as file:
+            json.dump(BOOTSTRAP_DATA, file)
+
+        actual = rdap.Bootstrap.load(path, download=False)
+
+        self.assertEqual('https://rdap.apnic.net/ip/1.1.1.1', actual.url('1.1.1.1'))
+
+    def test_load_missing(self):
+        with self.assertRaises(Exception):
+            rdap.Bootstrap.load(os.path.join(DATA_DIR, 'bootstrap.json'), download=False)
+
+    @patch('requests.get')
+    def test_download(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.text = json.dumps(BOOTSTRAP_DATA)
+        mock_get.return_value = response
+
+        path = os.path.join(DATA_DIR, 'bootstrap.json')
+        self.addCleanup(shutil.rmtree, DATA_DIR)
+
+        actual = rdap.Bootstrap.load(path)
+
+        self.assertEqual('https://rdap.apnic.net/ip/1.1.1.1', actual.url('1.1.1.1'))
+        self.assertTrue(os.path.exists(path))
+        mock_get.assert_called_once_with(rdap.BOOTSTRAP_URL, timeout=30)
+
+
+class TestRangeTable(unittest.TestCase):
+    def setUp(self):
+        networks = [
+            (util.ip_to_int('10.0.0.0'), util.ip_to_int('10.255.255.255'), ['NET-10', 'ORG']),
+            (util.ip_to_int('10.1.0.0'), util.ip_to_int('10.1.255.255'), ['NET-10-1']),
+            (util.ip_to_int('10.1.2.0'), util.ip_to_int('10.1.2.255'), ['NET-10-1-2']),
+            (util.ip_to_int('10.2.0.0'), util.ip_to_int('10.2.255.255'), ['NET-10-2']),
+            (util.ip_to_int('20.0.0.0'), util.ip_to_int('20.0.0.255'), ['NET-20'])
+        ]
+        self.ranges = rdap.RangeTable.build(networks)
+
+    def test_invalid_ip(self):
+        self.assertIsNone(self.ranges.lookup('300.1.2.3'))
+
+    def test_lookup(self):
+        self.assertEqual(['NET-10', 'ORG'], self.ranges.lookup('10.0.0.1'))
+        self.assertEqual(['NET-10-1'], self.ranges.lookup('10.1.0.1'))
+        self.assertEqual(['NET-10-1-2'], self.ranges.lookup('10.1.2.3'))
+        self.assertEqual(['NET-10-1'], self.ranges.lookup('10.1.3.0'))
+        self.assertEqual(['NET-10-2'], self.ranges.lookup('10.2.255.255'))
+        self.assertEqual(['NET-10', 'ORG'], self.ranges.lookup('10.3.0.0'))
+        self.assertEqual(['NET-10', 'ORG'], self.ranges.lookup('10.255.255.255'))
+        self.assertEqual(['NET-20'], self.ranges.lookup('20.0.0.0'))
+
+    def test_not_found(self):
+        for ip in ['9.255.255.255', '11.0.0.0', '20.0.1.0']:
+            self.assertIsNone(self.ranges.lookup(ip), ip)
+
+    def test_flat(self):
+        self.assertEqual(list(self.ranges.starts), sorted(self.ranges.starts))
+        for i in range(1, len(self.ranges)):
+            self.assertGreater(self.ranges.starts[i], self.ranges.ends[i - 1])
+
+    def test_save(self):
+        path = os.path.join(DATA_DIR, 'ranges.ndjson')
+        os.makedirs(DATA_DIR, exist_ok=True)
+        self.addCleanup(shutil.rmtree, DATA_DIR)
+
+        self.ranges.save(path)
+        actual = rdap.RangeTable.load(path)
+
+        self.assertEqual(len(self.ranges), len(actual))
+        self.assertEqual(['NET-10-1-2'], actual.lookup('10.1.2.3'))
+
+    def test_network_cache(self):
+        networks = rdap.NetworkCache(self.ranges)
+        networks.add_network('10.1.2.0', '10.1.2.127', 'NET-LEARNED', ['NET-LEARNED'])
+
+        self.assertEqual(['NET-LEARNED'], networks.lookup('10.1.2.3'))
+        self.assertEqual(['NET-10-1-2'], networks.lookup('10.1.2.200'))
+        self.assertIsNone(networks.lookup('30.0.0.0'))
+
+
+class TestRevalidate(unittest.TestCase):
+    def setUp(self):
+        self.root = {'class': 'root', 'handle': 'NET-8-0-0-0-1', 'startAddress': '8.0.0.0',
+                     'endAddress': '8.255.255.255', 'etag': '"abc"', 'last_modified': 'Sat, 01 Jun 2019 16:00:00 GMT'}
+
+    @patch('requests.get')
+    def test_unchanged(self, mock_get):
+        response = MagicMock()
+        response.status_code = 304
+        mock_get.return_value = response
+
+        self.assertEqual(('unchanged', None), rdap.revalidate(self.root))
+
+        mock_get.assert_called_once_with(rdap.RDAP_URL.format('8.0.0.0/8'),
+                                         headers={'If-None-Match': '"abc"',
+                                                  'If-Modified-Since': 'Sat, 01 Jun 2019 16:00:00 GMT'},
+                                         timeout=30)
+        response.json.assert_not_called()
+
+    @patch('requests.get')
+    def test_changed(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {'handle': 'NET-8-0-0-0-1', 'startAddress': '8.0.0.0',
+                                      'endAddress': '8.255.255.255', 'name': 'NEW'}
+        response.headers = {'ETag': '"def"'}
+        mock_get.return_value = response
+
+        status, data = rdap.revalidate(self.root)
+
+        expected = [{'class': 'root', 'handle': 'NET-8-0-0-0-1', 'startAddress': '8.0.0.0',
+                     'endAddress': '8.255.255.255', 'name': 'NEW', 'etag': '"def"'}]
+
+        self.assertEqual('changed', status)
+        self.assertEqual(expected, data)
+
+    @patch('requests.get')
+    def test_other_network(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {'handle': 'NET-8-0-0-0-2', 'startAddress': '8.0.0.0',
+                                      'endAddress': '8.0.0.255', 'name': 'CHILD'}
+        response.headers = {}
+        mock_get.return_value = response
+
+        with self.assertRaises(Exception):
+            rdap.revalidate({'handle': 'NET-8-0-0-0-1', 'startAddress': '8.0.0.0', 'endAddress': '8.0.1.127'})
+
+    @patch('requests.get')
+    def test_gone(self, mock_get):
+        response = MagicMock()
+        response.status_code = 404
+        mock_get.return_value = response
+
+        self.assertEqual(('gone', None), rdap.revalidate(self.root))
+
+    @patch('requests.get')
+    def test_not_cidr(self, mock_get):
+        response = MagicMock()
+        response.status_code = 304
+        mock_get.return_value = response
+
+        rdap.revalidate({'startAddress': '8.0.0.0', 'endAddress': '8.0.0.2'})
+
+        mock_get.assert_called_once_with(rdap.RDAP_URL.format('8.0.0.0'), headers={}, timeout=30)
+
+    @patch('requests.get')
+    def test_bootstrap(self, mock_get):
+        response = MagicMock()
+        response.status_code = 304
+        mock_get.return_value = response
+
+        rdap.revalidate({'startAddress': '1.1.1.0', 'endAddress': '1.1.1.255'},
+                        bootstrap=rdap.Bootstrap.from_data(BOOTSTRAP_DATA))
+
+        self.assertEqual('https://rdap.apnic.net/ip/1.1.1.0/24', mock_get.call_args[0][0])
+
+    @patch('requests.get')
+    def test_validators_kept(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {'handle': 'NET'}
+        response.headers = {'ETag': '"abc"', 'Last-Modified': 'Sat, 01 Jun 2019 16:00:00 GMT'}
+        mock_get.return_value = response
+
+        actual = rdap.get('8.8.8.8')
+
+        self.assertEqual('"abc"', actual[0]['etag'])
+        self.assertEqual('Sat, 01 Jun 2019 16:00:00 GMT', actual[0]['last_modified'])
@@ -0,0 +1,214 @@
+import unittest
+import unittest.mock
+import os
+import gzip
+import json
+import tempfile
+from challenge import rdap, rdap_import, warehouse
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+RPSL = '''% This is the RIPE Database dump.
+% The objects are in RPSL format.
+
+inetnum:        193.0.0.0 - 193.0.7.255
+netname:        RIPE-NCC
+descr:          RIPE Network Coordination Centre
+org:            ORG-RIEN1-RIPE
+country:        NL
+admin-c:        BRD-RIPE
+tech-c:         OPS4-RIPE
+tech-c:         RD132-RIPE
+status:         ASSIGNED PA
+mnt-by:         RIPE-NCC-MNT
+created:        2003-03-17T12:15:57Z
+last-modified:  2017-12-04T14:42:31Z
+source:         RIPE
+
+inetnum:        193.0.0.0 - 193.0.0.255
+netname:        RIPE-NCC-WEB
+descr:          a description
+                that goes on
+status:         ASSIGNED PA
+source:         RIPE
+
+inet6num:       2001:67c:2e8::/48
+netname:        RIPE-NCC
+source:         RIPE
+
+NetHandle:      NET-8-0-0-0-1
+NetRange:       8.0.0.0 - 8.255.255.255
+NetName:        LVLT-ORG-8-8
+NetType:        Direct Allocation
+OrgID:          LPL-141
+RegDate:        1992-12-01
+Updated:        2018-04-23
+'''
+
+NETWORK = {
+    'objectClassName': 'ip network',
+    'handle': 'NET-1-1-1-0-1',
+    'startAddress': '1.1.1.0',
+    'endAddress': '1.1.1.255',
+    'name': 'APNIC-LABS',
+    'entities': [{'objectClassName': 'entity', 'handle': 'AIC3-AP', 'roles': ['technical']}]
+}
+
+
+class TestReadRpsl(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'ripe.db.inetnum')
+
+        with open(self.path, 'w') as file:
+            file.write(RPSL)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test(self):
+        networks = list(rdap_import.read_dump(self.path))
+
+        self.assertEqual(['193.0.0.0 - 193.0.7.255', '193.0.0.0 - 193.0.0.255', 'NET-8-0-0-0-1'],
+                         [network['handle'] for network in networks])
+
+    def test_inetnum(self):
+        expected = {
+            'objectClassName': 'ip network',
+            'handle': '193.0.0.0 - 193.0.7.255',
+            'startAddress': '193.0.0.0',
+            'endAddress': '193.0.7.255',
+            'ipVersion': 'v4',
+            'name': 'RIPE-NCC',
+            'type': 'ASSIGNED PA',
+            'events': [
+                {'eventAction': 'registration', 'eventDate': '2003-03-17T12:15:57Z'},
+                {'eventAction': 'last changed', 'eventDate': '2017-12-04T14:42:31Z'}
+            ],
+            'entities': [
+                {'objectClassName': 'entity', 'handle': 'ORG-RIEN1-RIPE', 'roles': ['registrant']},
+                {'objectClassName': 'entity', 'handle': 'BRD-RIPE', 'roles': ['administrative']},
+                {'objectClassName': 'entity', 'handle': 'OPS4-RIPE', 'roles': ['technical']},
+                {'objectClassName': 'entity', 'handle': 'RD132-RIPE', 'roles': ['technical']}
+            ]
+        }
+
+        self.assertEqual(expected, next(rdap_import.read_rpsl(self.path)))
+
+    def test_arin(self):
+        network = list(rdap_import.read_rpsl(self.path))[2]
+
+        self.assertEqual('LVLT-ORG-8-8', network['name'])
+        self.assertEqual('Direct Allocation', network['type'])
+        self.assertEqual([{'objectClassName': 'entity', 'handle': 'LPL-141', 'roles': ['registrant']}],
+                         network['entities'])
+
+    def test_gzip(self):
+        path = self.path + '.gz'
+        with gzip.open(path, 'wt') as file:
+            file.write(RPSL)
+
+        self.assertEqual(3, len(list(rdap_import.read_dump(path))))
+
+
+class TestReadRdap(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'dump.json')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self, text):
+        with open(self.path, 'w') as file:
+            file.write(text)
+
+        return list(rdap_import.read_dump(self.path))
+
+    def test_object(self):
+        self.assertEqual([NETWORK], self._read(json.dumps(NETWORK, indent=2)))
+
+    def test_list(self):
+        self.assertEqual([NETWORK, NETWORK], self._read(json.dumps([NETWORK, NETWORK], indent=2)))
+
+    def test_search_results(self):
+        self.assertEqual([NETWORK], self._read(json.dumps({'ipSearchResults': [NETWORK]})))
+
+    def test_ipv6(self):
+        ipv6 = {'objectClassName': 'ip network', 'handle': 'NET6-2001-4860-1', 'startAddress': '2001:4860::',
+                'endAddress': '2001:4860:ffff:ffff:ffff:ffff:ffff:ffff', 'ipVersion': 'v6'}
+        no_version = {'objectClassName': 'ip network', 'handle': 'NET6-2001-DB8-1', 'startAddress': '2001:db8::',
+                      'endAddress': '2001:db8::ffff'}
+
+        self.assertEqual([NETWORK], self._read('\n'.join(json.dumps(obj) for obj in [NETWORK, ipv6, no_version])))
+
+    def test_lines(self):
+        entity = {'objectClassName': 'entity', 'handle': 'AIC3-AP'}
+
+        actual = self._read('\n'.join(json.dumps(obj) for obj in [NETWORK, entity, NETWORK]))
+
+        self.assertEqual([NETWORK, NETWORK], actual)
+
+
+class TestImportDumps(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.wh = warehouse.Warehouse(os.path.join(self.temp_dir.name, 'data'))
+        self.path = os.path.join(self.temp_dir.name, 'ripe.db.inetnum')
+
+        with open(self.path, 'w') as file:
+            file.write(RPSL)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test(self):
+        ranges, stats = rdap_import.import_dumps([self.path], self.wh)
+
+        self.assertEqual({'added': 8, 'skipped': 0}, stats)
+        self.assertEqual(8, len(list(self.wh.read('rdap'))))
+
+        self.assertEqual(['193.0.0.0 - 193.0.0.255'], ranges.lookup('193.0.0.1'))
+        self.assertEqual(['193.0.0.0 - 193.0.7.255', 'ORG-RIEN1-RIPE', 'BRD-RIPE', 'OPS4-RIPE', 'RD132-RIPE'],
+                         ranges.lookup('193.0.1.1'))
+        self.assertEqual(['NET-8-0-0-0-1', 'LPL-141'], ranges.lookup('8.8.8.8'))
+        self.assertIsNone(ranges.lookup('9.9.9.9'))
+
+    def test_again(self):
+        ranges, _ = rdap_import.import_dumps([self.path], self.wh)
+
+        dump_path = os.path.join(self.temp_dir.name, 'dump.json')
+        with open(dump_path, 'w') as file:
+            json.dump(NETWORK, file)
+
+        ranges, stats = rdap_import.import_dumps([self.path, dump_path], self.wh, ranges)
+
+        self.assertEqual({'added': 2, 'skipped': 8}, stats)
+        self.assertEqual(['NET-8-0-0-0-1', 'LPL-141'], ranges.lookup('8.8.8.8'))
+        self.assertEqual(['NET-1-1-1-0-1', 'AIC3-AP'], ranges.lookup('1.1.1.1'))
+
+    def test_mixed_dump(self):
+        dump_path = os.path.join(self.temp_dir.name, 'dump.json')
+        with open(dump_path, 'w') as file:
+            file.write(json.dumps(NETWORK) + '\n')
+            file.write(json.dumps({'objectClassName': 'ip network', 'handle': 'NET6-2001-4860-1',
+                                   'startAddress': '2001:4860::', 'endAddress': '2001:4860::ffff',
+                                   'ipVersion': 'v6'}) + '\n')
+
+        ranges, stats = rdap_import.import_dumps([dump_path], self.wh)
+
+        self.assertEqual({'added': 2, 'skipped': 0}, stats)
+        self.assertEqual(['NET-1-1-1-0-1', 'AIC3-AP'], ranges.lookup('1.1.1.1'))
+
+    def test_main(self):
+        data_path = os.path.join(self.temp_dir.name, 'data')
+
+        with unittest.mock.patch('builtins.print'):
+            rdap_import.main([self.path, '--data', data_path])
+
+        ranges = rdap.RangeTable.load(self.wh.state_path(rdap_import.RANGES_STATE))
+
+        self.assertEqual(['NET-8-0-0-0-1', 'LPL-141'], ranges.lookup('8.8.8.8'))
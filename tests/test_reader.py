@@ -1,6 +1,12 @@
 import unittest
 import os
-from challenge import reader
+import gzip
+import bz2
+import lzma
+import shutil
+import tempfile
+from unittest.mock import patch
+from challenge import reader, sketch
 
 
 if __name__ == '__main__':
@@ -45,3 +51,321 @@ class TestReadIps(unittest.TestCase):
         actual = reader.read_ips('tests/resources/ips.txt')
 
         self.assertEqual(expected, actual)
+
+
+class TestReadIpsParallel(unittest.TestCase):
+    def setUp(self):
+        self.min_chunk_size = reader.MIN_CHUNK_SIZE
+        reader.MIN_CHUNK_SIZE = 64
+
+    def tearDown(self):
+        reader.MIN_CHUNK_SIZE = self.min_chunk_size
+
+    def test_none_path(self):
+        with self.assertRaises(TypeError):
+            reader.read_ips(None, workers=2)
+
+    def test_wrong_path(self):
+        with self.assertRaises(FileNotFoundError):
+            reader.read_ips('path/does/not/exist.txt', workers=2)
+
+    def test_empty_file(self):
+        path = 'test.txt'
+
+        open(path, 'w').close()
+
+        expected = {}
+        actual = reader.read_ips(path, workers=2)
+
+        self.assertEqual(expected, actual)
+
+        os.remove(path)
+
+    def test_same_as_serial(self):
+        path = 'tests/resources/ips.txt'
+
+        expected = reader.read_ips(path)
+        actual = reader.read_ips(path, workers=4)
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(list(expected), list(actual))
+
+    def test_more_chunks_than_workers(self):
+        path = 'tests/resources/ips.txt'
+        max_chunk_size = reader.MAX_CHUNK_SIZE
+        reader.MAX_CHUNK_SIZE = 128
+
+        try:
+            expected = reader.read_ips(path)
+
+            with patch('challenge.reader._split_chunks', wraps=reader._split_chunks) as mock_split:
+                actual = reader.read_ips(path, workers=2)
+
+            self.assertEqual(8, mock_split.call_args[0][3])
+            self.assertEqual(list(expected.items()), list(actual.items()))
+        finally:
+            reader.MAX_CHUNK_SIZE = max_chunk_size
+
+    def test_no_trailing_newline(self):
+        path = 'test.txt'
+
+        with open(path, 'w') as file:
+            file.write('1.1.1.1 filler filler filler filler filler filler\n' * 10 + '2.2.2.2')
+
+        expected = {'1.1.1.1': 10, '2.2.2.2': 1}
+        actual = reader.read_ips(path, workers=3)
+
+        self.assertEqual(expected, actual)
+
+        os.remove(path)
+
+
+class TestSplitChunks(unittest.TestCase):
+    def test_line_aligned(self):
+        data = b'aaaa\nbbbb\ncccc\ndddd\n'
+
+        chunks = reader._split_chunks(data, 0, len(data), 3)
+
+        self.assertEqual(0, chunks[0][0])
+        self.assertEqual(len(data), chunks[-1][1])
+        for start, end in chunks:
+            self.assertEqual(b'\n', data[end - 1:end])
+
+    def test_more_chunks_than_lines(self):
+        data = b'aaaa\n'
+
+        expected = [(0, 5)]
+        actual = reader._split_chunks(data, 0, len(data), 4)
+
+        self.assertEqual(expected, actual)
+
+
+class TestIterIps(unittest.TestCase):
+    def test_wrong_path(self):
+        with self.assertRaises(FileNotFoundError):
+            list(reader.iter_ips('path/does/not/exist.txt'))
+
+    def test(self):
+        path = 'tests/resources/ips.txt'
+
+        expected = list(reader.read_ips(path))
+        actual = list(reader.iter_ips(path))
+
+        self.assertEqual(expected, actual)
+
+    def test_sketch(self):
+        path = 'tests/resources/ips.txt'
+        ip_sketch = sketch.IpSketch()
+
+        expected = reader.read_ips(path)
+        actual = list(reader.iter_ips(path, sketch=ip_sketch))
+
+        self.assertEqual(list(expected), actual)
+        self.assertEqual(len(expected), ip_sketch.num_distinct())
+        for ip, count in expected.items():
+            self.assertEqual(count, ip_sketch.count(ip))
+
+
+class TestReadIpsCompressed(unittest.TestCase):
+    def setUp(self):
+        with open('tests/resources/ips.txt', 'rb') as file:
+            self.contents = file.read()
+
+        self.expected = reader.read_ips('tests/resources/ips.txt')
+
+    def test_gzip(self):
+        path = 'test.txt.gz'
+
+        with gzip.open(path, 'wb') as file:
+            file.write(self.contents)
+
+        self.assertEqual(self.expected, reader.read_ips(path))
+        self.assertEqual(self.expected, reader.read_ips(path, workers=2))
+        self.assertEqual(list(self.expected), list(reader.iter_ips(path)))
+
+        os.remove(path)
+
+    def test_bz2(self):
+        path = 'test.txt.bz2'
+
+        with bz2.open(path, 'wb') as file:
+            file.write(self.contents)
+
+        self.assertEqual(self.expected, reader.read_ips(path))
+
+        os.remove(path)
+
+    def test_xz(self):
+        path = 'test.txt.xz'
+
+        with lzma.open(path, 'wb') as file:
+            file.write(self.contents)
+
+        self.assertEqual(self.expected, reader.read_ips(path))
+
+        os.remove(path)
+
+
+class TestReadIpsMultipleFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        with open(os.path.join(self.dir, 'log'), 'w') as file:
+            file.write('1.1.1.1 2.2.2.2\n')
+
+        with gzip.open(os.path.join(self.dir, 'log.1.gz'), 'wt') as file:
+            file.write('2.2.2.2\n3.3.3.3\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_directory(self):
+        expected = {'1.1.1.1': 1, '2.2.2.2': 2, '3.3.3.3': 1}
+        actual = reader.read_ips(self.dir)
+
+        self.assertEqual(expected, actual)
+
+    def test_glob(self):
+        expected = {'2.2.2.2': 1, '3.3.3.3': 1}
+        actual = reader.read_ips(os.path.join(self.dir, '*.gz'))
+
+        self.assertEqual(expected, actual)
+
+    def test_glob_no_matches(self):
+        with self.assertRaises(FileNotFoundError):
+            reader.read_ips(os.path.join(self.dir, '*.bz2'))
+
+    def test_iter_ips(self):
+        expected = ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+        actual = list(reader.iter_ips(self.dir))
+
+        self.assertEqual(expected, actual)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.dir, 'log')
+        self.checkpoint_path = os.path.join(self.dir, 'checkpoints.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append(self, contents):
+        with open(self.log_path, 'a') as file:
+            file.write(contents)
+
+    def test_only_new_data(self):
+        self.append('1.1.1.1\n2.2.2.2\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'1.1.1.1': 1, '2.2.2.2': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+        checkpoint.save()
+
+        self.append('2.2.2.2\n3.3.3.3\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'2.2.2.2': 1, '3.3.3.3': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+        checkpoint.save()
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+
+    def test_not_saved(self):
+        self.append('1.1.1.1\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        reader.read_ips(self.log_path, checkpoint=checkpoint)
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'1.1.1.1': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+
+    def test_partial_line(self):
+        self.append('1.1.1.1\n2.2.2')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'1.1.1.1': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+        checkpoint.save()
+
+        self.append('.2\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'2.2.2.2': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+
+    def test_truncated(self):
+        self.append('1.1.1.1\n2.2.2.2\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        reader.read_ips(self.log_path, checkpoint=checkpoint)
+        checkpoint.save()
+
+        open(self.log_path, 'w').close()
+        self.append('3.3.3.3\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'3.3.3.3': 1}, reader.read_ips(self.log_path, checkpoint=checkpoint))
+
+    def test_compressed_unchanged(self):
+        path = os.path.join(self.dir, 'log.1.gz')
+        with gzip.open(path, 'wt') as file:
+            file.write('1.1.1.1\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'1.1.1.1': 1}, reader.read_ips(path, checkpoint=checkpoint))
+        checkpoint.save()
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({}, reader.read_ips(path, checkpoint=checkpoint))
+
+    def test_iter_ips(self):
+        self.append('1.1.1.1\n2.2.2.2\n')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual(['1.1.1.1', '2.2.2.2'], list(reader.iter_ips(self.log_path, checkpoint=checkpoint)))
+        checkpoint.save()
+
+        self.append('2.2.2.2\n3.3.3.3\n4.4.4')
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual(['2.2.2.2', '3.3.3.3'], list(reader.iter_ips(self.log_path, checkpoint=checkpoint)))
+
+    def test_parallel(self):
+        self.append('1.1.1.1\n' * 50)
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        reader.read_ips(self.log_path, checkpoint=checkpoint)
+        checkpoint.save()
+
+        self.append('2.2.2.2\n' * 50)
+
+        checkpoint = reader.Checkpoint(self.checkpoint_path)
+        self.assertEqual({'2.2.2.2': 50}, reader.read_ips(self.log_path, workers=2, checkpoint=checkpoint))
+
+
+class TestReadIpsPacked(unittest.TestCase):
+    def test(self):
+        path = 'tests/resources/ips.txt'
+
+        expected = reader.read_ips(path)
+        actual = reader.read_ips(path, packed=True)
+
+        self.assertEqual(expected, actual.to_dict())
+
+    def test_parallel(self):
+        path = 'tests/resources/ips.txt'
+
+        expected = reader.read_ips(path)
+        actual = reader.read_ips(path, workers=2, packed=True)
+
+        self.assertEqual(expected, actual.to_dict())
+
+    def test_empty_file(self):
+        path = 'test.txt'
+
+        open(path, 'w').close()
+
+        actual = reader.read_ips(path, packed=True)
+
+        self.assertEqual({}, actual.to_dict())
+
+        os.remove(path)
@@ -0,0 +1,132 @@
+import unittest
+import tempfile
+from unittest.mock import patch
+from challenge import mockserver, rdap, refresh, upstream, warehouse
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.server = mockserver.MockServer().start()
+        self.addCleanup(self.server.stop)
+
+        rdap_patcher = patch('challenge.rdap.RDAP_URL', self.server.rdap_url())
+        rdap_patcher.start()
+        self.addCleanup(rdap_patcher.stop)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.wh = warehouse.Warehouse(self.temp_dir.name)
+
+        with self.wh.open() as wh:
+            for ip in ['8.8.8.8', '1.1.1.1']:
+                for item in rdap.get(ip):
+                    wh.write('rdap', item)
+
+                    if 'handle' in item:
+                        wh.write('ip_rdap', {'ip': ip, 'handle': item['handle']})
+
+            # in the same network as 8.8.8.8
+            for item in rdap.get('8.8.4.4'):
+                if 'handle' in item:
+                    wh.write('ip_rdap', {'ip': '8.8.4.4', 'handle': item['handle']})
+
+    def test_unchanged(self):
+        requests = self.server.requests
+        before = list(self.wh.read('rdap'))
+
+        stats = refresh.refresh(self.wh, upstream.UpstreamGroup('rdap'))
+
+        expected = {'unchanged': 2, 'changed': 0, 'gone': 0, 'failed': 0, 'replaced': 0, 'added': 0, 'linked': 0,
+                    'unlinked': 0}
+
+        self.assertEqual(expected, stats)
+        self.assertEqual(2, self.server.requests - requests)
+        self.assertEqual(before, list(self.wh.read('rdap')))
+
+    def test_changed(self):
+        ip_rdap = list(self.wh.read('ip_rdap'))
+        payload = mockserver.rdap_payload
+
+        # the networks lose their contacts and gain a new one
+        def changed_payload(ip):
+            data = payload(ip)
+            data['name'] = 'CHANGED'
+            data['entities'] = [{'objectClassName': 'entity', 'handle': f'NEW-{data["handle"]}', 'roles': ['abuse']}]
+            return data
+
+        with patch('challenge.mockserver.rdap_payload', side_effect=changed_payload):
+            stats = refresh.refresh(self.wh)
+
+        self.assertEqual(2, stats['changed'])
+        self.assertEqual(2, stats['replaced'])
+        self.assertEqual(2, stats['added'])
+        self.assertEqual(3, stats['linked'])
+        self.assertEqual(len(ip_rdap) - 3, stats['unlinked'])
+
+        expected = [
+            ('1.1.1.1', 'NET-1-1-0-0-1'),
+            ('1.1.1.1', 'NEW-NET-1-1-0-0-1'),
+            ('8.8.4.4', 'NET-8-8-0-0-1'),
+            ('8.8.4.4', 'NEW-NET-8-8-0-0-1'),
+            ('8.8.8.8', 'NET-8-8-0-0-1'),
+            ('8.8.8.8', 'NEW-NET-8-8-0-0-1')
+        ]
+        actual = sorted((event['ip'], event['handle']) for event in self.wh.read('ip_rdap'))
+
+        self.assertEqual(expected, actual)
+
+        root = next(event for event in self.wh.read('rdap') if event['handle'] == 'NET-8-8-0-0-1')
+        self.assertEqual('CHANGED', root['name'])
+
+    def test_other_network(self):
+        # not a single CIDR, so it is queried by its start address
+        with self.wh.open() as wh:
+            wh.write('rdap', {'class': 'root', 'handle': 'NET-9-9-0-0-1', 'startAddress': '9.9.0.0',
+                              'endAddress': '9.9.1.127'})
+            wh.write('ip_rdap', {'ip': '9.9.1.1', 'handle': 'NET-9-9-0-0-1'})
+
+        rdap_events = list(self.wh.read('rdap'))
+        ip_rdap = list(self.wh.read('ip_rdap'))
+        payload = mockserver.rdap_payload
+
+        # the registry has a more specific network at its start, which does not contain 9.9.1.1
+        def child_payload(ip):
+            data = payload(ip)
+            if ip == '9.9.0.0':
+                data['handle'] = 'NET-9-9-0-0-2'
+                data['endAddress'] = '9.9.0.255'
+            return data
+
+        with patch('challenge.mockserver.rdap_payload', side_effect=child_payload):
+            stats = refresh.refresh(self.wh)
+
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(2, stats['unchanged'])
+        self.assertEqual(rdap_events, list(self.wh.read('rdap')))
+        self.assertEqual(ip_rdap, list(self.wh.read('ip_rdap')))
+
+    def test_no_validators(self):
+        with self.wh.open() as wh:
+            wh.write('rdap', {'class': 'root', 'handle': 'NET-9-9-0-0-1', 'startAddress': '9.9.0.0',
+                              'endAddress': '9.9.255.255', 'name': 'OLD'})
+
+        stats = refresh.refresh(self.wh)
+
+        self.assertEqual(1, stats['changed'])
+        self.assertEqual(1, stats['replaced'])
+
+        root = next(event for event in self.wh.read('rdap') if event['handle'] == 'NET-9-9-0-0-1')
+        self.assertEqual('MOCK-NET-9-9', root['name'])
+        self.assertIn('etag', root)
+
+        self.assertEqual(3, refresh.refresh(self.wh)['unchanged'])
+
+    def test_main(self):
+        with patch('builtins.print') as mock_print:
+            refresh.main(['--data', self.temp_dir.name, '--concurrency', '2'])
+
+        mock_print.assert_any_call('2 unchanged / 0 changed / 0 gone / 0 failed')
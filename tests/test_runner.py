@@ -0,0 +1,153 @@
+import io
+import unittest
+import tempfile
+from pathlib import Path
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from challenge import benchmark, enrich, journal, mockserver, runner, warehouse
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestReadData(unittest.TestCase):
+    def setUp(self):
+        self.server = mockserver.MockServer().start()
+        self.addCleanup(self.server.stop)
+
+        for patcher in (patch('challenge.geoip.GEO_IP_URL', self.server.geoip_url()),
+                        patch('challenge.rdap.RDAP_URL', self.server.rdap_url())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.ips = benchmark.generate_ips(3)
+        self.ip_path = Path(self.temp_dir.name) / 'ips.txt'
+        self.ip_path.write_text('\n'.join(self.ips) + '\n')
+
+        self.warehouse = warehouse.Warehouse(Path(self.temp_dir.name) / 'data')
+        self.journal_path = self.warehouse.state_path('journal.ndjson')
+
+    def _run(self, *args):
+        # without planning, only the journal keeps completed IPs from being looked up again
+        challenge = runner.Challenge([str(self.ip_path), '--engine', 'async', '--retries', '0', '--no-plan'] +
+                                     list(args))
+        challenge.warehouse = self.warehouse
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run_progress = challenge.read_data(str(self.ip_path))
+
+        return output.getvalue(), run_progress.done
+
+    def _interrupt_after(self, ip, written=True):
+        """
+        Leave the journal (and warehouse) of a run that was killed after completing one IP.
+        :param ip: the completed IP
+        :param written: whether its result had made it into the warehouse as well
+        :return: None
+        """
+        result = enrich.retrieve_ip_data(ip)
+        self.assertEqual([], result['errors'])
+
+        run_journal = journal.Journal(self.journal_path)
+        run_journal.append(result)
+        run_journal.close()
+
+        if written:
+            with self.warehouse.open() as wh:
+                runner.Challenge._write_result(wh, result, {index: {'added': 0, 'skipped': 0}
+                                                            for index in enrich.INDICES})
+
+    def _assert_written_once(self):
+        geoip_ips = [event['ip'] for event in self.warehouse.read('geoip')]
+        self.assertCountEqual(self.ips, geoip_ips)
+
+    def test(self):
+        output, done = self._run()
+
+        self.assertNotIn('Resuming', output)
+        self.assertEqual(3, done)
+        self._assert_written_once()
+        self.assertFalse(self.journal_path.exists())
+
+    def test_resume(self):
+        self._interrupt_after(self.ips[0])
+        requests = self.server.requests
+
+        output, done = self._run()
+
+        self.assertIn('Resuming: 1 IPs were completed by an interrupted run.', output)
+        self.assertEqual(2, done)
+        # one GeoIP and one RDAP request for each of the other IPs
+        self.assertEqual(4, self.server.requests - requests)
+        self._assert_written_once()
+        self.assertFalse(self.journal_path.exists())
+
+    def test_resume_not_written(self):
+        self._interrupt_after(self.ips[0], written=False)
+
+        output, done = self._run()
+
+        self.assertIn('Resuming: 1 IPs were completed by an interrupted run.', output)
+        self.assertEqual(2, done)
+        self._assert_written_once()
+
+    def test_resume_packed(self):
+        self._interrupt_after(self.ips[0])
+
+        output, done = self._run('--packed')
+
+        self.assertIn('Resuming: 1 IPs were completed by an interrupted run.', output)
+        self.assertEqual(2, done)
+        self._assert_written_once()
+        self.assertFalse(self.journal_path.exists())
+
+    def test_resume_stream(self):
+        self._interrupt_after(self.ips[0])
+
+        output, done = self._run('--stream')
+
+        self.assertIn('Resuming: 1 IPs were completed by an interrupted run.', output)
+        self.assertEqual(2, done)
+        self._assert_written_once()
+        self.assertFalse(self.journal_path.exists())
+
+    def test_failed_not_journaled(self):
+        self.server.error_rate = 1.0
+        self._run()
+
+        self.assertFalse(self.journal_path.exists())
+
+        self.server.error_rate = 0.0
+        output, done = self._run()
+
+        self.assertNotIn('Resuming', output)
+        self.assertEqual(3, done)
+
+    @patch('challenge.runner.FLUSH_INTERVAL', 2)
+    def test_writer(self):
+        self.ips = benchmark.generate_ips(10)
+        self.ip_path.write_text('\n'.join(self.ips) + '\n')
+
+        _, done = self._run('--concurrency', '4')
+
+        self.assertEqual(10, done)
+        self._assert_written_once()
+
+    def test_writer_error(self):
+        with patch.object(runner.Challenge, '_write_result', side_effect=Exception('Disk full')):
+            with self.assertRaisesRegex(Exception, 'Disk full'):
+                self._run('--concurrency', '1')
+
+        # the journal of the failed run is kept, and the next run picks up from it
+        self.assertTrue(self.journal_path.exists())
+
+        output, done = self._run()
+
+        self.assertIn('Resuming', output)
+        self._assert_written_once()
+        self.assertFalse(self.journal_path.exists())
@@ -0,0 +1,120 @@
+import unittest
+from challenge import sketch
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_bad_precision(self):
+        with self.assertRaises(Exception):
+            sketch.HyperLogLog(precision=2)
+
+    def test_empty(self):
+        self.assertEqual(0, sketch.HyperLogLog().count())
+
+    def test_duplicates(self):
+        hll = sketch.HyperLogLog()
+
+        for _ in range(10):
+            for i in range(100):
+                hll.add(f'10.0.0.{i}')
+
+        self.assertEqual(100, hll.count())
+
+    def test_large(self):
+        hll = sketch.HyperLogLog()
+
+        for i in range(50000):
+            hll.add(f'10.{i // 65536}.{i // 256 % 256}.{i % 256}')
+
+        self.assertAlmostEqual(50000, hll.count(), delta=50000 * 0.05)
+
+    def test_merge(self):
+        hll1 = sketch.HyperLogLog()
+        hll2 = sketch.HyperLogLog()
+
+        for i in range(100):
+            hll1.add(f'10.0.0.{i}')
+            hll2.add(f'10.0.1.{i}')
+
+        hll1.merge(hll2)
+
+        self.assertAlmostEqual(200, hll1.count(), delta=5)
+
+    def test_merge_different_precision(self):
+        with self.assertRaises(Exception):
+            sketch.HyperLogLog(precision=10).merge(sketch.HyperLogLog(precision=12))
+
+
+class TestCountMinSketch(unittest.TestCase):
+    def test_unseen(self):
+        self.assertEqual(0, sketch.CountMinSketch().estimate('1.1.1.1'))
+
+    def test_add(self):
+        cms = sketch.CountMinSketch()
+
+        self.assertEqual(1, cms.add('1.1.1.1'))
+        self.assertEqual(2, cms.add('1.1.1.1'))
+        self.assertEqual(5, cms.add('1.1.1.1', count=3))
+        self.assertEqual(5, cms.estimate('1.1.1.1'))
+
+    def test_never_underestimates(self):
+        cms = sketch.CountMinSketch(width=16, depth=2)
+
+        for i in range(100):
+            for _ in range(i % 5 + 1):
+                cms.add(str(i))
+
+        for i in range(100):
+            self.assertGreaterEqual(cms.estimate(str(i)), i % 5 + 1)
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_bad_parameters(self):
+        with self.assertRaises(Exception):
+            sketch.BloomFilter(capacity=0)
+
+        with self.assertRaises(Exception):
+            sketch.BloomFilter(error_rate=1)
+
+    def test_add(self):
+        bloom = sketch.BloomFilter(capacity=100, error_rate=0.01)
+
+        self.assertNotIn('1.1.1.1', bloom)
+        self.assertTrue(bloom.add('1.1.1.1'))
+        self.assertFalse(bloom.add('1.1.1.1'))
+        self.assertIn('1.1.1.1', bloom)
+
+    def test_error_rate(self):
+        bloom = sketch.BloomFilter(capacity=100000, error_rate=0.01)
+
+        for i in range(100000):
+            bloom.add(str(i))
+
+        false_positives = sum(str(-i) in bloom for i in range(1, 10001))
+
+        self.assertLess(false_positives, 200)
+
+
+class TestIpSketch(unittest.TestCase):
+    def test_add(self):
+        ip_sketch = sketch.IpSketch()
+
+        self.assertTrue(ip_sketch.add('1.1.1.1'))
+        self.assertFalse(ip_sketch.add('1.1.1.1'))
+        self.assertTrue(ip_sketch.add('2.2.2.2'))
+
+        self.assertEqual(2, ip_sketch.count('1.1.1.1'))
+        self.assertEqual(2, ip_sketch.num_distinct())
+
+    def test_many_distinct(self):
+        # well past what the count-min sketch alone could tell apart
+        ip_sketch = sketch.IpSketch(capacity=300000, error_rate=0.001)
+        ips = [f'{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}.{i % 7}' for i in range(300000)]
+
+        new = sum(ip_sketch.add(ip) for ip in ips)
+
+        self.assertGreater(new, 300000 * 0.995)
+        self.assertEqual(0, sum(ip_sketch.add(ip) for ip in ips[:10000]))
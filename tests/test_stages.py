@@ -0,0 +1,68 @@
+import unittest
+import threading
+from challenge import stages
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestPrefetch(unittest.TestCase):
+    def test(self):
+        self.assertEqual(list(range(100)), list(stages.prefetch(range(100), size=10)))
+
+    def test_empty(self):
+        self.assertEqual([], list(stages.prefetch([])))
+
+    def test_error(self):
+        def produce():
+            yield 1
+            raise Exception('derp')
+
+        items = stages.prefetch(produce())
+
+        self.assertEqual(1, next(items))
+        with self.assertRaises(Exception):
+            next(items)
+
+    def test_bounded(self):
+        produced = []
+        finished = threading.Event()
+
+        def produce():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    yield i
+            finally:
+                finished.set()
+
+        items = stages.prefetch(produce(), size=5)
+        next(items)
+        items.close()
+
+        self.assertTrue(finished.wait(5))
+        self.assertLess(len(produced), 100)
+
+
+class TestStage(unittest.TestCase):
+    def test(self):
+        items = []
+
+        stage = stages.Stage(items.append, size=2)
+        for i in range(50):
+            stage.put(i)
+        stage.close()
+
+        self.assertEqual(list(range(50)), items)
+
+    def test_error(self):
+        def fail(item):
+            raise Exception('derp')
+
+        stage = stages.Stage(fail, size=1)
+
+        with self.assertRaises(Exception):
+            for i in range(10):
+                stage.put(i)
+            stage.close()
@@ -0,0 +1,448 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import requests
+from unittest.mock import patch, MagicMock
+from challenge import upstream, geoip, cache
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestUpstream(unittest.TestCase):
+    def test_session_reused(self):
+        up = upstream.Upstream('geoip')
+
+        self.assertIs(up.session, up.session)
+
+    def test_pickle(self):
+        up = upstream.Upstream('geoip', pool_size=20)
+        session = up.session
+
+        actual = pickle.loads(pickle.dumps(up))
+
+        self.assertEqual('geoip', actual.name)
+        self.assertEqual(20, actual.pool_size)
+        self.assertIsNone(actual._session)
+        self.assertIsNot(session, actual.session)
+
+    @patch('requests.Session.get')
+    def test_get(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        mock_get.return_value = response
+
+        actual = upstream.Upstream('geoip').get('http://example.com')
+
+        self.assertIs(response, actual)
+        mock_get.assert_called_once_with('http://example.com', headers=None, timeout=30)
+
+    def test_close(self):
+        up = upstream.Upstream('geoip')
+        session = up.session
+
+        up.close()
+
+        self.assertIsNot(session, up.session)
+
+    @patch('requests.get')
+    def test_used_by_geoip(self, mock_get):
+        response = MagicMock()
+        response.json = MagicMock(return_value={'ip': '1.1.1.1'})
+
+        up = MagicMock()
+        up.get = MagicMock(return_value=response)
+
+        actual = geoip.get('1.1.1.1', upstream=up)
+
+        self.assertEqual({'ip': '1.1.1.1'}, actual)
+        up.get.assert_called_once()
+        mock_get.assert_not_called()
+
+    def test_not_json(self):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.side_effect = ValueError('Expecting value: line 1 column 1 (char 0)')
+        up = MagicMock()
+        up.get = MagicMock(return_value=response)
+
+        with self.assertRaises(upstream.UpstreamError):
+            geoip.get('1.1.1.1', upstream=up)
+
+
+class TestUpstreamCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = cache.ResponseCache(os.path.join(self.dir, 'cache.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    @patch('requests.Session.get')
+    def test_cached(self, mock_get):
+        response = MagicMock()
+        response.status_code = 200
+        response.text = '{"ip": "1.1.1.1"}'
+        mock_get.return_value = response
+
+        up = upstream.Upstream('geoip', cache=self.cache)
+
+        self.assertIs(response, up.get('http://example.com/1.1.1.1'))
+        self.assertEqual({'ip': '1.1.1.1'}, up.get('http://example.com/1.1.1.1').json())
+        mock_get.assert_called_once()
+        self.assertEqual([False, True], [cached for _, cached in up.drain_samples()])
+
+    @patch('requests.Session.get')
+    def test_error_not_cached(self, mock_get):
+        response = MagicMock()
+        response.status_code = 500
+        response.text = 'error'
+        mock_get.return_value = response
+
+        up = upstream.Upstream('geoip', cache=self.cache, retries=0)
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com/1.1.1.1')
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com/1.1.1.1')
+
+        self.assertEqual(2, mock_get.call_count)
+
+    @patch('requests.Session.get')
+    def test_geoip_error_not_cached(self, mock_get):
+        error = MagicMock()
+        error.status_code = 200
+        error.text = '{"success": false, "error": {"code": 104, "type": "usage_limit_reached"}}'
+        error.json.return_value = {'success': False, 'error': {'code': 104, 'type': 'usage_limit_reached'}}
+
+        response = MagicMock()
+        response.status_code = 200
+        response.text = '{"ip": "1.1.1.1"}'
+        response.json.return_value = {'ip': '1.1.1.1'}
+
+        mock_get.side_effect = [error, response]
+
+        up = upstream.Upstream('geoip', cache=self.cache, cacheable=geoip.is_cacheable)
+
+        self.assertIs(error, up.get('http://example.com/1.1.1.1'))
+        self.assertIs(response, up.get('http://example.com/1.1.1.1'))
+        self.assertEqual({'ip': '1.1.1.1'}, up.get('http://example.com/1.1.1.1').json())
+        self.assertEqual(2, mock_get.call_count)
+
+
+def _response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+@patch('time.sleep')
+class TestUpstreamRetries(unittest.TestCase):
+    @patch('requests.Session.get')
+    def test_retried(self, mock_get, mock_sleep):
+        mock_get.side_effect = [_response(503), _response(502), _response(200)]
+
+        actual = upstream.Upstream('rdap').get('http://example.com')
+
+        self.assertEqual(200, actual.status_code)
+        self.assertEqual(3, mock_get.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+
+    @patch('requests.Session.get')
+    def test_connection_error_retried(self, mock_get, mock_sleep):
+        mock_get.side_effect = [requests.ConnectionError(), _response(200)]
+
+        actual = upstream.Upstream('rdap').get('http://example.com')
+
+        self.assertEqual(200, actual.status_code)
+
+    @patch('requests.Session.get')
+    def test_not_found_not_retried(self, mock_get, mock_sleep):
+        mock_get.return_value = _response(404)
+
+        actual = upstream.Upstream('rdap').get('http://example.com')
+
+        self.assertEqual(404, actual.status_code)
+        mock_get.assert_called_once()
+
+    @patch('requests.Session.get')
+    def test_retries_exhausted(self, mock_get, mock_sleep):
+        mock_get.return_value = _response(500)
+
+        with self.assertRaises(upstream.UpstreamError):
+            upstream.Upstream('rdap', retries=2).get('http://example.com')
+
+        self.assertEqual(3, mock_get.call_count)
+
+    @patch('requests.Session.get')
+    def test_retry_after(self, mock_get, mock_sleep):
+        mock_get.side_effect = [_response(429, {'Retry-After': '7'}), _response(200)]
+
+        upstream.Upstream('geoip').get('http://example.com')
+
+        mock_sleep.assert_called_once_with(7.0)
+
+    @patch('requests.Session.get')
+    def test_throttle_backs_off(self, mock_get, mock_sleep):
+        mock_get.side_effect = [_response(429), _response(200)]
+
+        up = upstream.Upstream('geoip', pool_size=40)
+        limit = up.limiter.limit
+        up.get('http://example.com')
+
+        self.assertEqual(limit // 2, up.limiter.limit)
+
+    @patch('requests.Session.get')
+    def test_circuit_open(self, mock_get, mock_sleep):
+        mock_get.return_value = _response(500)
+
+        up = upstream.Upstream('geoip', retries=0)
+        for _ in range(up.breaker.threshold):
+            with self.assertRaises(upstream.UpstreamError):
+                up.get('http://example.com')
+
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com')
+
+        self.assertEqual(up.breaker.threshold, mock_get.call_count)
+
+    @patch('requests.Session.get')
+    def test_throttle_does_not_open_circuit(self, mock_get, mock_sleep):
+        mock_get.return_value = _response(429)
+
+        up = upstream.Upstream('geoip', retries=0)
+        for _ in range(up.breaker.threshold + 1):
+            with self.assertRaises(upstream.UpstreamError):
+                up.get('http://example.com')
+
+        self.assertEqual(up.breaker.threshold + 1, mock_get.call_count)
+
+    @patch('requests.Session.get')
+    def test_truncated_body_retried(self, mock_get, mock_sleep):
+        mock_get.side_effect = [requests.exceptions.ChunkedEncodingError(), _response(200)]
+
+        actual = upstream.Upstream('rdap').get('http://example.com')
+
+        self.assertEqual(200, actual.status_code)
+
+    @patch('requests.Session.get')
+    def test_trial_throttled(self, mock_get, mock_sleep):
+        mock_get.side_effect = [_response(500), _response(429), _response(200)]
+
+        up = upstream.Upstream('geoip', retries=0)
+        up.breaker = upstream.CircuitBreaker(threshold=1, reset_timeout=0)
+
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com')
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com')
+
+        self.assertEqual(200, up.get('http://example.com').status_code)
+        self.assertEqual(3, mock_get.call_count)
+
+    @patch('requests.Session.get')
+    def test_trial_unexpected_error(self, mock_get, mock_sleep):
+        mock_get.side_effect = [_response(500), RuntimeError('derp'), _response(200)]
+
+        up = upstream.Upstream('geoip', retries=0)
+        up.breaker = upstream.CircuitBreaker(threshold=1, reset_timeout=0)
+
+        with self.assertRaises(upstream.UpstreamError):
+            up.get('http://example.com')
+        with self.assertRaises(RuntimeError):
+            up.get('http://example.com')
+
+        self.assertEqual(200, up.get('http://example.com').status_code)
+
+    def test_backoff_jittered(self, mock_sleep):
+        up = upstream.Upstream('geoip', backoff=1, max_backoff=5)
+
+        for attempt in range(6):
+            delay = up._backoff_delay(attempt, None)
+            self.assertTrue(0 <= delay <= min(5, 2 ** attempt))
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_alone(self):
+        flights = upstream.SingleFlight()
+
+        self.assertEqual((1, False), flights.do('key', lambda: 1))
+        self.assertEqual({}, flights.calls)
+
+    def test_shared(self):
+        flights = upstream.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('key', func))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([('result', False), ('result', True), ('result', True)], results)
+
+    def test_error_shared(self):
+        flights = upstream.SingleFlight()
+        call = upstream._Call()
+        call.error = upstream.UpstreamError('derp')
+        call.done.set()
+        flights.calls['key'] = call
+
+        with self.assertRaises(upstream.UpstreamError):
+            flights.do('key', lambda: 1)
+
+    def test_pickle(self):
+        flights = upstream.SingleFlight()
+        flights.calls['key'] = upstream._Call()
+
+        self.assertEqual({}, pickle.loads(pickle.dumps(flights)).calls)
+
+
+class TestUpstreamGroup(unittest.TestCase):
+    def test_per_host(self):
+        group = upstream.UpstreamGroup('rdap', pool_size=5)
+
+        arin = group.upstream('https://rdap.arin.net/registry/ip/8.8.8.8')
+
+        self.assertIs(arin, group.upstream('https://rdap.arin.net/registry/ip/8.8.4.4'))
+        self.assertIsNot(arin, group.upstream('https://rdap.apnic.net/ip/1.1.1.1'))
+        self.assertEqual(5, arin.pool_size)
+        self.assertEqual(5, group.pool_size)
+
+    @patch('requests.Session.get')
+    def test_get(self, mock_get):
+        mock_get.return_value = _response(200)
+
+        group = upstream.UpstreamGroup('rdap')
+        group.get('https://rdap.arin.net/registry/ip/8.8.8.8')
+        group.get('https://rdap.apnic.net/ip/1.1.1.1')
+
+        self.assertEqual(2, len(group.upstreams))
+        self.assertEqual(2, len(group.drain_samples()))
+
+    def test_pickle(self):
+        group = upstream.UpstreamGroup('rdap', pool_size=5)
+        group.upstream('https://rdap.arin.net/registry/ip/8.8.8.8')
+
+        actual = pickle.loads(pickle.dumps(group))
+
+        self.assertEqual(['rdap.arin.net'], list(actual.upstreams))
+
+
+class TestAimdLimiter(unittest.TestCase):
+    def test_increase(self):
+        limiter = upstream.AimdLimiter(10, initial=2)
+
+        limiter.on_success()
+        limiter.on_success()
+
+        self.assertEqual(3, limiter.limit)
+
+    def test_maximum(self):
+        limiter = upstream.AimdLimiter(2, initial=2)
+
+        for _ in range(10):
+            limiter.on_success()
+
+        self.assertEqual(2, limiter.limit)
+
+    def test_decrease(self):
+        limiter = upstream.AimdLimiter(10, initial=8)
+
+        limiter.on_throttle()
+        self.assertEqual(4, limiter.limit)
+
+        for _ in range(5):
+            limiter.on_throttle()
+        self.assertEqual(1, limiter.limit)
+
+    def test_in_flight(self):
+        limiter = upstream.AimdLimiter(10, initial=2)
+
+        with limiter:
+            self.assertEqual(1, limiter.in_flight)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_pickle(self):
+        limiter = pickle.loads(pickle.dumps(upstream.AimdLimiter(10, initial=2)))
+
+        with limiter:
+            self.assertEqual(2, limiter.limit)
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch('time.sleep')
+    @patch('time.monotonic')
+    def test_acquire(self, mock_monotonic, mock_sleep):
+        mock_monotonic.return_value = 100.0
+        bucket = upstream.TokenBucket(2)
+
+        bucket.acquire()
+        bucket.acquire()
+        mock_sleep.assert_not_called()
+
+        mock_monotonic.side_effect = [100.0, 100.5]
+        bucket.acquire()
+        mock_sleep.assert_called_once_with(0.5)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    @patch('time.monotonic')
+    def test(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        breaker = upstream.CircuitBreaker(threshold=2, reset_timeout=10)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        mock_monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    @patch('time.monotonic')
+    def test_trial_failed(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        breaker = upstream.CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.record_failure()
+
+        mock_monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow())
+
+    @patch('time.monotonic')
+    def test_trial_throttled(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        breaker = upstream.CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.record_failure()
+
+        mock_monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_throttle()
+
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
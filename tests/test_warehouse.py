@@ -25,6 +25,84 @@ class TestOpen(unittest.TestCase):
         self.assertFalse(self.wh.opened)
 
 
+class TestIndexPaths(unittest.TestCase):
+    def setUp(self):
+        self.wh = warehouse.Warehouse(path=DATA_DIR)
+
+    def tearDown(self):
+        if self.wh.path.exists():
+            shutil.rmtree(str(self.wh.path))
+
+    def test_ignores_state(self):
+        with self.wh.open() as wh:
+            wh.write('geoip', {'ip': 5})
+
+        with self.wh.state_path('checkpoints.json').open('w') as file:
+            file.write('{}')
+
+        self.assertEqual([self.wh.path / 'geoip.json'], list(self.wh.index_paths()))
+
+        with self.wh.open():
+            self.assertEqual({'geoip': {5}}, self.wh.keys)
+
+
+class TestFlush(unittest.TestCase):
+    def setUp(self):
+        self.wh = warehouse.Warehouse(path=DATA_DIR)
+
+    def tearDown(self):
+        if self.wh.path.exists():
+            shutil.rmtree(str(self.wh.path))
+
+    def test(self):
+        with self.wh.open() as wh:
+            wh.write('geoip', {'ip': 5})
+            wh.flush()
+
+            self.assertEqual([{'ip': 5, 'index': 'geoip'}], list(wh.read('geoip')))
+
+
+class TestRewrite(unittest.TestCase):
+    def setUp(self):
+        self.wh = warehouse.Warehouse(path=DATA_DIR)
+
+        with self.wh.open() as wh:
+            wh.write('rdap', {'handle': 'NET-1', 'name': 'old'})
+            wh.write('rdap', {'handle': 'POC-1'})
+
+    def tearDown(self):
+        if self.wh.path.exists():
+            shutil.rmtree(str(self.wh.path))
+
+    def test(self):
+        actual = self.wh.rewrite('rdap', [{'handle': 'NET-1', 'name': 'new'}, {'handle': 'POC-2'}])
+
+        expected = [
+            {'handle': 'NET-1', 'name': 'new', 'index': 'rdap'},
+            {'handle': 'POC-1', 'index': 'rdap'},
+            {'handle': 'POC-2', 'index': 'rdap'}
+        ]
+
+        self.assertEqual((1, 1, 0), actual)
+        self.assertEqual(expected, list(self.wh.read('rdap')))
+        self.assertEqual(['rdap.json'], sorted(path.name for path in self.wh.path.glob('rdap.json*')))
+
+    def test_remove(self):
+        actual = self.wh.rewrite('rdap', [{'handle': 'POC-2'}], remove={'POC-1', 'POC-3'})
+
+        self.assertEqual((0, 1, 1), actual)
+        self.assertEqual(['NET-1', 'POC-2'], [event['handle'] for event in self.wh.read('rdap')])
+
+    def test_new_index(self):
+        self.assertEqual((0, 1, 0), self.wh.rewrite('geoip', [{'ip': '1.1.1.1'}]))
+        self.assertEqual([{'ip': '1.1.1.1', 'index': 'geoip'}], list(self.wh.read('geoip')))
+
+    def test_open(self):
+        with self.wh.open():
+            with self.assertRaises(Exception):
+                self.wh.rewrite('rdap', [])
+
+
 class TestWrite(unittest.TestCase):
     def setUp(self):
         self.wh = warehouse.Warehouse(path=DATA_DIR)
@@ -160,3 +238,25 @@ class TestWrite(unittest.TestCase):
         with (self.wh.path / 'rdap.json').open() as file:
             contents = json.loads(file.read())
             self.assertEqual(rdap_data1, contents)
+
+
+class TestRead(unittest.TestCase):
+    def setUp(self):
+        self.wh = warehouse.Warehouse(path=DATA_DIR)
+
+    def tearDown(self):
+        if self.wh.path.exists():
+            shutil.rmtree(str(self.wh.path))
+
+    def test_no_index(self):
+        self.assertEqual([], list(self.wh.read('geoip')))
+
+    def test(self):
+        with self.wh.open() as wh:
+            wh.write('geoip', {'ip': 5})
+            wh.write('geoip', {'ip': 6})
+
+        expected = [{'ip': 5, 'index': 'geoip'}, {'ip': 6, 'index': 'geoip'}]
+        actual = list(self.wh.read('geoip'))
+
+        self.assertEqual(expected, actual)